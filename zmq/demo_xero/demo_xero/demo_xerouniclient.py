@@ -3,7 +3,7 @@ import signal
 import argparse
 from zmq import Context
 from xero.uni.uniclientthread import UniClientThread
-from xero.xero_constants import INITIAL_CONNECTION_TIME_SECS
+from xero.xero_constants import INITIAL_CONNECTION_TIME_SECS, RPC_TIMEOUT_AUTO
 from xero.exceptions import LostRemoteError
 from demo_xero.setup_logging import configure_logging
 
@@ -17,6 +17,10 @@ keep_running = True
 # ./bin/demo_xerouniclient tcp://127.0.0.1:5550 cut_video --args '"table_cam.mp4", "./output/bleh.mp4", "00:00:00", "00:02:00"'
 
 
+def timeout_arg(value):
+    return value if value == RPC_TIMEOUT_AUTO else float(value)
+
+
 def main():
     global keep_running
 
@@ -28,7 +32,7 @@ def main():
     parser.add_argument('--args', metavar='args', type=str, required=False, help='arguments')
     parser.add_argument('--count', metavar='args', type=int, required=False, help='Number of times to repeat command, default is 1.  Set to -1 to call forever')
     parser.add_argument('--kwargs', metavar='kwargs', type=str, required=False, help='key-value arguments')
-    parser.add_argument('--timeout', metavar='timeout', type=float, required=False, default=1.0, help='request timeout in seconds, default 1.0')
+    parser.add_argument('--timeout', metavar='timeout', type=timeout_arg, required=False, default=1.0, help='request timeout in seconds, or "auto" to derive it from the observed service times, default 1.0')
     args = parser.parse_args()
     arguments = eval('[%s]'%args.args if args.args is not None else '[]')
     kwarguments = eval('{%s}'%args.kwargs if args.kwargs is not None else '{}')
@@ -7,11 +7,12 @@ import traceback
 import argparse
 from zmq import Context
 
-from xero.uni.uniworker import UniWorker
+from xero.uni.uniworker import UniWorker, rpc_method
 
 # include all modules from modules directory
 from demo_xero.setup_logging import configure_logging
-from demo_xero.worker_dispatcher import WorkerDispatcher, ping, compare, return_none
+from demo_xero.worker_dispatcher import WorkerDispatcher, ping, compare, return_none, DISPATCHER_POOL_SIZE, \
+    DISPATCH_LEAST_BUSY, DISPATCH_ROUND_ROBIN
 
 try:
     from typing import Any, Dict, List
@@ -23,37 +24,44 @@ logger = logging.getLogger(__name__)
 
 class TrivialUniWorker(UniWorker):
 
-    def __init__(self, endpoint, context):
+    def __init__(self, endpoint, context, pool_size=DISPATCHER_POOL_SIZE, dispatch=DISPATCH_LEAST_BUSY):
         super(TrivialUniWorker, self).__init__(endpoint, context)
-        self._dispatcher = WorkerDispatcher(self.send_reply)
+        self._dispatcher = WorkerDispatcher(self.bind_reply, pool_size, dispatch)
 
-        self._methods = {
-            'ping': ping,
-            'compare': compare,
-            'return_none': return_none,
-            'slow_succeed': self._dispatcher.work_time_succeed,
-            'slow_fail': self._dispatcher.work_time_fail
-        }
+    def shutdown(self):
+        # type: () -> None
+        super(TrivialUniWorker, self).shutdown()
+        self._dispatcher.shutdown()
 
     def on_log_event(self, event, message):
         print(message)
 
-    def do_work(self, name, args, kwargs):
-        # type: (str, List[Any], Dict[Any, Any]) -> None
+    def on_work_start(self, name):
+        # type: (str) -> None
+        self.send_reply('started', partial=True)
 
-        try:
-            if name in self._methods:
-                self.send_reply('started', partial=True)
-                result = self._methods[name](*args, **kwargs)
-                self.send_reply(result)
-            else:
-                print("called unknown method '{}'".format(name))
-                raise Exception('method {} not found'.format(name))
+    @rpc_method(name='ping')
+    def _ping(self):
+        return ping()
 
-        except Exception as e:
-            # Capture exceptions and send them back to the client
-            self.send_reply(e, exception=True)
+    @rpc_method(name='compare', cache=True)
+    def _compare(self, str1, str2):
+        return compare(str1, str2)
 
+    @rpc_method(name='return_none')
+    def _return_none(self):
+        return return_none()
+
+    @rpc_method(deferred=True)
+    def slow_succeed(self, work_time):
+        # type: (float) -> None
+        # The dispatcher's actor replies once it's done.
+        self._dispatcher.work_time_succeed(work_time)
+
+    @rpc_method(deferred=True)
+    def slow_fail(self, work_time):
+        # type: (float) -> None
+        self._dispatcher.work_time_fail(work_time)
 
 
 def main():
@@ -62,12 +70,16 @@ def main():
     parser = argparse.ArgumentParser(description='Worker')
     parser.add_argument('target', metavar='tcp://127.0.0.1:5550', type=str, help='target IP and port ex. tcp://127.0.0.1:5550')
     parser.add_argument('--groups', metavar='name', type=str, nargs='+', help='list of groups')
+    parser.add_argument('--pool-size', type=int, default=DISPATCHER_POOL_SIZE,
+                        help='number of actors working on slow calls')
+    parser.add_argument('--dispatch', choices=[DISPATCH_LEAST_BUSY, DISPATCH_ROUND_ROBIN], default=DISPATCH_LEAST_BUSY,
+                        help='how slow calls are spread over the actors')
     args = parser.parse_args()
 
     context = Context()
 
     print("starting worker connected to IP '{}'".format(args.target))
-    worker = TrivialUniWorker(args.target, context)
+    worker = TrivialUniWorker(args.target, context, args.pool_size, args.dispatch)
 
     # handle exit signals
     def handler(signum, frame):
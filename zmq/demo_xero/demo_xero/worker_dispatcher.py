@@ -1,7 +1,14 @@
+import functools
 import logging
+from threading import Lock
 from time import sleep
 import pykka
 
+try:
+    from typing import Callable, List, Optional
+except ImportError:
+    pass
+
 logger = logging.getLogger(__name__)
 
 
@@ -19,32 +26,90 @@ def return_none():
     return None
 
 
+#: How WorkerDispatcher picks the actor for the next call.
+DISPATCH_ROUND_ROBIN = 'round-robin'
+DISPATCH_LEAST_BUSY = 'least-busy'
+
+DISPATCHER_POOL_SIZE = 4
+
+
 class WorkerDispatcher(object):
     """
     This class acts as a wrapper to make it easy to get a work "actor" to service the actual call, this is
     a useful way to handle long running calls that might need to run in a non-blocking method.
+    Calls are spread over a fixed pool of actors, each working through the calls queued up in its mailbox one by one,
+    so a burst of calls gets as much parallelism as the pool has actors without starting a thread per call.
     """
 
-    def __init__(self, send_reply_cb):
-        self._send_reply_cb = send_reply_cb
+    def __init__(self, bind_reply_cb, pool_size=DISPATCHER_POOL_SIZE, dispatch=DISPATCH_LEAST_BUSY):
+        # type: (Callable[[], Callable[..., None]], int, str) -> None
+        """
+        :param bind_reply_cb: Returns a send_reply callable addressed to the request currently being serviced, so the
+            actor can reply once it's done.
+        :param pool_size: Number of actors, i.e. most calls worked on at once.
+        :param dispatch: DISPATCH_LEAST_BUSY hands each call to the actor with the fewest calls queued up,
+            DISPATCH_ROUND_ROBIN to each actor in turn.
+        """
+        if dispatch not in (DISPATCH_ROUND_ROBIN, DISPATCH_LEAST_BUSY):
+            raise ValueError("Unknown dispatch policy '{}'".format(dispatch))
+        if pool_size < 1:
+            raise ValueError("Pool size must be at least 1, got {}".format(pool_size))
+        self._bind_reply_cb = bind_reply_cb
+        self._dispatch = dispatch
+        self._lock = Lock()
+        # Calls queued up or being worked on, per actor.
+        self._busy = [0] * pool_size
+        self._next = 0
+        self._actors = [UniWorkerActor.start(functools.partial(self._on_done, index)).proxy()
+                        for index in range(pool_size)]
 
     def work_time_succeed(self, work_time):
         # type: (float) -> None
-        _dispatcher_actor = UniWorkerActor.start().proxy()
-        try:
-            _dispatcher_actor.work_time_succeed(work_time, self._send_reply_cb).get(timeout=0)
-        except pykka.Timeout:
-            # This means the actor hasn't finished yet.  Just eat the exception and move on.
-            pass
+        self._submit('work_time_succeed', work_time)
 
     def work_time_fail(self, work_time):
         # type: (float) -> None
-        _dispatcher_actor = UniWorkerActor.start().proxy()
-        try:
-            _dispatcher_actor.work_time_fail(work_time, self._send_reply_cb).get(timeout=0)
-        except pykka.Timeout:
-            # This means the actor hasn't finished yet.  Just eat the exception and move on.
-            pass
+        self._submit('work_time_fail', work_time)
+
+    def busy(self):
+        # type: () -> List[int]
+        """
+        Returns the number of calls queued up or being worked on, per actor.
+        """
+        with self._lock:
+            return list(self._busy)
+
+    def shutdown(self):
+        # type: () -> None
+        """
+        Stop the actors once they worked through the calls they already have.  Doesn't wait for them.
+        """
+        with self._lock:
+            actors = self._actors
+            self._actors = []
+        for actor in actors:
+            actor.actor_ref.stop(block=False)
+
+    def _submit(self, method, work_time):
+        # type: (str, float) -> None
+        reply = self._bind_reply_cb()
+        with self._lock:
+            if not self._actors:
+                raise RuntimeError("The dispatcher has shut down")
+            if self._dispatch == DISPATCH_ROUND_ROBIN:
+                index = self._next
+                self._next = (index + 1) % len(self._actors)
+            else:
+                index = min(range(len(self._actors)), key=self._busy.__getitem__)
+            self._busy[index] += 1
+            actor = self._actors[index]
+        # Doesn't wait for the actor, it replies by itself.
+        getattr(actor, method)(work_time, reply)
+
+    def _on_done(self, index):
+        # type: (int) -> None
+        with self._lock:
+            self._busy[index] -= 1
 
 
 class UniWorkerActor(pykka.ThreadingActor):
@@ -52,13 +117,25 @@ class UniWorkerActor(pykka.ThreadingActor):
     Threading Actor class that is meant to simulate long-running actions.
     """
 
-    def __init__(self):
+    def __init__(self, on_done=None):
+        # type: (Optional[Callable[[], None]]) -> None
         super(UniWorkerActor, self).__init__()
+        self._on_done = on_done
 
     def work_time_succeed(self, sleep_time, reply_future):
-        sleep(sleep_time)
-        reply_future(True)
+        try:
+            sleep(sleep_time)
+            reply_future(True)
+        finally:
+            self._done()
 
     def work_time_fail(self, sleep_time, reply_future):
-        sleep(sleep_time)
-        reply_future(False)
+        try:
+            sleep(sleep_time)
+            reply_future(False)
+        finally:
+            self._done()
+
+    def _done(self):
+        if self._on_done is not None:
+            self._on_done()
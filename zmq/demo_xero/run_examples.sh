@@ -25,3 +25,7 @@ set -o pipefail
 ./bin/demo_xerouniclient tcp://127.0.0.1:5550 slow_fail --args 5 --timeout 20
 
 
+
+# Repeated calls with an automatic timeout: the first ones wait RPC_TIMEOUT, later ones a deadline derived from the
+# observed service times of compare and the round trip time to the worker.
+./bin/demo_xerouniclient tcp://127.0.0.1:5550 compare --args '"apple", "orange"' --count 100 --timeout auto
@@ -0,0 +1,71 @@
+import time
+import unittest
+from threading import Event
+
+from demo_xero.worker_dispatcher import WorkerDispatcher, DISPATCH_LEAST_BUSY, DISPATCH_ROUND_ROBIN
+
+
+class TestWorkerDispatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.replies = []
+        self.all_replied = Event()
+        self.expected = 0
+
+    @staticmethod
+    def wait_for_busy(dispatcher, expected, timeout=2.0):
+        end = time.monotonic() + timeout
+        while dispatcher.busy() != expected and time.monotonic() < end:
+            time.sleep(0.01)
+        assert dispatcher.busy() == expected
+
+    def bind_reply(self):
+        def reply(msg):
+            self.replies.append(msg)
+            if len(self.replies) == self.expected:
+                self.all_replied.set()
+        return reply
+
+    def test_round_robin(self):
+        dispatcher = WorkerDispatcher(self.bind_reply, 2, DISPATCH_ROUND_ROBIN)
+        try:
+            self.expected = 4
+            for _ in range(4):
+                dispatcher.work_time_succeed(0.2)
+            assert dispatcher.busy() == [2, 2]
+            assert self.all_replied.wait(2.0)
+            assert self.replies == [True] * 4
+            # The last reply may go out before its actor counts the call as done.
+            self.wait_for_busy(dispatcher, [0, 0])
+        finally:
+            dispatcher.shutdown()
+
+    def test_least_busy(self):
+        dispatcher = WorkerDispatcher(self.bind_reply, 2, DISPATCH_LEAST_BUSY)
+        try:
+            self.expected = 3
+            dispatcher.work_time_fail(0.5)
+            dispatcher.work_time_succeed(0.05)
+            self.wait_for_busy(dispatcher, [1, 0])
+            # The slow call keeps its actor busy, round robin would have queued this one up behind it.
+            dispatcher.work_time_succeed(0.05)
+            assert dispatcher.busy() == [1, 1]
+            assert self.all_replied.wait(2.0)
+            assert self.replies == [True, True, False]
+        finally:
+            dispatcher.shutdown()
+
+    def test_pool_is_bounded(self):
+        dispatcher = WorkerDispatcher(self.bind_reply, 2)
+        try:
+            self.expected = 4
+            start = time.monotonic()
+            for _ in range(4):
+                dispatcher.work_time_succeed(0.2)
+            assert self.all_replied.wait(2.0)
+            # Two actors, so the four calls take two rounds.
+            assert time.monotonic() - start >= 0.4
+        finally:
+            dispatcher.shutdown()
+        with self.assertRaises(RuntimeError):
+            dispatcher.work_time_succeed(0.1)
@@ -0,0 +1,62 @@
+import asyncio
+import logging
+import unittest
+from zmq import Context
+
+from xero.uni.asyncuniclient import AsyncUniClient
+from xero.uni.asyncuniworker import AsyncUniWorker
+from xero.xero_constants import INITIAL_CONNECTION_TIME_SECS
+
+logger = logging.getLogger(__name__)
+
+
+class QuietAsyncUniClient(AsyncUniClient):
+
+    def on_partial_message(self, msg):
+        logger.debug("partial msg: {}".format(repr(msg)))
+
+    def on_message(self, msg):
+        logger.debug("final msg: {}".format(repr(msg)))
+
+    def on_timeout(self):
+        pass
+
+
+class SleepyAsyncUniWorker(AsyncUniWorker):
+    """
+    Worker whose only method takes its time, to show requests being worked on concurrently.
+    """
+
+    async def do_work(self, name, args, kwargs):
+        if name == 'nap':
+            await asyncio.sleep(args[0])
+            self.send_reply(args[1])
+        else:
+            self.send_reply(Exception('method {} not found'.format(name)), exception=True)
+
+
+class TestAsyncUni(unittest.TestCase):
+
+    TEST_ZMQ_ENDPOINT = "tcp://127.0.0.1:5556"
+    CALL_COUNT = 50
+
+    @classmethod
+    def test_async_rpc_runs_concurrently(cls):
+        # type: () -> None
+
+        async def scenario():
+            context = Context()
+            async with QuietAsyncUniClient(cls.TEST_ZMQ_ENDPOINT, context, max_in_flight=cls.CALL_COUNT) as client, \
+                    SleepyAsyncUniWorker(cls.TEST_ZMQ_ENDPOINT, context) as worker:
+                await client.wait_for_worker(INITIAL_CONNECTION_TIME_SECS)
+                start = asyncio.get_running_loop().time()
+                results = await asyncio.gather(*[client.rpc('nap', [0.2, i]) for i in range(cls.CALL_COUNT)])
+                elapsed = asyncio.get_running_loop().time() - start
+                assert results == list(range(cls.CALL_COUNT))
+                # All naps overlap on the worker's loop instead of running back to back.
+                assert elapsed < 1.0
+
+                worker.emit({'event': 1})
+                assert await client.get_sub_message(timeout=1.0) == {'event': 1}
+
+        asyncio.run(scenario())
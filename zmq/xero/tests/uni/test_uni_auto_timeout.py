@@ -0,0 +1,91 @@
+import logging
+import time
+import unittest
+import pytest
+from zmq import Context
+from tornado.ioloop import IOLoop
+
+from xero.clients.console_uniclient_thread import ConsoleUniClientThread
+from xero.clients.console_uniworker_thread import ConsoleUniWorkerThread
+from xero.exceptions import LostRemoteError
+from xero.uni.uniworker import rpc_method
+from xero.xero_constants import AUTO_TIMEOUT_MIN, AUTO_TIMEOUT_MIN_SAMPLES, HB_INTERVAL, INITIAL_CONNECTION_TIME_SECS, \
+    RPC_TIMEOUT, RPC_TIMEOUT_AUTO
+
+logger = logging.getLogger(__name__)
+
+
+class NappingUniWorkerThread(ConsoleUniWorkerThread):
+
+    def on_log_event(self, event, message):
+        pass
+
+    @staticmethod
+    @rpc_method
+    def nap(seconds):
+        time.sleep(seconds)
+        return seconds
+
+
+class TestUniAutoTimeout(unittest.TestCase):
+
+    TEST_ZMQ_ENDPOINT = "tcp://127.0.0.1:5556"
+
+    def setup_method(self, method):
+        # Clear the IOLoop between each test.
+        IOLoop.clear_current()
+
+    @classmethod
+    def test_rtt_from_heartbeats(cls):
+        # type: () -> None
+        context = Context()
+        uniclient_thread = ConsoleUniClientThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniclient_thread.start()
+        uniworker_thread = NappingUniWorkerThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniworker_thread.start()
+
+        try:
+            uniclient_thread.wait_for_worker(INITIAL_CONNECTION_TIME_SECS)
+            # A heartbeat goes out, and is echoed in the worker's next one.
+            time.sleep(3 * HB_INTERVAL / 1000.0)
+            rtts = list(uniclient_thread.worker_rtt().values())
+            assert len(rtts) == 1 and rtts[0] is not None and 0.0 <= rtts[0] < 0.1
+        finally:
+            uniworker_thread.join()
+            uniclient_thread.join()
+
+    @classmethod
+    def test_auto_timeout(cls):
+        # type: () -> None
+        context = Context()
+        uniclient_thread = ConsoleUniClientThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniclient_thread.start()
+        uniworker_thread = NappingUniWorkerThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniworker_thread.start()
+
+        try:
+            uniclient_thread.wait_for_worker(INITIAL_CONNECTION_TIME_SECS)
+            assert uniclient_thread.auto_timeout('nap') == RPC_TIMEOUT
+            for _ in range(AUTO_TIMEOUT_MIN_SAMPLES):
+                assert uniclient_thread.rpc('nap', [0.01], timeout=5.0) == 0.01
+            timeout = uniclient_thread.auto_timeout('nap')
+            assert AUTO_TIMEOUT_MIN <= timeout < 1.0
+            stats = uniclient_thread.latency_stats()['nap']
+            assert stats['calls'] == AUTO_TIMEOUT_MIN_SAMPLES and 0.01 <= stats['p50'] < 0.5
+
+            # A call that takes far longer than usual times out after the derived deadline, not RPC_TIMEOUT.  Only that
+            # call fails: the worker stays connected and the call queued behind it on the same worker goes through.
+            start = time.monotonic()
+            slow = uniclient_thread.rpc_nowait('nap', [0.5], timeout=RPC_TIMEOUT_AUTO)
+            other = uniclient_thread.rpc_nowait('nap', [0.01], timeout=5.0)
+            with pytest.raises(LostRemoteError):
+                slow.result()
+            assert time.monotonic() - start < 0.5
+            assert other.result() == 0.01
+            assert uniclient_thread.worker_count() == 1
+            # The timeout is recorded, so the deadline grows rather than cutting off every slower call from now on.
+            assert uniclient_thread.latency_stats()['nap']['calls'] == AUTO_TIMEOUT_MIN_SAMPLES + 2
+            assert uniclient_thread.rpc('nap', [0.01], timeout=5.0) == 0.01
+        finally:
+            uniworker_thread.join()
+            uniclient_thread.join()
@@ -0,0 +1,93 @@
+import logging
+import pytest
+import unittest
+from zmq import Context
+from tornado.ioloop import IOLoop
+
+from xero.clients.console_uniclient_thread import ConsoleUniClientThread
+from xero.clients.console_uniworker_thread import ConsoleUniWorkerThread
+from xero.exceptions import LostRemoteError
+from xero.util.xero_codecs import CODEC_MSGPACK, CODEC_PICKLE, CODEC_RAW
+from xero.xero_constants import INITIAL_CONNECTION_TIME_SECS
+
+logger = logging.getLogger(__name__)
+
+
+class Money(object):
+    """
+    A class neither MessagePack nor the type registry know about.
+    """
+
+    def __init__(self, cents):
+        self.cents = cents
+
+    def __add__(self, other):
+        return Money(self.cents + other.cents)
+
+
+class TestUniCodecs(unittest.TestCase):
+
+    TEST_ZMQ_ENDPOINT = "tcp://127.0.0.1:5556"
+
+    def setup_method(self, method):
+        # Clear the IOLoop between each test.
+        IOLoop.clear_current()
+
+    @classmethod
+    def test_method_codecs(cls):
+        # type: () -> None
+        context = Context()
+        uniclient_thread = ConsoleUniClientThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniclient_thread.start()
+        uniworker_thread = ConsoleUniWorkerThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniworker_thread.start()
+
+        try:
+            uniclient_thread.wait_for_worker(INITIAL_CONNECTION_TIME_SECS)
+            uniclient_thread.set_method_codec('add', CODEC_RAW)
+            assert uniclient_thread.rpc('add', [b'abc', b'def']) == b'abcdef'
+            uniclient_thread.set_method_codec('add', None)
+            assert uniclient_thread.rpc('add', [1, 2]) == 3
+
+            with pytest.raises(ValueError):
+                uniclient_thread.set_method_codec('add', CODEC_PICKLE)
+        finally:
+            uniworker_thread.join()
+            uniclient_thread.join()
+
+    @classmethod
+    def test_pickle_codec(cls):
+        # type: () -> None
+        codecs = (CODEC_PICKLE, CODEC_MSGPACK)
+        context = Context()
+        uniclient_thread = ConsoleUniClientThread(cls.TEST_ZMQ_ENDPOINT, context, codecs=codecs)
+        uniclient_thread.start()
+        uniworker_thread = ConsoleUniWorkerThread(cls.TEST_ZMQ_ENDPOINT, context, codecs=codecs)
+        uniworker_thread.start()
+
+        try:
+            uniclient_thread.wait_for_worker(INITIAL_CONNECTION_TIME_SECS)
+            assert uniclient_thread.rpc('add', [Money(150), Money(250)]).cents == 400
+            # Emits use the codec the client picked.
+            uniworker_thread.wait_for_client(INITIAL_CONNECTION_TIME_SECS)
+            uniworker_thread.emit(Money(5))
+            assert uniclient_thread.get_sub_message(timeout=1.0).cents == 5
+        finally:
+            uniworker_thread.join()
+            uniclient_thread.join()
+
+    @classmethod
+    def test_worker_without_codec_is_refused(cls):
+        # type: () -> None
+        context = Context()
+        uniclient_thread = ConsoleUniClientThread(cls.TEST_ZMQ_ENDPOINT, context, codecs=(CODEC_PICKLE,))
+        uniclient_thread.start()
+        uniworker_thread = ConsoleUniWorkerThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniworker_thread.start()
+
+        try:
+            with pytest.raises(LostRemoteError):
+                uniclient_thread.wait_for_worker(1.0)
+        finally:
+            uniworker_thread.join()
+            uniclient_thread.join()
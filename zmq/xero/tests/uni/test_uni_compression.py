@@ -0,0 +1,71 @@
+import logging
+import pytest
+import unittest
+from zmq import Context
+from tornado.ioloop import IOLoop
+
+from xero.clients.console_uniclient_thread import ConsoleUniClientThread
+from xero.clients.console_uniworker_thread import ConsoleUniWorkerThread
+from xero.exceptions import LostRemoteError
+from xero.util.xero_compression import COMPRESSOR_ZLIB, STATS_EMIT
+from xero.xero_constants import INITIAL_CONNECTION_TIME_SECS
+
+logger = logging.getLogger(__name__)
+
+
+class TestUniCompression(unittest.TestCase):
+
+    TEST_ZMQ_ENDPOINT = "tcp://127.0.0.1:5556"
+
+    def setup_method(self, method):
+        # Clear the IOLoop between each test.
+        IOLoop.clear_current()
+
+    @classmethod
+    def test_compression(cls):
+        # type: () -> None
+        context = Context()
+        uniclient_thread = ConsoleUniClientThread(cls.TEST_ZMQ_ENDPOINT, context, compression=COMPRESSOR_ZLIB,
+                                                  compression_threshold=1024)
+        uniclient_thread.start()
+        uniworker_thread = ConsoleUniWorkerThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniworker_thread.start()
+
+        try:
+            uniclient_thread.wait_for_worker(INITIAL_CONNECTION_TIME_SECS)
+            text = 'compressible ' * 10000
+            assert uniclient_thread.rpc('add', [text, text]) == text + text
+            assert uniclient_thread.rpc('add', [1, 2]) == 3
+
+            uniworker_thread.wait_for_client(INITIAL_CONNECTION_TIME_SECS)
+            uniworker_thread.emit({'text': text})
+            assert uniclient_thread.get_sub_message(timeout=1.0) == {'text': text}
+
+            client_stats = uniclient_thread.compression_stats()
+            assert client_stats['add']['messages'] == 2 and client_stats['add']['compressed'] == 1
+            assert client_stats['add']['ratio'] > 10
+            assert client_stats['add']['decompressed'] == 1
+            assert client_stats[STATS_EMIT]['decompressed'] == 1
+
+            worker_stats = uniworker_thread.compression_stats()
+            assert worker_stats['add']['compressed'] == 1 and worker_stats['add']['decompressed'] == 1
+            assert worker_stats[STATS_EMIT]['compressed'] == 1
+        finally:
+            uniworker_thread.join()
+            uniclient_thread.join()
+
+    @classmethod
+    def test_worker_without_compressor_is_refused(cls):
+        # type: () -> None
+        context = Context()
+        uniclient_thread = ConsoleUniClientThread(cls.TEST_ZMQ_ENDPOINT, context, compression=COMPRESSOR_ZLIB)
+        uniclient_thread.start()
+        uniworker_thread = ConsoleUniWorkerThread(cls.TEST_ZMQ_ENDPOINT, context, compressors=())
+        uniworker_thread.start()
+
+        try:
+            with pytest.raises(LostRemoteError):
+                uniclient_thread.wait_for_worker(1.0)
+        finally:
+            uniworker_thread.join()
+            uniclient_thread.join()
@@ -0,0 +1,52 @@
+import logging
+import unittest
+from zmq import Context
+from tornado.ioloop import IOLoop
+
+from xero.clients.console_uniclient_thread import ConsoleUniClientThread
+from xero.clients.console_uniworker_thread import ConsoleUniWorkerThread
+from xero.xero_constants import INITIAL_CONNECTION_TIME_SECS
+
+logger = logging.getLogger(__name__)
+
+
+class TestUniEmitBatch(unittest.TestCase):
+
+    TEST_ZMQ_ENDPOINT = "tcp://127.0.0.1:5556"
+
+    def setup_method(self, method):
+        # Clear the IOLoop between each test.
+        IOLoop.clear_current()
+
+    @classmethod
+    def test_emit_batching(cls):
+        # type: () -> None
+        context = Context()
+        uniclient_thread = ConsoleUniClientThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniclient_thread.start()
+        uniworker_thread = ConsoleUniWorkerThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniworker_thread.start()
+
+        try:
+            uniclient_thread.wait_for_worker(INITIAL_CONNECTION_TIME_SECS)
+            uniworker_thread.wait_for_client(INITIAL_CONNECTION_TIME_SECS)
+            uniworker_thread.set_emit_batching(100, 0.05)
+
+            # Full batches go out right away, the remainder once it waited long enough.
+            for i in range(1050):
+                uniworker_thread.emit({'index': i})
+            received = []
+            while len(received) < 1050:
+                received.append(uniclient_thread.get_sub_message(timeout=1.0))
+            assert [msg['index'] for msg in received] == list(range(1050))
+
+            # Turning batching off sends out what is still waiting.
+            uniworker_thread.set_emit_batching(100, 60.0)
+            uniworker_thread.emit('waiting')
+            uniworker_thread.set_emit_batching(1)
+            assert uniclient_thread.get_sub_message(timeout=1.0) == 'waiting'
+            uniworker_thread.emit('unbatched')
+            assert uniclient_thread.get_sub_message(timeout=1.0) == 'unbatched'
+        finally:
+            uniworker_thread.join()
+            uniclient_thread.join()
@@ -0,0 +1,106 @@
+import logging
+import time
+import pytest
+import unittest
+from threading import Thread
+from zmq import Context
+from tornado.ioloop import IOLoop
+
+from xero.clients.console_uniclient_thread import ConsoleUniClientThread
+from xero.clients.console_uniworker_thread import ConsoleUniWorkerThread
+from xero.exceptions import BackpressureError
+from xero.uni.uniworker import BACKPRESSURE_BLOCK, BACKPRESSURE_BUFFER, BACKPRESSURE_RAISE
+from xero.util.xero_sub_queue import OVERFLOW_DROP_OLDEST
+from xero.xero_constants import INITIAL_CONNECTION_TIME_SECS
+
+logger = logging.getLogger(__name__)
+
+
+def receive(uniclient_thread, count):
+    received = []
+    while len(received) < count:
+        received.extend(uniclient_thread.get_sub_messages(timeout=0.5))
+    return received
+
+
+class TestUniEmitFlowControl(unittest.TestCase):
+
+    TEST_ZMQ_ENDPOINT = "tcp://127.0.0.1:5556"
+
+    def setup_method(self, method):
+        # Clear the IOLoop between each test.
+        IOLoop.clear_current()
+
+    @classmethod
+    def test_emit_credits(cls):
+        # type: () -> None
+        context = Context()
+        uniclient_thread = ConsoleUniClientThread(cls.TEST_ZMQ_ENDPOINT, context, emit_credits=4)
+        uniclient_thread.start()
+        uniworker_thread = ConsoleUniWorkerThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniworker_thread.start()
+
+        try:
+            uniclient_thread.wait_for_worker(INITIAL_CONNECTION_TIME_SECS)
+            uniworker_thread.wait_for_client(INITIAL_CONNECTION_TIME_SECS)
+
+            # Four emits use up the credit, two more are held back, then the worker pushes back.
+            uniworker_thread.set_emit_backpressure(BACKPRESSURE_BUFFER, buffer_size=2)
+            for i in range(6):
+                uniworker_thread.emit(i)
+            with pytest.raises(BackpressureError):
+                uniworker_thread.emit(6)
+            # Taking them grants new credit, so the held back ones follow.
+            assert receive(uniclient_thread, 6) == list(range(6))
+            # Let the last credit reach the worker.
+            time.sleep(0.2)
+
+            uniworker_thread.set_emit_backpressure(BACKPRESSURE_RAISE)
+            for i in range(4):
+                uniworker_thread.emit(i)
+            with pytest.raises(BackpressureError):
+                uniworker_thread.emit(4)
+            assert receive(uniclient_thread, 4) == list(range(4))
+            time.sleep(0.2)
+
+            # Blocking emits go on once the application takes enough messages.
+            uniworker_thread.set_emit_backpressure(BACKPRESSURE_BLOCK, timeout=0.2)
+            for i in range(4):
+                uniworker_thread.emit(i)
+            with pytest.raises(BackpressureError):
+                uniworker_thread.emit(4)
+            uniworker_thread.set_emit_backpressure(BACKPRESSURE_BLOCK, timeout=5.0)
+            consumer = Thread(target=lambda: (time.sleep(0.2), receive(uniclient_thread, 4)))
+            consumer.start()
+            uniworker_thread.emit('unblocked')
+            consumer.join()
+            assert uniclient_thread.get_sub_message(timeout=1.0) == 'unblocked'
+        finally:
+            uniworker_thread.join()
+            uniclient_thread.join()
+
+    @classmethod
+    def test_dropped_emits_return_credit(cls):
+        # type: () -> None
+        context = Context()
+        uniclient_thread = ConsoleUniClientThread(cls.TEST_ZMQ_ENDPOINT, context, emit_credits=4, emit_queue_size=2,
+                                                  emit_overflow=OVERFLOW_DROP_OLDEST)
+        uniclient_thread.start()
+        uniworker_thread = ConsoleUniWorkerThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniworker_thread.start()
+
+        try:
+            uniclient_thread.wait_for_worker(INITIAL_CONNECTION_TIME_SECS)
+            uniworker_thread.wait_for_client(INITIAL_CONNECTION_TIME_SECS)
+
+            # Nobody takes the emits, yet the worker never runs dry: the ones dropped hand their credit back.
+            uniworker_thread.set_emit_backpressure(BACKPRESSURE_BLOCK, timeout=5.0)
+            for i in range(20):
+                uniworker_thread.emit(i)
+            time.sleep(0.2)
+            assert uniclient_thread.get_sub_messages(timeout=1.0) == [18, 19]
+            stats = uniclient_thread.emit_queue_stats()
+            assert stats['dropped'] == 18 and stats['high_water'] == 2
+        finally:
+            uniworker_thread.join()
+            uniclient_thread.join()
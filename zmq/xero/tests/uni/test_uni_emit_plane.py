@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import time
+import unittest
+import pytest
+from zmq import Context
+from tornado.ioloop import IOLoop
+
+from xero.clients.console_uniclient_thread import ConsoleUniClientThread
+from xero.clients.console_uniworker_thread import ConsoleUniWorkerThread
+from xero.uni.asyncuniclient import AsyncUniClient
+from xero.uni.asyncuniworker import AsyncUniWorker
+from xero.xero_constants import INITIAL_CONNECTION_TIME_SECS
+
+logger = logging.getLogger(__name__)
+
+
+class QuietAsyncUniClient(AsyncUniClient):
+
+    def on_partial_message(self, msg):
+        pass
+
+    def on_message(self, msg):
+        pass
+
+    def on_timeout(self):
+        pass
+
+
+class EchoAsyncUniWorker(AsyncUniWorker):
+
+    def do_work(self, name, args, kwargs):
+        self.send_reply(args[0])
+
+
+class TestUniEmitPlane(unittest.TestCase):
+
+    TEST_ZMQ_ENDPOINT = "tcp://127.0.0.1:5556"
+    TEST_EMIT_ENDPOINT = "tcp://*:5557"
+    EMIT_COUNT = 1000
+
+    def setup_method(self, method):
+        # Clear the IOLoop between each test.
+        IOLoop.clear_current()
+
+    @staticmethod
+    def wait_for_emit_plane(uniworker, timeout=INITIAL_CONNECTION_TIME_SECS):
+        deadline = time.time() + timeout
+        while not uniworker._emit_plane_up:
+            assert time.time() < deadline, "Emit data plane didn't come up"
+            time.sleep(0.01)
+
+    @classmethod
+    def test_emits_on_data_plane(cls):
+        # type: () -> None
+        context = Context()
+        uniclient_thread = ConsoleUniClientThread(cls.TEST_ZMQ_ENDPOINT, context, emit_endpoint=cls.TEST_EMIT_ENDPOINT,
+                                                  emit_credits=100)
+        uniclient_thread.start()
+        uniworker_thread = ConsoleUniWorkerThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniworker_thread.start()
+
+        try:
+            uniclient_thread.wait_for_worker(INITIAL_CONNECTION_TIME_SECS)
+            uniworker_thread.wait_for_client(INITIAL_CONNECTION_TIME_SECS)
+            cls.wait_for_emit_plane(uniworker_thread)
+
+            received = []
+            for i in range(cls.EMIT_COUNT):
+                uniworker_thread.emit(i)
+                # Replies don't wait behind the emits.
+                if i % 100 == 0:
+                    assert uniclient_thread.rpc('add', [i, 1]) == i + 1
+                    received.extend(uniclient_thread.get_sub_messages(timeout=0))
+            while len(received) < cls.EMIT_COUNT:
+                received.append(uniclient_thread.get_sub_message(timeout=1.0))
+            assert received == list(range(cls.EMIT_COUNT))
+        finally:
+            uniworker_thread.join()
+            uniclient_thread.join()
+
+    @classmethod
+    def test_conflated_emits(cls):
+        # type: () -> None
+        context = Context()
+        uniclient_thread = ConsoleUniClientThread(cls.TEST_ZMQ_ENDPOINT, context, emit_endpoint=cls.TEST_EMIT_ENDPOINT,
+                                                  emit_conflate=True)
+        uniclient_thread.start()
+        uniworker_thread = ConsoleUniWorkerThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniworker_thread.start()
+
+        try:
+            uniclient_thread.wait_for_worker(INITIAL_CONNECTION_TIME_SECS)
+            uniworker_thread.wait_for_client(INITIAL_CONNECTION_TIME_SECS)
+            cls.wait_for_emit_plane(uniworker_thread)
+
+            for i in range(cls.EMIT_COUNT):
+                uniworker_thread.emit({'state': i})
+            # Whatever got conflated away, the latest state always arrives.
+            received = []
+            start = time.monotonic()
+            while (not received or received[-1] != {'state': cls.EMIT_COUNT - 1}) and \
+                    time.monotonic() - start < INITIAL_CONNECTION_TIME_SECS:
+                received += uniclient_thread.get_sub_messages(timeout=0.1)
+            assert 0 < len(received) <= cls.EMIT_COUNT
+            assert received[-1] == {'state': cls.EMIT_COUNT - 1}
+        finally:
+            uniworker_thread.join()
+            uniclient_thread.join()
+
+    @classmethod
+    def test_conflate_needs_no_flow_control(cls):
+        # type: () -> None
+        with pytest.raises(ValueError):
+            ConsoleUniClientThread(cls.TEST_ZMQ_ENDPOINT, Context(), emit_credits=10, emit_conflate=True,
+                                   emit_endpoint=cls.TEST_EMIT_ENDPOINT)
+
+    @classmethod
+    def test_async_emits_on_data_plane(cls):
+        # type: () -> None
+
+        async def scenario():
+            context = Context()
+            async with QuietAsyncUniClient(cls.TEST_ZMQ_ENDPOINT, context,
+                                           emit_endpoint=cls.TEST_EMIT_ENDPOINT) as client, \
+                    EchoAsyncUniWorker(cls.TEST_ZMQ_ENDPOINT, context) as worker:
+                await client.wait_for_worker(INITIAL_CONNECTION_TIME_SECS)
+                while not worker._emit_plane_up:
+                    await asyncio.sleep(0.01)
+                for i in range(10):
+                    worker.emit(i)
+                assert await client.rpc('echo', ['x']) == 'x'
+                received = []
+                while len(received) < 10:
+                    received.append(await client.get_sub_message(timeout=1.0))
+                assert received == list(range(10))
+
+        asyncio.run(scenario())
@@ -0,0 +1,134 @@
+import logging
+import time
+import unittest
+from queue import Empty
+import pytest
+from zmq import Context
+from tornado.ioloop import IOLoop
+
+from xero.clients.console_uniclient_thread import ConsoleUniClientThread
+from xero.clients.console_uniworker_thread import ConsoleUniWorkerThread
+from xero.xero_constants import INITIAL_CONNECTION_TIME_SECS
+
+logger = logging.getLogger(__name__)
+
+
+class TestUniEmitSubscriptions(unittest.TestCase):
+
+    TEST_ZMQ_ENDPOINT = "tcp://127.0.0.1:5556"
+
+    def setup_method(self, method):
+        # Clear the IOLoop between each test.
+        IOLoop.clear_current()
+
+    @staticmethod
+    def emit_all(uniworker_thread):
+        uniworker_thread.emit('untopiced')
+        uniworker_thread.emit('cpu', topic='telemetry.cpu')
+        uniworker_thread.emit('disk', topic='telemetry.disk')
+        uniworker_thread.emit('alarm', topic='alarm')
+        uniworker_thread.emit('end', topic='end')
+
+    @staticmethod
+    def receive_until_end(uniclient_thread):
+        received = []
+        while not received or received[-1] != 'end':
+            received.append(uniclient_thread.get_sub_message(timeout=1.0))
+        return received[:-1]
+
+    @classmethod
+    def test_subscriptions(cls):
+        # type: () -> None
+        context = Context()
+        uniclient_thread = ConsoleUniClientThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniclient_thread.start()
+        uniworker_thread = ConsoleUniWorkerThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniworker_thread.start()
+
+        try:
+            uniclient_thread.wait_for_worker(INITIAL_CONNECTION_TIME_SECS)
+            uniworker_thread.wait_for_client(INITIAL_CONNECTION_TIME_SECS)
+
+            # Without subscriptions everything comes through.
+            cls.emit_all(uniworker_thread)
+            assert cls.receive_until_end(uniclient_thread) == ['untopiced', 'cpu', 'disk', 'alarm']
+
+            uniclient_thread.subscribe('telemetry.c')
+            uniclient_thread.subscribe('end')
+            # Let the subscriptions reach the worker.
+            time.sleep(0.2)
+            cls.emit_all(uniworker_thread)
+            assert cls.receive_until_end(uniclient_thread) == ['cpu']
+
+            uniclient_thread.subscribe('')
+            uniclient_thread.unsubscribe('telemetry.c')
+            time.sleep(0.2)
+            cls.emit_all(uniworker_thread)
+            assert cls.receive_until_end(uniclient_thread) == ['untopiced', 'cpu', 'disk', 'alarm']
+
+            uniclient_thread.unsubscribe('')
+            uniclient_thread.unsubscribe('end')
+            time.sleep(0.2)
+            cls.emit_all(uniworker_thread)
+            with pytest.raises(Empty):
+                uniclient_thread.get_sub_message(timeout=0.5)
+        finally:
+            uniworker_thread.join()
+            uniclient_thread.join()
+
+    @classmethod
+    def test_subscriptions_sent_on_connect(cls):
+        # type: () -> None
+        context = Context()
+        uniclient_thread = ConsoleUniClientThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniclient_thread.start()
+        uniclient_thread.subscribe('end')
+        uniworker_thread = ConsoleUniWorkerThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniworker_thread.start()
+
+        try:
+            uniclient_thread.wait_for_worker(INITIAL_CONNECTION_TIME_SECS)
+            uniworker_thread.wait_for_client(INITIAL_CONNECTION_TIME_SECS)
+            cls.emit_all(uniworker_thread)
+            assert cls.receive_until_end(uniclient_thread) == []
+        finally:
+            uniworker_thread.join()
+            uniclient_thread.join()
+
+    @classmethod
+    def test_topics_are_received(cls):
+        # type: () -> None
+        context = Context()
+        uniclient_thread = ConsoleUniClientThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniclient_thread.start()
+        uniworker_thread = ConsoleUniWorkerThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniworker_thread.start()
+
+        try:
+            uniclient_thread.wait_for_worker(INITIAL_CONNECTION_TIME_SECS)
+            uniworker_thread.wait_for_client(INITIAL_CONNECTION_TIME_SECS)
+            expected = [(None, 'untopiced'), ('telemetry.cpu', 'cpu'), ('telemetry.disk', 'disk'), ('alarm', 'alarm'),
+                        ('end', 'end')]
+
+            cls.emit_all(uniworker_thread)
+            assert [uniclient_thread.get_sub_message(timeout=1.0, with_topic=True) for _ in expected] == expected
+
+            # Coalesced emits keep their own topics.
+            uniworker_thread.set_emit_batching(len(expected))
+            cls.emit_all(uniworker_thread)
+            received = []
+            while len(received) < len(expected):
+                received.extend(uniclient_thread.get_sub_messages(timeout=1.0, with_topic=True))
+            assert received == expected
+            uniworker_thread.set_emit_batching(1)
+
+            # Emits sent before the worker learned of the subscriptions are dropped on arrival.
+            uniclient_thread.subscribe('telemetry.')
+            uniclient_thread.subscribe('end')
+            time.sleep(0.2)
+            uniworker_thread._set_subscriptions(None)
+            cls.emit_all(uniworker_thread)
+            assert cls.receive_until_end(uniclient_thread) == ['cpu', 'disk']
+        finally:
+            uniworker_thread.join()
+            uniclient_thread.join()
@@ -0,0 +1,216 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+import unittest
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from threading import Thread, get_ident
+from zmq import Context
+from tornado.ioloop import IOLoop
+
+from xero.clients.console_uniclient_thread import ConsoleUniClientThread
+from xero.clients.console_uniworker_thread import ConsoleUniWorkerThread
+from xero.uni.asyncuniclient import AsyncUniClient
+from xero.uni.asyncuniworker import AsyncUniWorker
+from xero.uni.uniworker import UniWorker, rpc_method
+from xero.xero_constants import HB_INTERVAL, HB_LIVENESS, INITIAL_CONNECTION_TIME_SECS, WORKER_FINAL_REPLY
+
+logger = logging.getLogger(__name__)
+
+#: Longer than the client waits for a heartbeat before dropping a worker.
+LONG_JOB_SECS = HB_INTERVAL * HB_LIVENESS / 1000.0 + 0.5
+
+
+class NappingUniWorkerThread(ConsoleUniWorkerThread):
+
+    def __init__(self, endpoint, context=None, executor=None):
+        super(NappingUniWorkerThread, self).__init__(endpoint, context, executor=executor)
+        self.notes = []
+
+    def on_log_event(self, event, message):
+        pass
+
+    @rpc_method
+    def note(self, seconds, value):
+        time.sleep(seconds)
+        self.notes.append(value)
+        return value
+
+    @staticmethod
+    @rpc_method
+    def nap(seconds):
+        time.sleep(seconds)
+        return True
+
+    @staticmethod
+    @rpc_method
+    def pid():
+        return os.getpid()
+
+
+class SendRecordingUniWorkerThread(NappingUniWorkerThread):
+
+    def __init__(self, endpoint, context=None, executor=None):
+        # Threads final replies were sent on.
+        self.reply_threads = set()
+        super(SendRecordingUniWorkerThread, self).__init__(endpoint, context, executor=executor)
+
+    def _create_stream(self):
+        super(SendRecordingUniWorkerThread, self)._create_stream()
+        send_multipart = self._stream.send_multipart
+
+        def recording_send_multipart(msg, *args, **kwargs):
+            if msg[0] == WORKER_FINAL_REPLY:
+                self.reply_threads.add(get_ident())
+            return send_multipart(msg, *args, **kwargs)
+        self._stream.send_multipart = recording_send_multipart
+
+
+class QuietAsyncUniClient(AsyncUniClient):
+
+    def on_partial_message(self, msg):
+        pass
+
+    def on_message(self, msg):
+        pass
+
+    def on_timeout(self):
+        pass
+
+
+class NappingAsyncUniWorker(AsyncUniWorker):
+
+    def __init__(self, endpoint, context=None, executor=None):
+        super(NappingAsyncUniWorker, self).__init__(endpoint, context, executor=executor)
+        self.notes = []
+
+    @rpc_method
+    def note(self, seconds, value):
+        time.sleep(seconds)
+        self.notes.append(value)
+        return value
+
+    @rpc_method
+    def nap(self, seconds):
+        time.sleep(seconds)
+        return True
+
+    @rpc_method
+    async def double(self, value):
+        await asyncio.sleep(0)
+        return value * 2
+
+
+class TestUniExecutor(unittest.TestCase):
+
+    TEST_ZMQ_ENDPOINT = "tcp://127.0.0.1:5556"
+    JOB_COUNT = 3
+
+    def setup_method(self, method):
+        # Clear the IOLoop between each test.
+        IOLoop.clear_current()
+
+    @classmethod
+    def test_thread_pool(cls):
+        # type: () -> None
+        context = Context()
+        executor = ThreadPoolExecutor(cls.JOB_COUNT)
+        uniclient_thread = ConsoleUniClientThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniclient_thread.start()
+        uniworker_thread = NappingUniWorkerThread(cls.TEST_ZMQ_ENDPOINT, context, executor=executor)
+        uniworker_thread.start()
+
+        try:
+            uniclient_thread.wait_for_worker(INITIAL_CONNECTION_TIME_SECS)
+            # Heartbeats go on while the job runs, so the client keeps the worker.
+            assert uniclient_thread.rpc('nap', [LONG_JOB_SECS]) is True
+            assert uniclient_thread.worker_count() == 1
+
+            # A single worker works on several jobs at once.
+            start = time.monotonic()
+            futures = [uniclient_thread.rpc_nowait('nap', [0.5]) for _ in range(cls.JOB_COUNT)]
+            assert [future.result(5.0) for future in futures] == [True] * cls.JOB_COUNT
+            assert time.monotonic() - start < 0.5 * cls.JOB_COUNT
+
+            # Streams and batches reply from the executor's threads too.
+            assert list(uniclient_thread.rpc_stream('count_to', [100])) == list(range(100))
+            assert uniclient_thread.rpc_batch([('add', [1, 2]), ('nap', [0.1])]) == [3, True]
+            # The calls of a batch run in order, though the pool could run them at once.
+            assert uniclient_thread.rpc_batch([('note', [0.2, 'a']), ('note', [0, 'b'])]) == ['a', 'b']
+            assert uniworker_thread.notes == ['a', 'b']
+        finally:
+            uniworker_thread.join()
+            uniclient_thread.join()
+            executor.shutdown()
+
+    @classmethod
+    def test_loop_started_elsewhere(cls):
+        # type: () -> None
+        context = Context()
+        executor = ThreadPoolExecutor(cls.JOB_COUNT)
+        uniclient_thread = ConsoleUniClientThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniclient_thread.start()
+        uniworker = SendRecordingUniWorkerThread(cls.TEST_ZMQ_ENDPOINT, context, executor=executor)
+        # The IOLoop is started directly rather than by run().
+        loop_thread = Thread(target=uniworker._stream.io_loop.start)
+        loop_thread.start()
+
+        try:
+            uniclient_thread.wait_for_worker(INITIAL_CONNECTION_TIME_SECS)
+            futures = [uniclient_thread.rpc_nowait('nap', [0.1]) for _ in range(cls.JOB_COUNT)]
+            assert [future.result(5.0) for future in futures] == [True] * cls.JOB_COUNT
+            # Replies from the executor's threads were all handed over to the IOLoop's thread.
+            assert uniworker.reply_threads == {loop_thread.ident}
+        finally:
+            UniWorker.stop(uniworker)
+            UniWorker.shutdown(uniworker)
+            loop_thread.join()
+            uniclient_thread.join()
+            executor.shutdown()
+
+    @classmethod
+    def test_process_pool(cls):
+        # type: () -> None
+        context = Context()
+        executor = ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn'))
+        uniclient_thread = ConsoleUniClientThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniclient_thread.start()
+        uniworker_thread = NappingUniWorkerThread(cls.TEST_ZMQ_ENDPOINT, context, executor=executor)
+        uniworker_thread.start()
+
+        try:
+            uniclient_thread.wait_for_worker(INITIAL_CONNECTION_TIME_SECS)
+            assert uniclient_thread.rpc('pid') != os.getpid()
+            assert uniclient_thread.rpc('add', [1, 2]) == 3
+            # Exceptions come back from the process as well.
+            assert uniclient_thread.rpc_batch([('add', [1, None])])[0]['class'] == 'TypeError'
+            # Streaming methods stay in the worker's process.
+            assert list(uniclient_thread.rpc_stream('count_to', [3])) == [0, 1, 2]
+        finally:
+            uniworker_thread.join()
+            uniclient_thread.join()
+            executor.shutdown()
+
+    @classmethod
+    def test_async_thread_pool(cls):
+        # type: () -> None
+
+        async def scenario():
+            context = Context()
+            with ThreadPoolExecutor(cls.JOB_COUNT) as executor:
+                async with QuietAsyncUniClient(cls.TEST_ZMQ_ENDPOINT, context) as client, \
+                        NappingAsyncUniWorker(cls.TEST_ZMQ_ENDPOINT, context, executor=executor) as worker:
+                    await client.wait_for_worker(INITIAL_CONNECTION_TIME_SECS)
+                    start = time.monotonic()
+                    naps = await asyncio.gather(*[client.rpc('nap', [0.5]) for _ in range(cls.JOB_COUNT)])
+                    assert naps == [True] * cls.JOB_COUNT
+                    assert time.monotonic() - start < 0.5 * cls.JOB_COUNT
+                    # Coroutine methods are still awaited on the event loop.
+                    assert await client.rpc('double', [21]) == 42
+                    # The calls of a batch run in order, coroutine methods included.
+                    calls = [('note', [0.2, 'a']), ('double', [2]), ('note', [0, 'b'])]
+                    assert await client.rpc_batch(calls) == ['a', 4, 'b']
+                    assert worker.notes == ['a', 'b']
+
+        asyncio.run(scenario())
@@ -0,0 +1,72 @@
+import functools
+import logging
+import time
+import unittest
+from zmq import Context
+from tornado.ioloop import IOLoop
+
+from xero.clients.console_uniclient_thread import ConsoleUniClientThread
+from xero.clients.console_uniworker_thread import ConsoleUniWorkerThread
+from xero.util.xero_failure_detector import LivenessFailureDetector
+from xero.xero_constants import HB_INTERVAL, INITIAL_CONNECTION_TIME_SECS
+
+logger = logging.getLogger(__name__)
+
+
+class TestUniFailureDetector(unittest.TestCase):
+
+    TEST_ZMQ_ENDPOINT = "tcp://127.0.0.1:5556"
+
+    def setup_method(self, method):
+        # Clear the IOLoop between each test.
+        IOLoop.clear_current()
+
+    @classmethod
+    def test_stalled_worker_is_dropped(cls):
+        # type: () -> None
+        context = Context()
+        uniclient_thread = ConsoleUniClientThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniclient_thread.start()
+        uniworker_thread = ConsoleUniWorkerThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniworker_thread.start()
+
+        try:
+            uniclient_thread.wait_for_worker(INITIAL_CONNECTION_TIME_SECS)
+            # Let both sides learn the heartbeat interval.
+            time.sleep(3 * HB_INTERVAL / 1000.0)
+            assert uniclient_thread.rpc('add', [1, 2]) == 3
+            suspicion = list(uniclient_thread.worker_suspicion().values())
+            assert len(suspicion) == 1 and suspicion[0] < 1.0
+            assert uniworker_thread.client_suspicion() < 1.0
+
+            # The worker stops heartbeating without saying goodbye.
+            uniworker_thread.stop()
+            start = time.monotonic()
+            while uniclient_thread.worker_count() and time.monotonic() - start < 5 * HB_INTERVAL / 1000.0:
+                time.sleep(0.05)
+            assert uniclient_thread.worker_count() == 0
+        finally:
+            uniworker_thread.join()
+            uniclient_thread.join()
+
+    @classmethod
+    def test_liveness_detector(cls):
+        # type: () -> None
+        context = Context()
+        detector = functools.partial(LivenessFailureDetector, threshold=2)
+        uniclient_thread = ConsoleUniClientThread(cls.TEST_ZMQ_ENDPOINT, context, failure_detector=detector)
+        uniclient_thread.start()
+        uniworker_thread = ConsoleUniWorkerThread(cls.TEST_ZMQ_ENDPOINT, context, failure_detector=detector)
+        uniworker_thread.start()
+
+        try:
+            uniclient_thread.wait_for_worker(INITIAL_CONNECTION_TIME_SECS)
+            assert uniclient_thread.rpc('add', [2, 3]) == 5
+            uniworker_thread.stop()
+            start = time.monotonic()
+            while uniclient_thread.worker_count() and time.monotonic() - start < 4 * HB_INTERVAL / 1000.0:
+                time.sleep(0.05)
+            assert uniclient_thread.worker_count() == 0
+        finally:
+            uniworker_thread.join()
+            uniclient_thread.join()
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import unittest
+import pytest
+from zmq import Context
+from tornado.ioloop import IOLoop
+
+from xero.clients.console_uniclient_thread import ConsoleUniClientThread
+from xero.clients.console_uniworker_thread import ConsoleUniWorkerThread
+from xero.exceptions import UnknownMethodError
+from xero.uni.asyncuniclient import AsyncUniClient
+from xero.uni.asyncuniworker import AsyncUniWorker
+from xero.uni.uniworker import rpc_method
+from xero.xero_constants import INITIAL_CONNECTION_TIME_SECS
+
+logger = logging.getLogger(__name__)
+
+
+class QuietAsyncUniClient(AsyncUniClient):
+
+    def on_partial_message(self, msg):
+        pass
+
+    def on_message(self, msg):
+        pass
+
+    def on_timeout(self):
+        pass
+
+
+class RegistryAsyncUniWorker(AsyncUniWorker):
+
+    def __init__(self, endpoint, context):
+        super(RegistryAsyncUniWorker, self).__init__(endpoint, context)
+        self.pending = []
+
+    @rpc_method
+    async def double(self, value):
+        await asyncio.sleep(0)
+        return value * 2
+
+    @rpc_method(name='later', deferred=True)
+    def _later(self, value):
+        # Replies once the test says so.
+        self.pending.append((self.bind_reply(), value))
+
+
+class TestUniMethodRegistry(unittest.TestCase):
+
+    TEST_ZMQ_ENDPOINT = "tcp://127.0.0.1:5556"
+
+    def setup_method(self, method):
+        # Clear the IOLoop between each test.
+        IOLoop.clear_current()
+
+    @classmethod
+    def test_method_ids(cls):
+        # type: () -> None
+        context = Context()
+        uniclient_thread = ConsoleUniClientThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniclient_thread.start()
+        uniworker_thread = ConsoleUniWorkerThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniworker_thread.start()
+
+        try:
+            uniclient_thread.wait_for_worker(INITIAL_CONNECTION_TIME_SECS)
+            worker_rep = next(iter(uniclient_thread._workers.values()))
+            assert set(worker_rep.method_ids) == {name.encode() for name in uniworker_thread._method_table}
+            assert b'add' in worker_rep.method_ids
+
+            assert uniclient_thread.rpc('add', [1, 2]) == 3
+            assert uniclient_thread.rpc('give_get_string', ['x']) == 'returned string'
+            assert uniclient_thread.rpc_batch([('add', [1, 2]), ('add', [3, 4])]) == [3, 7]
+
+            # Methods nobody offers fail before anything goes out.
+            with pytest.raises(UnknownMethodError):
+                uniclient_thread.rpc('no_such_method')
+            # In a batch they only fail their own slot.
+            assert uniclient_thread.rpc_batch([('add', [1, 2]), ('no_such_method', [])])[1]['class'] == 'Exception'
+        finally:
+            uniworker_thread.join()
+            uniclient_thread.join()
+
+    @classmethod
+    def test_async_registry(cls):
+        # type: () -> None
+
+        async def scenario():
+            context = Context()
+            async with QuietAsyncUniClient(cls.TEST_ZMQ_ENDPOINT, context) as client, \
+                    RegistryAsyncUniWorker(cls.TEST_ZMQ_ENDPOINT, context) as worker:
+                await client.wait_for_worker(INITIAL_CONNECTION_TIME_SECS)
+                assert worker._method_table == ['double', 'later']
+                assert await client.rpc('double', [21]) == 42
+
+                later = asyncio.ensure_future(client.rpc('later', ['done']))
+                while not worker.pending:
+                    await asyncio.sleep(0.01)
+                reply, value = worker.pending.pop()
+                assert not later.done()
+                reply(value)
+                assert await later == 'done'
+
+        asyncio.run(scenario())
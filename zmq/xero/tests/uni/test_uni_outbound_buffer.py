@@ -0,0 +1,74 @@
+import logging
+import time
+import unittest
+import pytest
+from zmq import Context
+from tornado.ioloop import IOLoop
+
+from xero.clients.console_uniclient_thread import ConsoleUniClientThread
+from xero.clients.console_uniworker_thread import ConsoleUniWorkerThread
+from xero.exceptions import LostRemoteError
+from xero.uni.uniworker import rpc_method
+from xero.xero_constants import INITIAL_CONNECTION_TIME_SECS
+
+logger = logging.getLogger(__name__)
+
+
+class RecordingUniWorkerThread(ConsoleUniWorkerThread):
+
+    def __init__(self, endpoint, context=None):
+        super(RecordingUniWorkerThread, self).__init__(endpoint, context)
+        self.seen = []
+
+    def on_log_event(self, event, message):
+        pass
+
+    @rpc_method
+    def record(self, value):
+        self.seen.append(value)
+        return value
+
+
+class TestUniOutboundBuffer(unittest.TestCase):
+
+    TEST_ZMQ_ENDPOINT = "tcp://127.0.0.1:5556"
+    BUFFER_SIZE = 4
+
+    def setup_method(self, method):
+        # Clear the IOLoop between each test.
+        IOLoop.clear_current()
+
+    @classmethod
+    def test_requests_wait_for_worker(cls):
+        # type: () -> None
+        context = Context()
+        uniclient_thread = ConsoleUniClientThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniclient_thread.start()
+        uniworker_thread = None
+
+        try:
+            # Without a buffer, calls fail right away.
+            with pytest.raises(LostRemoteError):
+                uniclient_thread.rpc_nowait('record', [0])
+
+            uniclient_thread.set_outbound_buffer(cls.BUFFER_SIZE)
+            held = [uniclient_thread.rpc_nowait('record', [value]) for value in range(cls.BUFFER_SIZE - 1)]
+            expiring = uniclient_thread.rpc_nowait('record', [-1], timeout=0.2)
+            with pytest.raises(LostRemoteError):
+                uniclient_thread.rpc_nowait('record', [cls.BUFFER_SIZE])
+
+            # Calls whose timeout passes while held fail without waiting for a worker.
+            start = time.monotonic()
+            with pytest.raises(LostRemoteError):
+                expiring.result(1.0)
+            assert time.monotonic() - start < 1.0
+
+            # The rest are sent, in order, once a worker connects.
+            uniworker_thread = RecordingUniWorkerThread(cls.TEST_ZMQ_ENDPOINT, context)
+            uniworker_thread.start()
+            assert [future.result(INITIAL_CONNECTION_TIME_SECS) for future in held] == list(range(cls.BUFFER_SIZE - 1))
+            assert uniworker_thread.seen == list(range(cls.BUFFER_SIZE - 1))
+        finally:
+            if uniworker_thread is not None:
+                uniworker_thread.join()
+            uniclient_thread.join()
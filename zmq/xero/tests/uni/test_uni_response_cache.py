@@ -0,0 +1,118 @@
+import logging
+import time
+import unittest
+from zmq import Context
+from tornado.ioloop import IOLoop
+
+from xero.clients.console_uniclient_thread import ConsoleUniClientThread
+from xero.clients.console_uniworker_thread import ConsoleUniWorkerThread
+from xero.uni.uniworker import rpc_method
+from xero.xero_constants import INITIAL_CONNECTION_TIME_SECS
+
+logger = logging.getLogger(__name__)
+
+
+class InventoryUniWorkerThread(ConsoleUniWorkerThread):
+
+    def __init__(self, endpoint, context=None):
+        super(InventoryUniWorkerThread, self).__init__(endpoint, context)
+        self.calls = 0
+        self.stock = {'apples': 3, 'pears': 5}
+
+    def on_log_event(self, event, message):
+        pass
+
+    @rpc_method
+    def count(self, item):
+        self.calls += 1
+        return self.stock[item]
+
+    @rpc_method
+    def restock(self, item, amount):
+        self.stock[item] += amount
+        self.invalidate_cache('count', [item])
+        return self.stock[item]
+
+    @rpc_method
+    def inventory(self):
+        self.calls += 1
+        return dict(self.stock)
+
+
+class TestUniResponseCache(unittest.TestCase):
+
+    TEST_ZMQ_ENDPOINT = "tcp://127.0.0.1:5556"
+
+    def setup_method(self, method):
+        # Clear the IOLoop between each test.
+        IOLoop.clear_current()
+
+    @classmethod
+    def test_cached_replies(cls):
+        # type: () -> None
+        context = Context()
+        uniclient_thread = ConsoleUniClientThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniclient_thread.start()
+        uniworker_thread = InventoryUniWorkerThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniworker_thread.start()
+
+        try:
+            uniclient_thread.wait_for_worker(INITIAL_CONNECTION_TIME_SECS)
+            uniclient_thread.set_method_cache('count')
+            uniclient_thread.set_method_cache('inventory', ttl=0.1)
+            assert [uniclient_thread.rpc('count', ['apples']) for _ in range(5)] == [3] * 5
+            assert uniclient_thread.rpc_nowait('count', ['apples']).result(1.0) == 3
+            assert uniclient_thread.rpc('count', ['pears']) == 5
+            assert uniworker_thread.calls == 2
+            stats = uniclient_thread.response_cache_stats()
+            assert stats['hits'] == 5 and stats['misses'] == 2 and stats['entries'] == 2
+
+            # Each hit gets a copy of its own.
+            uniclient_thread.rpc('inventory')['apples'] = 0
+            assert uniclient_thread.rpc('inventory')['apples'] == 3
+            assert uniworker_thread.calls == 3
+            # Until the reply expires.
+            time.sleep(0.2)
+            assert uniclient_thread.rpc('inventory')['apples'] == 3
+            assert uniworker_thread.calls == 4
+
+            # The worker invalidates the one call whose reply changed, ahead of the reply to restock.
+            assert uniclient_thread.rpc('restock', ['apples', 2]) == 5
+            assert uniclient_thread.rpc('count', ['apples']) == 5
+            assert uniclient_thread.rpc('count', ['pears']) == 5
+            assert uniworker_thread.calls == 5
+
+            # Invalidating a whole method, or turning its caching off, drops all its replies.
+            uniclient_thread.invalidate_cache('count')
+            assert uniclient_thread.response_cache_stats()['entries'] == 1
+            uniclient_thread.set_method_cache('inventory', False)
+            assert uniclient_thread.response_cache_stats()['entries'] == 0
+            uniclient_thread.rpc('inventory')
+            uniclient_thread.rpc('inventory')
+            assert uniworker_thread.calls == 7
+        finally:
+            uniworker_thread.join()
+            uniclient_thread.join()
+
+    @classmethod
+    def test_cache_survives_ready_in_same_session(cls):
+        # type: () -> None
+        context = Context()
+        uniclient_thread = ConsoleUniClientThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniclient_thread.start()
+        uniworker_thread = InventoryUniWorkerThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniworker_thread.start()
+
+        try:
+            uniclient_thread.wait_for_worker(INITIAL_CONNECTION_TIME_SECS)
+            uniclient_thread.set_method_cache('count')
+            assert uniclient_thread.rpc('count', ['apples']) == 3
+            # The worker shakes hands again without having restarted, e.g. after losing track of the client.
+            uniworker_thread._stream.io_loop.add_callback(uniworker_thread._send_ready)
+            time.sleep(0.2)
+            assert uniclient_thread.worker_count() == 1
+            assert uniclient_thread.rpc('count', ['apples']) == 3
+            assert uniworker_thread.calls == 1
+        finally:
+            uniworker_thread.join()
+            uniclient_thread.join()
@@ -0,0 +1,98 @@
+import logging
+import time
+import unittest
+import pytest
+from zmq import Context
+from tornado.ioloop import IOLoop
+
+from xero.clients.console_uniclient_thread import ConsoleUniClientThread
+from xero.clients.console_uniworker_thread import ConsoleUniWorkerThread
+from xero.uni.uniworker import rpc_method
+from xero.xero_constants import INITIAL_CONNECTION_TIME_SECS
+
+logger = logging.getLogger(__name__)
+
+
+class MemoizingUniWorkerThread(ConsoleUniWorkerThread):
+
+    def __init__(self, endpoint, context=None):
+        super(MemoizingUniWorkerThread, self).__init__(endpoint, context)
+        self.calls = 0
+
+    def on_log_event(self, event, message):
+        pass
+
+    @rpc_method(cache=True)
+    def square(self, value):
+        self.calls += 1
+        if value < 0:
+            raise ValueError('negative')
+        return value * value
+
+    @rpc_method(cache=True, cache_ttl=0.1)
+    def now(self):
+        self.calls += 1
+        return time.time()
+
+    @rpc_method(cache=True)
+    def blob(self, size):
+        self.calls += 1
+        return b'x' * size
+
+
+class TestUniResultCache(unittest.TestCase):
+
+    TEST_ZMQ_ENDPOINT = "tcp://127.0.0.1:5556"
+
+    def setup_method(self, method):
+        # Clear the IOLoop between each test.
+        IOLoop.clear_current()
+
+    @classmethod
+    def test_memoized_replies(cls):
+        # type: () -> None
+        context = Context()
+        uniclient_thread = ConsoleUniClientThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniclient_thread.start()
+        uniworker_thread = MemoizingUniWorkerThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniworker_thread.start()
+
+        try:
+            uniclient_thread.wait_for_worker(INITIAL_CONNECTION_TIME_SECS)
+            assert [uniclient_thread.rpc('square', [3]) for _ in range(5)] == [9] * 5
+            assert uniclient_thread.rpc('square', [4]) == 16
+            assert uniworker_thread.calls == 2
+            stats = uniworker_thread.result_cache_stats()
+            assert stats['hits'] == 4 and stats['misses'] == 2 and stats['entries'] == 2
+
+            # Exceptions aren't memoized.
+            for _ in range(2):
+                assert uniclient_thread.rpc('square', [-1])['class'] == 'ValueError'
+            assert uniworker_thread.calls == 4
+
+            # Nor are replies past their time to live.
+            first = uniclient_thread.rpc('now')
+            assert uniclient_thread.rpc('now') == first
+            time.sleep(0.2)
+            assert uniclient_thread.rpc('now') != first
+            assert uniworker_thread.result_cache_stats()['expirations'] == 1
+
+            # The least recently used replies make room for new ones, room for two here.
+            uniworker_thread.set_result_cache(2500)
+            calls = uniworker_thread.calls
+            for size in (1000, 1001, 1002, 1002, 1000):
+                assert len(uniclient_thread.rpc('blob', [size])) == size
+            assert uniworker_thread.calls == calls + 4
+            stats = uniworker_thread.result_cache_stats()
+            assert stats['bytes'] <= 2500 and stats['evictions'] >= 2
+        finally:
+            uniworker_thread.join()
+            uniclient_thread.join()
+
+    @staticmethod
+    def test_streaming_methods_cant_be_cached():
+        # type: () -> None
+        with pytest.raises(ValueError):
+            @rpc_method(cache=True)
+            def rows():
+                yield 1
@@ -0,0 +1,176 @@
+import logging
+import time
+import unittest
+import pytest
+from zmq import Context
+from tornado.ioloop import IOLoop
+
+from xero.clients.console_uniclient_thread import ConsoleUniClientThread
+from xero.clients.console_uniworker_thread import ConsoleUniWorkerThread
+from xero.exceptions import LostRemoteError
+from xero.uni.uniworker import rpc_method
+from xero.xero_constants import INITIAL_CONNECTION_TIME_SECS
+
+logger = logging.getLogger(__name__)
+
+
+class CountingUniWorkerThread(ConsoleUniWorkerThread):
+
+    #: Calls to stall() across every worker, only the first one takes its time.
+    stalls = 0
+
+    def __init__(self, endpoint, context=None):
+        super(CountingUniWorkerThread, self).__init__(endpoint, context)
+        self.calls = 0
+
+    def on_log_event(self, event, message):
+        pass
+
+    @rpc_method
+    def tally(self, value):
+        self.calls += 1
+        return value
+
+    @rpc_method(deferred=True)
+    def ignore(self):
+        # Never replies, as a handler that lost track of its request would.
+        self.calls += 1
+
+    @rpc_method
+    def stall(self, seconds):
+        CountingUniWorkerThread.stalls += 1
+        if CountingUniWorkerThread.stalls == 1:
+            time.sleep(seconds)
+        return CountingUniWorkerThread.stalls
+
+
+class DuplicatingUniClientThread(ConsoleUniClientThread):
+    """
+    Client whose requests are all delivered twice, as a retry that crossed paths with the original reply would be.
+    """
+
+    def _send_request(self, worker_rep, pending_request):
+        super(DuplicatingUniClientThread, self)._send_request(worker_rep, pending_request)
+        super(DuplicatingUniClientThread, self)._send_request(worker_rep, pending_request)
+
+
+def wait_for_worker_count(client, count, timeout=INITIAL_CONNECTION_TIME_SECS):
+    end = time.monotonic() + timeout
+    while client.worker_count() < count and time.monotonic() < end:
+        time.sleep(0.01)
+    assert client.worker_count() == count
+
+
+class TestUniRetries(unittest.TestCase):
+
+    TEST_ZMQ_ENDPOINT = "tcp://127.0.0.1:5556"
+
+    def setup_method(self, method):
+        # Clear the IOLoop between each test.
+        IOLoop.clear_current()
+
+    @classmethod
+    def test_retried_requests_run_once(cls):
+        # type: () -> None
+        context = Context()
+        uniclient_thread = DuplicatingUniClientThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniclient_thread.start()
+        uniworker_thread = CountingUniWorkerThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniworker_thread.start()
+
+        uniworker_thread.set_dedup_table()
+
+        try:
+            uniclient_thread.wait_for_worker(INITIAL_CONNECTION_TIME_SECS)
+            assert [uniclient_thread.rpc('tally', [value]) for value in range(3)] == [0, 1, 2]
+            assert uniclient_thread.rpc_batch([('tally', [3])]) == [3]
+            assert uniworker_thread.calls == 4
+            # The second copy of each request got the reply kept for it, though maybe after the client got the first.
+            end = time.monotonic() + 1.0
+            while uniworker_thread.dedup_table_stats()['hits'] < 4 and time.monotonic() < end:
+                time.sleep(0.01)
+            assert uniworker_thread.dedup_table_stats()['hits'] == 4
+
+            # With the table turned off, retries are worked on again.
+            uniworker_thread.set_dedup_table(0)
+            assert uniclient_thread.rpc('tally', [4]) == 4
+            end = time.monotonic() + 1.0
+            while uniworker_thread.calls < 6 and time.monotonic() < end:
+                time.sleep(0.01)
+            assert uniworker_thread.calls == 6
+        finally:
+            uniworker_thread.join()
+            uniclient_thread.join()
+
+    @classmethod
+    def test_retry_on_timeout(cls):
+        # type: () -> None
+        context = Context()
+        uniclient_thread = ConsoleUniClientThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniclient_thread.start()
+        uniworker_threads = [CountingUniWorkerThread(cls.TEST_ZMQ_ENDPOINT, context) for _ in range(2)]
+        for uniworker_thread in uniworker_threads:
+            uniworker_thread.start()
+
+        try:
+            wait_for_worker_count(uniclient_thread, 2)
+            # The first worker stalls past the timeout and is dropped, the retry goes to the other one.
+            assert uniclient_thread.rpc('stall', [1.0], timeout=0.3, retries=2) == 2
+            assert uniclient_thread.worker_count() == 1
+
+            # Out of retries, the call fails like one without any.
+            CountingUniWorkerThread.stalls = 0
+            with pytest.raises(LostRemoteError):
+                uniclient_thread.rpc('stall', [1.0], timeout=0.3, retries=0)
+        finally:
+            for uniworker_thread in uniworker_threads:
+                uniworker_thread.join()
+            uniclient_thread.join()
+            CountingUniWorkerThread.stalls = 0
+
+    @classmethod
+    def test_retry_on_timeout_with_single_worker(cls):
+        # type: () -> None
+        context = Context()
+        uniclient_thread = ConsoleUniClientThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniclient_thread.start()
+        uniworker_thread = CountingUniWorkerThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniworker_thread.start()
+
+        try:
+            uniclient_thread.wait_for_worker(INITIAL_CONNECTION_TIME_SECS)
+            # The only worker stalls past the timeout and is dropped, the retry waits for it to come back.
+            assert uniclient_thread.rpc('stall', [1.0], timeout=0.3, retries=3) == 2
+            assert uniclient_thread.worker_count() == 1
+
+            # Waiting for a worker is bounded by how long the call may take in all.
+            CountingUniWorkerThread.stalls = 0
+            start = time.monotonic()
+            with pytest.raises(LostRemoteError):
+                uniclient_thread.rpc('stall', [5.0], timeout=0.3, retries=1)
+            assert time.monotonic() - start < 5.0
+        finally:
+            uniworker_thread.join()
+            uniclient_thread.join()
+            CountingUniWorkerThread.stalls = 0
+
+    @classmethod
+    def test_unanswered_request_is_given_up_on(cls):
+        # type: () -> None
+        context = Context()
+        uniclient_thread = ConsoleUniClientThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniclient_thread.set_outbound_buffer(1)
+        uniclient_thread.start()
+        uniworker_thread = CountingUniWorkerThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniworker_thread.set_dedup_table(in_progress_ttl=0.2)
+        uniworker_thread.start()
+
+        try:
+            uniclient_thread.wait_for_worker(INITIAL_CONNECTION_TIME_SECS)
+            # The retry comes in after the worker gave up on the first try, so it's worked on rather than dropped.
+            with pytest.raises(LostRemoteError):
+                uniclient_thread.rpc('ignore', timeout=0.5, retries=1)
+            assert uniworker_thread.calls == 2
+        finally:
+            uniworker_thread.join()
+            uniclient_thread.join()
@@ -0,0 +1,52 @@
+import logging
+import time
+import unittest
+from zmq import Context
+from tornado.ioloop import IOLoop
+
+from xero.clients.console_uniclient_thread import ConsoleUniClientThread
+from xero.clients.console_uniworker_thread import ConsoleUniWorkerThread
+from xero.xero_constants import HB_INTERVAL, HB_LIVENESS, INITIAL_CONNECTION_TIME_SECS
+
+logger = logging.getLogger(__name__)
+
+
+class QuietUniWorkerThread(ConsoleUniWorkerThread):
+
+    def on_log_event(self, event, message):
+        pass
+
+
+class TestUniSession(unittest.TestCase):
+
+    TEST_ZMQ_ENDPOINT = "tcp://127.0.0.1:5556"
+
+    def setup_method(self, method):
+        # Clear the IOLoop between each test.
+        IOLoop.clear_current()
+
+    @classmethod
+    def test_client_restart(cls):
+        # type: () -> None
+        context = Context()
+        uniclient_thread = ConsoleUniClientThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniclient_thread.start()
+        uniworker_thread = QuietUniWorkerThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniworker_thread.start()
+
+        try:
+            uniclient_thread.wait_for_worker(INITIAL_CONNECTION_TIME_SECS)
+            assert uniclient_thread.rpc('add', [1, 2]) == 3
+            uniclient_thread.join()
+
+            # The worker's first heartbeat to the new client gets it to shake hands again, well before the old client
+            # would have been given up on.
+            uniclient_thread = ConsoleUniClientThread(cls.TEST_ZMQ_ENDPOINT, context)
+            uniclient_thread.start()
+            start = time.monotonic()
+            uniclient_thread.wait_for_worker(INITIAL_CONNECTION_TIME_SECS)
+            assert time.monotonic() - start < HB_INTERVAL * (HB_LIVENESS - 1) / 1000.0
+            assert uniclient_thread.rpc('add', [2, 3]) == 5
+        finally:
+            uniworker_thread.join()
+            uniclient_thread.join()
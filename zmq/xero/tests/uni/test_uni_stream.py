@@ -0,0 +1,85 @@
+import asyncio
+import logging
+import unittest
+from zmq import Context
+from tornado.ioloop import IOLoop
+
+from xero.clients.console_uniclient_thread import ConsoleUniClientThread
+from xero.clients.console_uniworker_thread import ConsoleUniWorkerThread
+from xero.uni.asyncuniclient import AsyncUniClient
+from xero.uni.asyncuniworker import AsyncUniWorker
+from xero.xero_constants import INITIAL_CONNECTION_TIME_SECS
+
+logger = logging.getLogger(__name__)
+
+
+class QuietAsyncUniClient(AsyncUniClient):
+
+    def on_partial_message(self, msg):
+        pass
+
+    def on_message(self, msg):
+        pass
+
+    def on_timeout(self):
+        pass
+
+
+class StreamingAsyncUniWorker(AsyncUniWorker):
+
+    async def do_work(self, name, args, kwargs):
+        for i in range(args[0]):
+            await asyncio.sleep(0)
+            yield {'row': i}
+
+
+class TestUniStream(unittest.TestCase):
+
+    TEST_ZMQ_ENDPOINT = "tcp://127.0.0.1:5556"
+
+    def setup_method(self, method):
+        # Clear the IOLoop between each test.
+        IOLoop.clear_current()
+
+    @classmethod
+    def test_rpc_stream(cls):
+        # type: () -> None
+        context = Context()
+        uniclient_thread = ConsoleUniClientThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniclient_thread.start()
+        uniworker_thread = ConsoleUniWorkerThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniworker_thread.start()
+
+        try:
+            uniclient_thread.wait_for_worker(INITIAL_CONNECTION_TIME_SECS)
+            stream = uniclient_thread.rpc_stream('count_to', [1000])
+            assert list(stream) == list(range(1000))
+            # The generator's return value is the final reply.
+            assert stream.result == 1000
+            # An ended stream stays ended.
+            assert list(stream) == []
+
+            # Plain handlers still work, and their final reply is the result.
+            stream = uniclient_thread.rpc_stream('add', [1, 2])
+            assert list(stream) == ['started']
+            assert stream.result == 3
+
+            # Generators work in batches too, only the final reply makes it into the batch reply.
+            assert uniclient_thread.rpc_batch([('count_to', [5]), ('add', [1, 2])]) == [5, 3]
+        finally:
+            uniworker_thread.join()
+            uniclient_thread.join()
+
+    @classmethod
+    def test_async_rpc_stream(cls):
+        # type: () -> None
+
+        async def scenario():
+            context = Context()
+            async with QuietAsyncUniClient(cls.TEST_ZMQ_ENDPOINT, context) as client, \
+                    StreamingAsyncUniWorker(cls.TEST_ZMQ_ENDPOINT, context):
+                await client.wait_for_worker(INITIAL_CONNECTION_TIME_SECS)
+                rows = [row async for row in client.rpc_stream('rows', [100])]
+                assert rows == [{'row': i} for i in range(100)]
+
+        asyncio.run(scenario())
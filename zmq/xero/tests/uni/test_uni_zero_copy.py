@@ -0,0 +1,43 @@
+import logging
+import unittest
+import pytest
+from zmq import Context
+from tornado.ioloop import IOLoop
+
+from xero.clients.console_uniclient_thread import ConsoleUniClientThread
+from xero.clients.console_uniworker_thread import ConsoleUniWorkerThread
+from xero.xero_constants import INITIAL_CONNECTION_TIME_SECS
+
+logger = logging.getLogger(__name__)
+
+
+class TestUniZeroCopy(unittest.TestCase):
+
+    TEST_ZMQ_ENDPOINT = "tcp://127.0.0.1:5556"
+
+    def setup_method(self, method):
+        # Clear the IOLoop between each test.
+        IOLoop.clear_current()
+
+    @classmethod
+    def test_ndarray_rpc(cls):
+        # type: () -> None
+        numpy = pytest.importorskip('numpy')
+        context = Context()
+        uniclient_thread = ConsoleUniClientThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniclient_thread.start()
+        uniworker_thread = ConsoleUniWorkerThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniworker_thread.start()
+
+        try:
+            uniclient_thread.wait_for_worker(INITIAL_CONNECTION_TIME_SECS)
+            values = numpy.random.rand(1000, 1000)
+            ret = uniclient_thread.rpc('add', [values, numpy.ones_like(values)])
+            assert ret.shape == values.shape
+            assert numpy.array_equal(ret, values + 1)
+
+            uniworker_thread.emit({'frame': values})
+            assert numpy.array_equal(uniclient_thread.get_sub_message(timeout=1.0)['frame'], values)
+        finally:
+            uniworker_thread.join()
+            uniclient_thread.join()
@@ -0,0 +1,46 @@
+import logging
+import unittest
+from zmq import Context
+from tornado.ioloop import IOLoop
+
+from xero.clients.console_uniclient_thread import ConsoleUniClientThread
+from xero.clients.console_uniworker_thread import ConsoleUniWorkerThread
+from xero.xero_constants import INITIAL_CONNECTION_TIME_SECS
+
+logger = logging.getLogger(__name__)
+
+
+class TestUniClientBatch(unittest.TestCase):
+
+    TEST_ZMQ_ENDPOINT = "tcp://127.0.0.1:5556"
+
+    def setup_method(self, method):
+        # Clear the IOLoop between each test.
+        IOLoop.clear_current()
+
+    @classmethod
+    def test_rpc_batch(cls):
+        # type: () -> None
+        context = Context()
+        uniclient_thread = ConsoleUniClientThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniclient_thread.start()
+        uniworker_thread = ConsoleUniWorkerThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniworker_thread.start()
+
+        try:
+            uniclient_thread.wait_for_worker(INITIAL_CONNECTION_TIME_SECS)
+            results = uniclient_thread.rpc_batch([
+                ('add', [1, 2]),
+                ('compare', None, {'str1': "uno", 'str2': "uno"}),
+                ('get_true',),
+                ('no_such_method', []),
+            ])
+            assert results[:3] == [3, {'equal': True}, True]
+            assert results[3]['class'] == 'Exception'
+
+            assert uniclient_thread.rpc_batch([]) == []
+            calls = [('add', [i, i]) for i in range(1000)]
+            assert uniclient_thread.rpc_batch(calls) == [i + i for i in range(1000)]
+        finally:
+            uniworker_thread.join()
+            uniclient_thread.join()
@@ -0,0 +1,65 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import logging
+import unittest
+from zmq import Context
+from tornado.ioloop import IOLoop
+
+from xero.clients.console_uniclient_thread import ConsoleUniClientThread
+from xero.clients.console_uniworker_thread import ConsoleUniWorkerThread
+from xero.xero_constants import INITIAL_CONNECTION_TIME_SECS
+
+logger = logging.getLogger(__name__)
+
+
+class TestUniClientPipelining(unittest.TestCase):
+
+    TEST_ZMQ_ENDPOINT = "tcp://127.0.0.1:5556"
+    CALLER_COUNT = 16
+    CALLS_PER_CALLER = 50
+
+    def setup_method(self, method):
+        # Clear the IOLoop between each test.
+        IOLoop.clear_current()
+
+    @classmethod
+    def test_concurrent_callers_get_their_own_replies(cls):
+        # type: () -> None
+        context = Context()
+        uniclient_thread = ConsoleUniClientThread(cls.TEST_ZMQ_ENDPOINT, context, max_in_flight=8)
+        uniclient_thread.start()
+        uniworker_thread = ConsoleUniWorkerThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniworker_thread.start()
+
+        def call_many(caller):
+            return [uniclient_thread.rpc('add', [caller, i]) for i in range(cls.CALLS_PER_CALLER)]
+
+        try:
+            uniclient_thread.wait_for_worker(INITIAL_CONNECTION_TIME_SECS)
+            with ThreadPoolExecutor(cls.CALLER_COUNT) as executor:
+                results = list(executor.map(call_many, range(cls.CALLER_COUNT)))
+            for caller, replies in enumerate(results):
+                assert replies == [caller + i for i in range(cls.CALLS_PER_CALLER)]
+        finally:
+            uniworker_thread.join()
+            uniclient_thread.join()
+
+    @classmethod
+    def test_rpc_nowait_fan_out(cls):
+        # type: () -> None
+        context = Context()
+        uniclient_thread = ConsoleUniClientThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniclient_thread.start()
+        uniworker_thread = ConsoleUniWorkerThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniworker_thread.start()
+
+        partials = []
+        try:
+            uniclient_thread.wait_for_worker(INITIAL_CONNECTION_TIME_SECS)
+            # Far more calls than the worker's max_in_flight, the rest wait their turn on the client.
+            futures = {uniclient_thread.rpc_nowait('add', [i, 1], on_partial=partials.append): i for i in range(200)}
+            for future in as_completed(futures, timeout=10):
+                assert future.result() == futures[future] + 1
+            assert partials == ['started'] * len(futures)
+        finally:
+            uniworker_thread.join()
+            uniclient_thread.join()
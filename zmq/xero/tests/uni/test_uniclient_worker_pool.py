@@ -0,0 +1,97 @@
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep, monotonic
+import logging
+import unittest
+from zmq import Context
+from tornado.ioloop import IOLoop
+
+from xero.clients.console_uniclient_thread import ConsoleUniClientThread
+from xero.clients.console_uniworker_thread import ConsoleUniWorkerThread
+from xero.uni.uniworker import rpc_method
+from xero.xero_constants import INITIAL_CONNECTION_TIME_SECS
+
+logger = logging.getLogger(__name__)
+
+
+class CountingUniWorkerThread(ConsoleUniWorkerThread):
+    """
+    Worker that records how many requests it serviced, and can be told to take its time about it.
+    """
+
+    def __init__(self, endpoint, context=None):
+        super(CountingUniWorkerThread, self).__init__(endpoint, context)
+        self.request_count = 0
+
+    def on_log_event(self, event, message):
+        pass
+
+    def do_work(self, name, args, kwargs):
+        self.request_count += 1
+        super(CountingUniWorkerThread, self).do_work(name, args, kwargs)
+
+    @staticmethod
+    @rpc_method
+    def nap(seconds):
+        sleep(seconds)
+        return True
+
+
+def wait_for_worker_count(client, count, timeout=INITIAL_CONNECTION_TIME_SECS):
+    end = monotonic() + timeout
+    while client.worker_count() < count and monotonic() < end:
+        sleep(0.01)
+    assert client.worker_count() == count
+
+
+class TestUniClientWorkerPool(unittest.TestCase):
+
+    TEST_ZMQ_ENDPOINT = "tcp://127.0.0.1:5556"
+    WORKER_COUNT = 3
+
+    def setup_method(self, method):
+        # Clear the IOLoop between each test.
+        IOLoop.clear_current()
+
+    @classmethod
+    def test_requests_spread_across_workers(cls):
+        # type: () -> None
+        context = Context()
+        uniclient_thread = ConsoleUniClientThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniclient_thread.start()
+        workers = [CountingUniWorkerThread(cls.TEST_ZMQ_ENDPOINT, context) for _ in range(cls.WORKER_COUNT)]
+        for worker in workers:
+            worker.start()
+
+        try:
+            wait_for_worker_count(uniclient_thread, cls.WORKER_COUNT)
+            for _ in range(cls.WORKER_COUNT * 10):
+                assert uniclient_thread.rpc('add', [1, 2]) == 3
+            # Least-recently-used routing round-robins sequential calls across the pool.
+            assert [worker.request_count for worker in workers] == [10] * cls.WORKER_COUNT
+        finally:
+            for worker in workers:
+                worker.join()
+            uniclient_thread.join()
+
+    @classmethod
+    def test_concurrent_calls_run_in_parallel(cls):
+        # type: () -> None
+        context = Context()
+        uniclient_thread = ConsoleUniClientThread(cls.TEST_ZMQ_ENDPOINT, context)
+        uniclient_thread.start()
+        workers = [CountingUniWorkerThread(cls.TEST_ZMQ_ENDPOINT, context) for _ in range(cls.WORKER_COUNT)]
+        for worker in workers:
+            worker.start()
+
+        try:
+            wait_for_worker_count(uniclient_thread, cls.WORKER_COUNT)
+            start = monotonic()
+            with ThreadPoolExecutor(cls.WORKER_COUNT) as executor:
+                results = list(executor.map(lambda _: uniclient_thread.rpc('nap', [0.5]), range(cls.WORKER_COUNT)))
+            assert results == [True] * cls.WORKER_COUNT
+            # One nap per worker, so the calls should overlap rather than queue up behind each other.
+            assert monotonic() - start < 0.5 * cls.WORKER_COUNT
+        finally:
+            for worker in workers:
+                worker.join()
+            uniclient_thread.join()
@@ -17,7 +17,9 @@ class TestZeroMQMessageRate(unittest.TestCase):
 
     TEST_ZMQ_ENDPOINT = "tcp://127.0.0.1:5556"
     RPC_MESSAGE_COUNT = 10000
+    RPC_BATCH_SIZE = 100
     EMIT_MESSAGE_COUNT = 100000
+    EMIT_BATCH_SIZE = 100
     #TEST_ZMQ_ENDPOINT = "ipc:///tmp/test_message_rate"
 
     def setup_method(self, method):
@@ -88,6 +90,28 @@ class TestZeroMQMessageRate(unittest.TestCase):
 #        if one_second_rate < 650:
 #            logger.warning("I would expect the one second message rate to stay above 650 on GLaDOS")
 
+    @classmethod
+    @pytest.mark.long
+    def test_zeromq_rpc_batch_rate(cls):
+        # type: () -> None
+
+        uniclient_thread = ConsoleUniClientThread(cls.TEST_ZMQ_ENDPOINT)
+        uniclient_thread.start()
+
+        uniworker_thread = ConsoleUniWorkerThread(cls.TEST_ZMQ_ENDPOINT)
+        uniworker_thread.start()
+
+        uniclient_thread.wait_for_worker(INITIAL_CONNECTION_TIME_SECS)
+
+        batch = [('compare', None, {'str1': "uno", 'str2': "dos"})] * cls.RPC_BATCH_SIZE
+        for i in range(0, cls.RPC_MESSAGE_COUNT // cls.RPC_BATCH_SIZE):
+            ret = uniclient_thread.rpc_batch(batch)
+            assert ret == [{'equal': False}] * cls.RPC_BATCH_SIZE
+
+        # Shut down the worker and client
+        uniworker_thread.join()
+        uniclient_thread.join()
+
     @classmethod
     @pytest.mark.long
     def test_zeromq_emit_rate(cls):
@@ -129,5 +153,33 @@ class TestZeroMQMessageRate(unittest.TestCase):
         uniworker_thread.join()
         uniclient_thread.join()
 
+    @classmethod
+    @pytest.mark.long
+    def test_zeromq_emit_batch_rate(cls):
+        # type: () -> None
+        uniclient_thread = ConsoleUniClientThread(cls.TEST_ZMQ_ENDPOINT)
+        uniclient_thread.start()
+
+        uniworker_thread = ConsoleUniWorkerThread(cls.TEST_ZMQ_ENDPOINT)
+        uniworker_thread.start()
+
+        uniclient_thread.wait_for_worker(INITIAL_CONNECTION_TIME_SECS)
+        uniclient_thread.rpc('compare', kwargs={
+            'str1': "uno",
+            'str2': "dos"
+        })
+        uniworker_thread.set_emit_batching(cls.EMIT_BATCH_SIZE)
 
+        total_receive_count = 0
+        for i in range(0, cls.EMIT_MESSAGE_COUNT):
+            uniworker_thread.emit({
+                'str1': "uno",
+                'str2': "dos"
+            })
+            total_receive_count += len(uniclient_thread.get_sub_messages(timeout=0))
+        while total_receive_count < cls.EMIT_MESSAGE_COUNT:
+            total_receive_count += len(uniclient_thread.get_sub_messages(timeout=0.1))
 
+        # Shut down the worker and client
+        uniworker_thread.join()
+        uniclient_thread.join()
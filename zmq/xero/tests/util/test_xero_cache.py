@@ -0,0 +1,68 @@
+import logging
+import time
+import unittest
+import pytest
+
+from xero.util.xero_cache import LruCache
+
+logger = logging.getLogger(__name__)
+
+
+class TestXeroCache(unittest.TestCase):
+
+    @staticmethod
+    def test_lru_eviction():
+        cache = LruCache(30)
+        for key in 'abc':
+            assert cache.put(key, key.upper(), 10)
+        # Using 'a' makes 'b' the least recently used.
+        assert cache.get('a') == 'A'
+        cache.put('d', 'D', 10)
+        assert cache.get('b') is None
+        assert [cache.get(key) for key in 'acd'] == ['A', 'C', 'D']
+        stats = cache.stats()
+        assert stats['entries'] == 3 and stats['bytes'] == 30
+        assert stats['hits'] == 4 and stats['misses'] == 1 and stats['evictions'] == 1
+
+    @staticmethod
+    def test_replace_and_oversized():
+        cache = LruCache(30)
+        cache.put('a', 1, 10)
+        cache.put('a', 2, 20)
+        assert cache.get('a') == 2 and cache.stats()['bytes'] == 20
+        # Too large to ever fit, and caching it doesn't push anything else out.
+        assert not cache.put('b', 3, 31)
+        assert cache.get('a') == 2 and cache.get('b', 'missing') == 'missing'
+        cache.set_max_bytes(10)
+        assert len(cache) == 0 and cache.stats()['evictions'] == 1
+
+    @staticmethod
+    def test_ttl():
+        cache = LruCache(100)
+        cache.put('short', 1, 10, ttl=0.05)
+        cache.put('long', 2, 10)
+        time.sleep(0.1)
+        assert cache.get('short') is None
+        assert cache.get('long') == 2
+        stats = cache.stats()
+        assert stats['expirations'] == 1 and stats['bytes'] == 10
+
+    @staticmethod
+    def test_discard_and_clear():
+        cache = LruCache(100)
+        cache.put('a', 1, 10)
+        cache.put('b', 2, 10)
+        cache.discard('a')
+        assert cache.get('a') is None and cache.stats()['bytes'] == 10
+        cache.clear()
+        assert len(cache) == 0 and cache.stats()['bytes'] == 0
+        with pytest.raises(ValueError):
+            LruCache(-1)
+
+    @staticmethod
+    def test_discard_if():
+        cache = LruCache(100)
+        for key in [('a', 1), ('a', 2), ('b', 1)]:
+            cache.put(key, key[1], 10)
+        assert cache.discard_if(lambda key: key[0] == 'a') == 2
+        assert len(cache) == 1 and cache.get(('b', 1)) == 1 and cache.stats()['bytes'] == 10
@@ -0,0 +1,53 @@
+from datetime import datetime
+import logging
+import pickle
+import pytest
+import unittest
+
+from xero.util.xero_codecs import CODEC_MSGPACK, CODEC_PICKLE, CODEC_RAW, codec_for_tag, check_codecs, get_codec
+from xero.xero_constants import ZERO_COPY_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+
+class TestXeroCodecs(unittest.TestCase):
+
+    @staticmethod
+    def test_round_trips():
+        call = ([1, 'two', datetime(2020, 1, 2, 3, 4, 5)], {'flag': True})
+        for name in (CODEC_MSGPACK, CODEC_PICKLE):
+            codec = get_codec(name)
+            frames = codec.encode_call(*call)
+            assert codec.decode_call(frames) == call
+            assert codec.decode(codec.encode({'reply': [1.5]})) == [{'reply': [1.5]}]
+
+        raw = get_codec(CODEC_RAW)
+        assert raw.decode_call(raw.encode_call([b'abc', bytearray(b'de')], {})) == ([b'abc', bytearray(b'de')], {})
+        assert raw.decode(raw.encode('text')) == [b'text']
+        with pytest.raises(TypeError):
+            raw.encode_call([b'abc'], {'key': b'value'})
+        with pytest.raises(TypeError):
+            raw.encode(5)
+
+    @staticmethod
+    def test_pickle_out_of_band():
+        codec = get_codec(CODEC_PICKLE)
+        big = pickle.PickleBuffer(bytearray(b'x' * ZERO_COPY_THRESHOLD))
+        small = pickle.PickleBuffer(bytearray(b'y' * 10))
+        frames = codec.encode([big, small], {'big': big})
+        # Two bodies and one frame for each time the big buffer was pickled.
+        assert len(frames) == 4
+        args, kwargs = codec.decode_call([bytes(frame) for frame in frames])
+        assert bytes(args[0]) == b'x' * ZERO_COPY_THRESHOLD and bytes(args[1]) == b'y' * 10
+        assert bytes(kwargs['big']) == b'x' * ZERO_COPY_THRESHOLD
+
+    @staticmethod
+    def test_tags():
+        for name in (CODEC_MSGPACK, CODEC_PICKLE, CODEC_RAW):
+            assert codec_for_tag(get_codec(name).tag, [name]) is get_codec(name)
+        with pytest.raises(ValueError):
+            codec_for_tag(get_codec(CODEC_PICKLE).tag, [CODEC_MSGPACK, CODEC_RAW])
+        with pytest.raises(ValueError):
+            codec_for_tag(b'\xff', [CODEC_MSGPACK])
+        with pytest.raises(ValueError):
+            check_codecs(['no_such_codec'])
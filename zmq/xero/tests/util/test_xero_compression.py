@@ -0,0 +1,42 @@
+import logging
+import os
+import pytest
+import unittest
+
+from xero.util.xero_codecs import CODEC_MSGPACK, get_codec
+from xero.util.xero_compression import Compression, CompressionStats, COMPRESSOR_LZMA, COMPRESSOR_ZLIB, \
+    decompress_frames, get_compressor
+
+logger = logging.getLogger(__name__)
+
+
+class TestXeroCompression(unittest.TestCase):
+
+    @staticmethod
+    def test_compress_frames():
+        tag = get_codec(CODEC_MSGPACK).tag
+        for name in (COMPRESSOR_ZLIB, COMPRESSOR_LZMA):
+            stats = CompressionStats()
+            compression = Compression(get_compressor(name), 1000, stats)
+            frames = [b'a' * 5000, b'small', os.urandom(5000)]
+            sent = compression.compress(tag, list(frames), 'method')
+            # Only the big compressible frame got compressed, the tag says which.
+            assert sent[0] == tag + bytes([get_compressor(name).id, 1, 0, 0])
+            assert len(sent[1]) < 5000 and sent[2] is frames[1] and sent[3] is frames[2]
+            assert decompress_frames(sent[0], sent[1:], stats, 'method') == frames
+
+            # Small messages go out exactly as without compression.
+            assert compression.compress(tag, [b'small'], 'method') == [tag, b'small']
+
+            method_stats = stats.snapshot()['method']
+            assert method_stats['messages'] == 2 and method_stats['compressed'] == 1
+            assert method_stats['decompressed'] == 1
+            assert method_stats['ratio'] > 1.0
+
+    @staticmethod
+    def test_uncompressed():
+        tag = get_codec(CODEC_MSGPACK).tag
+        assert Compression().compress(tag, [b'a' * 100000], 'method') == [tag, b'a' * 100000]
+        assert decompress_frames(tag, [b'payload']) == [b'payload']
+        with pytest.raises(ValueError):
+            decompress_frames(tag + b'\xff\x01', [b'payload'])
@@ -0,0 +1,66 @@
+import logging
+import random
+import unittest
+
+from xero.util.xero_failure_detector import LivenessFailureDetector, PhiAccrualFailureDetector, phi
+
+logger = logging.getLogger(__name__)
+
+
+class TestXeroFailureDetector(unittest.TestCase):
+
+    @staticmethod
+    def test_phi():
+        assert phi(0.0, 1.0, 0.1) < 0.001
+        assert 0.2 < phi(1.0, 1.0, 0.1) < 0.4
+        assert phi(1.2, 1.0, 0.1) < phi(1.4, 1.0, 0.1) < phi(1.6, 1.0, 0.1)
+        # Far off either way doesn't overflow.
+        assert phi(-1000.0, 1.0, 0.1) == 0.0
+        assert phi(1000.0, 1.0, 0.1) == float('inf')
+
+    @staticmethod
+    def test_phi_rises_with_silence():
+        detector = PhiAccrualFailureDetector(acceptable_pause=0.0, first_heartbeat_estimate=1.0)
+        detector.reset(now=0.0)
+        for now in range(1, 20):
+            detector.heartbeat(now=float(now))
+        assert detector.is_available(now=20.0)
+        suspicions = [detector.suspicion(now=19.0 + silence) for silence in (0.5, 1.0, 1.5, 2.0)]
+        assert suspicions == sorted(suspicions)
+        assert not detector.is_available(now=21.5)
+
+    @staticmethod
+    def test_jittery_link_is_given_more_time():
+        rand = random.Random(0)
+        steady = PhiAccrualFailureDetector(acceptable_pause=0.0, first_heartbeat_estimate=1.0)
+        jittery = PhiAccrualFailureDetector(acceptable_pause=0.0, first_heartbeat_estimate=1.0)
+        steady.reset(now=0.0)
+        jittery.reset(now=0.0)
+        now = 0.0
+        for i in range(1, 100):
+            steady.heartbeat(now=float(i))
+            now += rand.uniform(0.2, 1.8)
+            jittery.heartbeat(now=now)
+        assert steady.suspicion(now=99.0 + 2.0) > jittery.suspicion(now=now + 2.0)
+        assert not steady.is_available(now=99.0 + 2.0)
+        assert jittery.is_available(now=now + 2.0)
+
+    @staticmethod
+    def test_other_messages_reset_the_silence():
+        detector = PhiAccrualFailureDetector(acceptable_pause=0.0, first_heartbeat_estimate=1.0)
+        detector.reset(now=0.0)
+        detector.heartbeat(now=1.0)
+        assert not detector.is_available(now=5.0)
+        detector.touch(now=5.0)
+        assert detector.is_available(now=5.0)
+        detector.reset(now=10.0)
+        assert detector.silence(now=10.5) == 0.5
+
+    @staticmethod
+    def test_liveness():
+        detector = LivenessFailureDetector(threshold=3, interval=1.0)
+        detector.reset(now=0.0)
+        detector.heartbeat(now=1.0)
+        assert detector.suspicion(now=2.5) == 1.5
+        assert detector.is_available(now=3.9)
+        assert not detector.is_available(now=4.0)
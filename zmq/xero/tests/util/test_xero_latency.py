@@ -0,0 +1,53 @@
+import logging
+import unittest
+
+from xero.util.xero_latency import LatencyHistogram, LatencyStats, RttEstimator
+
+logger = logging.getLogger(__name__)
+
+
+class TestXeroLatency(unittest.TestCase):
+
+    @staticmethod
+    def test_percentiles():
+        histogram = LatencyHistogram()
+        assert histogram.percentile(0.99) is None
+        for i in range(1, 101):
+            histogram.record(i / 1000.0)
+        # Within a bucket's width, 2^(1/8), of the exact value.
+        assert 0.050 <= histogram.percentile(0.5) <= 0.050 * 1.1
+        assert 0.099 <= histogram.percentile(0.99) <= 0.100
+        # Never beyond the longest duration recorded.
+        assert histogram.percentile(1.0) == 0.1
+
+    @staticmethod
+    def test_decay_follows_changes():
+        histogram = LatencyHistogram(window=100)
+        for _ in range(1000):
+            histogram.record(0.001)
+        for _ in range(100):
+            histogram.record(0.5)
+        # Older durations count for less and less, the slowdown shows well before it makes up 1% of all calls.
+        assert histogram.percentile(0.5) > 0.4
+        assert histogram.total == 1100
+
+    @staticmethod
+    def test_stats():
+        stats = LatencyStats()
+        assert stats.percentile('add', 0.99) is None
+        for _ in range(10):
+            stats.record('add', 0.002)
+        assert stats.percentile('add', 0.99, min_samples=20) is None
+        assert 0.002 <= stats.percentile('add', 0.99, min_samples=10) <= 0.0022
+        snapshot = stats.snapshot()
+        assert snapshot['add']['calls'] == 10 and snapshot['add']['p50'] == snapshot['add']['p99']
+
+    @staticmethod
+    def test_rtt_estimator():
+        estimator = RttEstimator()
+        assert estimator.rto() == 0.0
+        estimator.sample(0.010)
+        assert estimator.srtt == 0.010 and estimator.rto() == 0.030
+        for _ in range(100):
+            estimator.sample(0.002)
+        assert abs(estimator.srtt - 0.002) < 1e-6 and estimator.rto() < 0.003
@@ -1,10 +1,15 @@
-from datetime import datetime, timedelta
+from collections import namedtuple
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+import array
 import msgpack
 import logging
+import pytest
 import unittest
 from munch import Munch
 
-from xero.util.xero_serialization import XeroSerializer
+from xero.util.xero_serialization import XeroSerializer, XeroTypeRegistry, OutOfBand, EXT_USER_MIN, default_registry
+from xero.xero_constants import ZERO_COPY_THRESHOLD
 
 logger = logging.getLogger(__name__)
 
@@ -52,6 +57,96 @@ class TestXeroSerializer(unittest.TestCase):
         assert rebuilt_string == simple_string
 
 
+@dataclass
+class Point(object):
+    x: int
+    y: int
+
+
+Span = namedtuple('Span', ['start', 'length'])
+
+
+class Slotted(object):
+    __slots__ = ('name', 'when')
+
+    def __init__(self, name, when):
+        self.name = name
+        self.when = when
+
+    def __eq__(self, other):
+        return type(other) is Slotted and (self.name, self.when) == (other.name, other.when)
+
+
+class TestXeroTypeRegistry(unittest.TestCase):
+
+    @staticmethod
+    def test_builtin_types():
+        registry = XeroTypeRegistry()
+        payload = {
+            "naive": get_datetime_now(),
+            "aware": datetime(2020, 5, 17, 8, 30, tzinfo=timezone(timedelta(hours=-7))),
+            "delta": timedelta(days=-55, hours=20, minutes=35, seconds=20, milliseconds=50),
+            "plain": {"__type__": "not special", "nested": [1, 2.5, "three", b"four"]},
+        }
+        assert registry.unpackb(registry.packb(payload)) == payload
+
+        rebuilt_error = registry.unpackb(registry.packb(KeyError('missing')))
+        assert type(rebuilt_error) is KeyError
+        assert rebuilt_error.args == ('missing',)
+
+        # Far smaller than the old dict encoding.
+        assert len(registry.packb(payload["naive"])) < len(msgpack.packb(payload["naive"], default=XeroSerializer.encoder)) / 4
+
+    @staticmethod
+    def test_registered_classes():
+        registry = XeroTypeRegistry()
+        registry.register(Point, EXT_USER_MIN)
+        registry.register(Span, EXT_USER_MIN + 1)
+        registry.register(Slotted, EXT_USER_MIN + 2)
+        registry.register(complex, EXT_USER_MIN + 3,
+                          lambda obj: registry.packb([obj.real, obj.imag]),
+                          lambda data: complex(*registry.unpackb(data)))
+
+        payload = [Point(1, 2), Span(get_datetime_now(), timedelta(seconds=3)), Slotted('x', Point(3, 4)), 1 + 2j]
+        assert registry.unpackb(registry.packb(payload)) == payload
+
+    @staticmethod
+    def test_legacy_maps():
+        useful_datetime_dict = {
+            "id": 1,
+            "created": get_datetime_now(),
+        }
+        packed = msgpack.packb(useful_datetime_dict, default=XeroSerializer.encoder)
+        # Peers on the old encoding are understood out of the box.
+        assert default_registry.unpackb(packed) == useful_datetime_dict
+        assert XeroTypeRegistry().unpackb(packed) == useful_datetime_dict
+        assert XeroTypeRegistry(legacy_maps=False).unpackb(packed)['created']['__type__'] == 'datetime'
+
+    @staticmethod
+    def test_out_of_band_frames():
+        numpy = pytest.importorskip('numpy')
+        registry = XeroTypeRegistry()
+        big = numpy.arange(ZERO_COPY_THRESHOLD, dtype='<f8').reshape(-1, 16)
+        small = numpy.arange(10, dtype=numpy.int32)
+        payload = {'big': big, 'small': small, 'blob': OutOfBand(b'x' * 100), 'floats': array.array('d', [1.5, 2.5])}
+
+        frames = registry.pack_frames(payload, [big[::2]])
+        # Two bodies, then the big array, the blob, the array.array and the strided view as their own frames.
+        assert len(frames) == 6
+        assert len(frames[0]) < 200
+
+        rebuilt, [strided] = registry.unpack_frames([bytes(frame) for frame in frames], 2)
+        assert numpy.array_equal(rebuilt['big'], big) and rebuilt['big'].dtype == big.dtype
+        assert numpy.array_equal(rebuilt['small'], small)
+        assert numpy.array_equal(strided, big[::2])
+        assert bytes(rebuilt['blob']) == b'x' * 100
+        assert array.array('d', rebuilt['floats'].tobytes()) == payload['floats']
+
+        # Without pack_frames() everything is packed inline.
+        rebuilt = registry.unpackb(registry.packb(payload))
+        assert numpy.array_equal(rebuilt['big'], big)
+
+
 def get_datetime_now():
     # type: () -> datetime
     """
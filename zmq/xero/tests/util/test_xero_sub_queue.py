@@ -0,0 +1,78 @@
+import logging
+import time
+import unittest
+from queue import Empty, Full
+from threading import Thread
+import pytest
+
+from xero.util.xero_sub_queue import SubscriberQueue, OVERFLOW_BLOCK, OVERFLOW_DROP_NEWEST, OVERFLOW_DROP_OLDEST
+
+logger = logging.getLogger(__name__)
+
+
+class TestXeroSubQueue(unittest.TestCase):
+
+    @staticmethod
+    def test_drain():
+        queue = SubscriberQueue()
+        for i in range(10):
+            assert queue.put(i) is None
+        assert queue.drain(3) == [0, 1, 2]
+        assert queue.get() == 3
+        assert queue.drain() == list(range(4, 10))
+        assert queue.drain(timeout=0) == []
+        with pytest.raises(Empty):
+            queue.get(timeout=0.05)
+
+    @staticmethod
+    def test_drain_returns_once_something_arrived():
+        queue = SubscriberQueue()
+        Thread(target=lambda: (time.sleep(0.1), queue.put('late'))).start()
+        start = time.time()
+        assert queue.drain(timeout=5.0) == ['late']
+        assert time.time() - start < 1.0
+
+        # Items already waiting come back right away, without waiting out the timeout after the last one.
+        queue.put('waiting')
+        start = time.time()
+        assert queue.drain(timeout=5.0) == ['waiting']
+        assert time.time() - start < 0.1
+
+    @staticmethod
+    def test_drop_oldest():
+        queue = SubscriberQueue(3, OVERFLOW_DROP_OLDEST)
+        dropped = [queue.put(i) for i in range(5)]
+        assert dropped == [None, None, None, 0, 1]
+        assert queue.drain() == [2, 3, 4]
+        stats = queue.stats()
+        assert stats['dropped'] == 2 and stats['full_events'] == 2
+        assert stats['high_water'] == 3 and stats['size'] == 0
+
+    @staticmethod
+    def test_drop_newest():
+        queue = SubscriberQueue(3, OVERFLOW_DROP_NEWEST)
+        dropped = [queue.put(i) for i in range(5)]
+        assert dropped == [None, None, None, 3, 4]
+        assert queue.drain() == [0, 1, 2]
+        assert queue.stats()['dropped'] == 2
+
+    @staticmethod
+    def test_block():
+        queue = SubscriberQueue(2, OVERFLOW_BLOCK)
+        queue.put(0)
+        queue.put(1)
+        with pytest.raises(Full):
+            queue.put(2, timeout=0.05)
+
+        Thread(target=lambda: (time.sleep(0.1), queue.drain(1))).start()
+        queue.put(2, timeout=5.0)
+        assert queue.drain() == [1, 2]
+        stats = queue.stats()
+        assert stats['dropped'] == 0 and stats['full_events'] == 2
+
+    @staticmethod
+    def test_bad_settings():
+        with pytest.raises(ValueError):
+            SubscriberQueue(0)
+        with pytest.raises(ValueError):
+            SubscriberQueue(10, 'drop-everything')
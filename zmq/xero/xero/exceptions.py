@@ -1,3 +1,18 @@
 
 class LostRemoteError(RuntimeError):
     pass
+
+
+class BackpressureError(RuntimeError):
+    """
+    Raised by UniWorker.emit() when the client can't keep up with the emits and no more of them can be held back.
+    """
+    pass
+
+
+class UnknownMethodError(LookupError):
+    """
+    Raised by UniClient when none of the connected workers has the RPC method called, according to the method tables
+    they advertised.
+    """
+    pass
@@ -0,0 +1,312 @@
+import asyncio
+import logging
+from abc import ABCMeta
+import zmq
+import zmq.asyncio
+
+from xero.uni.uniclient import ReplyStream, UniClient
+from xero.util.xero_codecs import DEFAULT_CODECS
+from xero.util.xero_failure_detector import FailureDetector, PhiAccrualFailureDetector
+from xero.util.xero_sub_queue import OVERFLOW_BLOCK
+from xero.exceptions import LostRemoteError
+from xero.xero_constants import *
+
+try:
+    from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+except ImportError:
+    Any = None
+    List = None
+    Optional = None
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncUniClient(UniClient):
+    """
+    asyncio flavour of UniClient, built on zmq.asyncio.  Instead of running a private IOLoop in its own thread, the
+    client services its socket from tasks on the application's running event loop, and rpc() is a coroutine.
+    Everything here must be called from that loop's thread.
+    """
+
+    __metaclass__ = ABCMeta
+
+    def __init__(self, endpoint, context=None, max_in_flight=MAX_IN_FLIGHT, codecs=DEFAULT_CODECS, compression=None,
+                 compression_threshold=COMPRESSION_THRESHOLD, emit_credits=None, emit_endpoint=None, emit_hwm=EMIT_HWM,
+                 emit_conflate=False, emit_queue_size=None, emit_overflow=OVERFLOW_BLOCK,
+                 failure_detector=PhiAccrualFailureDetector):
+        # type: (str, zmq.Context, int, Sequence[str], Optional[str], int, Optional[int], Optional[str], int, bool, Optional[int], str, Callable[[], FailureDetector]) -> None
+        """
+        :param endpoint: ZeroMQ endpoint to bind to.
+        :param context: ZeroMQ Context, either a plain or a zmq.asyncio one.
+        :param max_in_flight: Maximum number of outstanding requests sent to any one worker.
+        :param codecs: Names of the codecs this client uses, see UniClient.
+        :param compression: Name of the compressor to use, or None not to compress.
+        :param compression_threshold: Frames smaller than this many bytes are sent uncompressed.
+        :param emit_credits: Emits each worker may have waiting, see UniClient.  None turns flow control off.
+        :param emit_endpoint: Endpoint to bind the emit data plane to, see UniClient.  None keeps emits on the ROUTER.
+        :param emit_hwm: High water mark of the data plane's sockets.
+        :param emit_conflate: Only keep the latest emit waiting on the data plane.
+        :param emit_queue_size: Most emits waiting in the queue of get_sub_message(), None for no limit.
+        :param emit_overflow: What happens to emits that find the queue full, see SubscriberQueue.  OVERFLOW_BLOCK
+            isn't available with a limit: blocking would stall the event loop the application takes emits on.
+        :param failure_detector: Creates the failure detector of each worker, see UniClient.
+        """
+        if emit_overflow == OVERFLOW_BLOCK and emit_queue_size is not None:
+            raise ValueError("AsyncUniClient can't block on a full emit queue")
+        self._socket = None  # type: Optional[zmq.asyncio.Socket]
+        self._emit_socket = None  # type: Optional[zmq.asyncio.Socket]
+        self._tasks = []  # type: List[asyncio.Task]
+        self._worker_registered = None  # type: Optional[asyncio.Event]
+        self._emit_arrived = None  # type: Optional[asyncio.Event]
+        super(AsyncUniClient, self).__init__(endpoint, context, max_in_flight, codecs, compression,
+                                             compression_threshold, emit_credits, emit_endpoint, emit_hwm,
+                                             emit_conflate, emit_queue_size, emit_overflow, failure_detector)
+
+    @staticmethod
+    def _async_context(context):
+        # type: (Optional[zmq.Context]) -> zmq.asyncio.Context
+        if context is None:
+            return zmq.asyncio.Context.instance()
+        if not isinstance(context, zmq.asyncio.Context):
+            return zmq.asyncio.Context.shadow(context.underlying)
+        return context
+
+    def _create_stream(self, endpoint, context):
+        # type: (str, Optional[zmq.Context]) -> None
+        """
+        Bind the ROUTER socket.  Receiving and heartbeats don't start until start() is called from the running loop.
+        """
+        context = self._async_context(context)
+        self._socket = context.socket(zmq.ROUTER)
+        self._socket.setsockopt(zmq.LINGER, 0)
+        self._socket.bind(endpoint)
+        # UniClient.shutdown() keys off of _stream; the asyncio socket doesn't need a stream wrapper.
+        self._stream = None
+
+    def _create_emit_stream(self, endpoint, context):
+        # type: (str, Optional[zmq.Context]) -> None
+        self._emit_socket = self._bind_emit_socket(endpoint, self._async_context(context))
+
+    def start(self):
+        # type: () -> None
+        """
+        Start receiving messages and checking heartbeats on the running event loop.
+        """
+        loop = asyncio.get_running_loop()
+        self._worker_registered = asyncio.Event()
+        self._emit_arrived = asyncio.Event()
+        self._tasks = [loop.create_task(self._recv_loop()), loop.create_task(self._heartbeat_loop())]
+        if self._emit_socket is not None:
+            self._tasks.append(loop.create_task(self._emit_recv_loop()))
+
+    async def run(self):
+        # type: () -> None
+        """
+        Start the client and wait until it is stopped.
+        """
+        self.start()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stop(self):
+        # type: () -> None
+        """
+        Stop servicing the socket.
+        """
+        self._keep_running = False
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def shutdown(self):
+        # type: () -> None
+        """
+        Stop the client and close the socket.  Any requests still waiting on a reply fail with LostRemoteError.
+        """
+        self.stop()
+        pending = []
+        with self._lock:
+            if self._socket is not None:
+                self._socket.close()
+                self._socket = None
+                pending = self._forget_workers()
+            if self._emit_socket is not None:
+                self._emit_socket.close()
+                self._emit_socket = None
+        self._fail_requests(pending, "Client was shut down.")
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+    async def wait_for_worker(self, timeout):
+        # type: (float) -> None
+        """
+        Wait for the client to establish a connection with at least one remote worker.
+        :param timeout: Max time, in seconds, to wait for the connection to establish.
+        """
+        while not self.is_connected():
+            self._worker_registered.clear()
+            try:
+                await asyncio.wait_for(self._worker_registered.wait(), timeout)
+            except asyncio.TimeoutError:
+                raise LostRemoteError("No worker is connected.")
+
+    async def rpc(self, method, args=None, kwargs=None, timeout=RPC_TIMEOUT, retries=0):
+        # type: (str, List[Any], Optional[Dict[str,Any]], Optional[float], int) -> Any
+        """
+        Call RPC 'method' on the least loaded worker.  If every worker already has max_in_flight requests outstanding,
+        the request waits its turn, counting that time against the timeout.
+        :param method: String indicating which remote method to call.
+        :param args: Arguments to provide to remote method.
+        :param kwargs: Key arguments to provide to remote method.
+        :param timeout: RPC call timeout, in seconds, of each try.  Use None for no timeout.
+        :param retries: How many more times to try the call, see UniClient.rpc().
+        """
+        return await self.rpc_nowait(method, args, kwargs, timeout, retries=retries)
+
+    async def get_sub_message(self, timeout=None, with_topic=False):
+        # type: (Optional[float], bool) -> Any
+        items = await self._drain(1, timeout)
+        if not items:
+            raise asyncio.TimeoutError()
+        worker_id, msg, topic = items[0]
+        self._return_emit_credit([worker_id])
+        return (topic, msg) if with_topic else msg
+
+    async def get_sub_messages(self, timeout=None, max_items=None, with_topic=False):
+        # type: (Optional[float], Optional[int], bool) -> List[Any]
+        """
+        Get every emitted message that is already waiting, or wait up to timeout for at least one.
+        :param timeout: Most seconds to wait, 0 not to wait, None to wait as long as it takes.
+        :param max_items: Most messages to return, None for all of them.
+        :param with_topic: Return (topic, message) pairs, see UniClient.get_sub_message().
+        """
+        items = await self._drain(max_items, timeout)
+        self._return_emit_credit([worker_id for worker_id, _, _ in items])
+        if with_topic:
+            return [(topic, msg) for _, msg, topic in items]
+        return [msg for _, msg, _ in items]
+
+    async def _drain(self, max_items, timeout):
+        # type: (Optional[int], Optional[float]) -> List[Tuple[bytes, Any, Optional[str]]]
+        """
+        Take waiting emits off the queue without blocking the loop, waiting up to timeout for one to come in.
+        """
+        items = self._q_sub_messages.drain(max_items, 0)
+        if not items and timeout != 0:
+            self._emit_arrived.clear()
+            try:
+                await asyncio.wait_for(self._emit_arrived.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+            items = self._q_sub_messages.drain(max_items, 0)
+        return items
+
+    def _queue_emit(self, worker_id, msg, topic=None):
+        # type: (bytes, Any, Optional[str]) -> None
+        super(AsyncUniClient, self)._queue_emit(worker_id, msg, topic)
+        self._emit_arrived.set()
+
+    def _register_worker(self, worker_id, methods=None, session=None):
+        # type: (bytes, Optional[List[str]], Optional[bytes]) -> None
+        super(AsyncUniClient, self)._register_worker(worker_id, methods, session)
+        self._worker_registered.set()
+
+    async def rpc_batch(self, calls, timeout=RPC_TIMEOUT, retries=0):
+        # type: (List[Tuple], Optional[float], int) -> List[Any]
+        """
+        Call many RPC methods on one worker with a single request, see UniClient.rpc_batch().
+        """
+        return await self.rpc_batch_nowait(calls, timeout, retries)
+
+    def rpc_nowait(self, method, args=None, kwargs=None, timeout=RPC_TIMEOUT, on_partial=None, retries=0):
+        # type: (str, List[Any], Optional[Dict[str,Any]], Optional[float], Optional[Callable[[Any], None]], int) -> asyncio.Future
+        """
+        Same as UniClient.rpc_nowait(), but the returned future is an asyncio one.
+        """
+        return super(AsyncUniClient, self).rpc_nowait(method, args, kwargs, timeout, on_partial, retries)
+
+    def rpc_stream(self, method, args=None, kwargs=None, timeout=RPC_TIMEOUT):
+        # type: (str, List[Any], Optional[Dict[str,Any]], Optional[float]) -> AsyncReplyStream
+        """
+        Same as UniClient.rpc_stream(), but the stream is iterated with 'async for'.
+        """
+        return super(AsyncUniClient, self).rpc_stream(method, args, kwargs, timeout)
+
+    def _create_reply_stream(self):
+        # type: () -> AsyncReplyStream
+        return AsyncReplyStream()
+
+    def _create_future(self):
+        # type: () -> asyncio.Future
+        return asyncio.get_running_loop().create_future()
+
+    def _call_later(self, delay, callback, *args):
+        # type: (float, Callable[..., None], Any) -> None
+        asyncio.get_running_loop().call_later(delay, callback, *args)
+
+    def _send(self, to_send):
+        # type: (List[bytes]) -> None
+        self._send_now(to_send)
+
+    def _send_now(self, to_send):
+        # type: (List[bytes]) -> None
+        # zmq.asyncio sends right away when the socket can take the message, otherwise the returned future finishes
+        # the send from the event loop.
+        self._socket.send_multipart(to_send, copy=False)
+
+    async def _recv_loop(self):
+        # type: () -> None
+        while self._keep_running:
+            frames = await self._socket.recv_multipart(copy=False)
+            try:
+                self._on_recv(frames)
+            except Exception:
+                logger.exception("Failed to process message from worker")
+
+    async def _emit_recv_loop(self):
+        # type: () -> None
+        while self._keep_running:
+            frames = await self._emit_socket.recv_multipart(copy=False)
+            try:
+                self._on_emit_recv(frames)
+            except Exception:
+                logger.exception("Failed to process emit from worker")
+
+    async def _heartbeat_loop(self):
+        # type: () -> None
+        while self._keep_running:
+            await asyncio.sleep(HB_INTERVAL / 1000.0)
+            self._heartbeat()
+
+
+class AsyncReplyStream(ReplyStream):
+    """
+    Asynchronous iterator over the partial replies of a call made with AsyncUniClient.rpc_stream().
+    """
+
+    def __init__(self):
+        # type: () -> None
+        super(AsyncReplyStream, self).__init__()
+        self._chunks = asyncio.Queue()  # type: asyncio.Queue[Tuple[bool, Any]]
+
+    # Only 'async for' works, a plain for would block the event loop the chunks arrive on.
+    __iter__ = None
+
+    def _put(self, item):
+        # type: (Tuple[bool, Any]) -> None
+        self._chunks.put_nowait(item)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        # type: () -> Any
+        partial, msg = await self._chunks.get()
+        if partial:
+            return msg
+        self._end()
+        raise StopAsyncIteration()
@@ -0,0 +1,298 @@
+import asyncio
+from concurrent.futures import Executor
+from contextvars import Context, copy_context
+import inspect
+import logging
+from abc import ABCMeta
+from threading import get_ident
+import zmq
+import zmq.asyncio
+
+from xero.uni.uniworker import UniWorker, BatchReply, BACKPRESSURE_BLOCK, _current_batch_slot
+from xero.util.xero_codecs import DEFAULT_CODECS
+from xero.util.xero_compression import DEFAULT_COMPRESSORS
+from xero.util.xero_failure_detector import FailureDetector, PhiAccrualFailureDetector
+from xero.exceptions import LostRemoteError
+from xero.xero_constants import *
+
+try:
+    from typing import Any, Callable, Dict, List, Optional, Sequence, Set
+except ImportError:
+    Any = None
+    List = None
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncUniWorker(UniWorker):
+    """
+    asyncio flavour of UniWorker, built on zmq.asyncio.  The worker services its socket from tasks on the application's
+    running event loop.  do_work() may be a coroutine function; each request it is called for then runs as its own
+    task, so many requests can be worked on concurrently, and send_reply() still addresses the right request.  do_work()
+    may also be an async generator function, whose chunks are streamed as partial replies from a task of their own.
+    Given a thread pool executor, do_work() is called on its threads, and the coroutines it returns are awaited back
+    on the event loop.
+    """
+
+    __metaclass__ = ABCMeta
+
+    def __init__(self, endpoint, context=None, codecs=DEFAULT_CODECS, compressors=DEFAULT_COMPRESSORS, executor=None,
+                 failure_detector=PhiAccrualFailureDetector):
+        # type: (str, zmq.Context, Sequence[str], Sequence[str], Optional[Executor], Callable[[], FailureDetector]) -> None
+        """
+        Initialize the worker.
+        :param endpoint: ZeroMQ endpoint to connect to.
+        :param context: ZeroMQ Context, either a plain or a zmq.asyncio one.
+        :param codecs: Names of the codecs this worker accepts, see UniWorker.
+        :param compressors: Names of the compressors this worker offers the client.
+        :param executor: Executor to work on requests with, see UniWorker.
+        :param failure_detector: Creates the failure detector of the client, see UniWorker.
+        """
+        if context is None:
+            context = zmq.asyncio.Context.instance()
+        elif not isinstance(context, zmq.asyncio.Context):
+            context = zmq.asyncio.Context.shadow(context.underlying)
+        self._socket = None  # type: Optional[zmq.asyncio.Socket]
+        self._tasks = []  # type: List[asyncio.Task]
+        self._work_tasks = set()  # type: Set[asyncio.Task]
+        self._emit_socket = None  # type: Optional[zmq.asyncio.Socket]
+        self._emit_task = None  # type: Optional[asyncio.Task]
+        self._loop = None  # type: Optional[asyncio.AbstractEventLoop]
+        super(AsyncUniWorker, self).__init__(endpoint, context, codecs, compressors, executor, failure_detector)
+
+    def _create_stream(self):
+        # type: () -> None
+        """
+        Connect the DEALER socket.  The ready message goes out once start() is called from the running loop.
+        """
+        self.on_log_event("uniworker.connect", "Trying to connect to client")
+        self._socket = self._context.socket(zmq.DEALER)
+        self._socket.setsockopt(zmq.LINGER, 0)
+        self._socket.connect(self._endpoint)
+
+    def start(self):
+        # type: () -> None
+        """
+        Announce ourselves to the client and start receiving requests on the running event loop.
+        """
+        loop = asyncio.get_running_loop()
+        self._loop = loop
+        self._loop_thread = get_ident()
+        self._send_ready()
+        self._tasks = [loop.create_task(self._recv_loop()), loop.create_task(self._tick_loop())]
+
+    async def run(self):
+        # type: () -> None
+        """
+        Start the worker and wait until it is stopped.
+        """
+        self.start()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stop(self):
+        # type: () -> None
+        """
+        Stop servicing the socket.  Requests that are still being worked on are cancelled.
+        """
+        self._keep_running = False
+        for task in self._tasks + list(self._work_tasks):
+            task.cancel()
+        self._tasks = []
+
+    def shutdown(self):
+        # type: () -> None
+        """
+        Stop the worker, tell the client we're leaving and close the socket.
+        """
+        self.stop()
+        with self._lock:
+            if self._socket is None:
+                return
+            self._close_emit_plane()
+            self._send_disconnect()
+            self._socket.close()
+            self._socket = None
+            self._need_handshake = True
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+    def set_emit_backpressure(self, policy, buffer_size=EMIT_BUFFER_SIZE, timeout=None):
+        # type: (str, int, Optional[float]) -> None
+        """
+        Same as UniWorker.set_emit_backpressure(), except that BACKPRESSURE_BLOCK isn't available: blocking would stall
+        the event loop that emit credit comes in on.
+        """
+        if policy == BACKPRESSURE_BLOCK:
+            raise ValueError("AsyncUniWorker can't block on emit credit")
+        super(AsyncUniWorker, self).set_emit_backpressure(policy, buffer_size, timeout)
+
+    async def wait_for_client(self, timeout):
+        # type: (float) -> None
+        """
+        Wait for the worker to establish a connection with the remote client.
+        :param timeout: Max time, in seconds, to wait for the connection to establish.
+        """
+        deadline = asyncio.get_running_loop().time() + timeout
+        while not self.is_connected():
+            if asyncio.get_running_loop().time() >= deadline:
+                raise LostRemoteError("No client is connected.")
+            await asyncio.sleep(0.01)
+
+    def _run_work(self, name, args, kwargs):
+        # type: (str, List[Any], Dict[Any,Any]) -> None
+        """
+        Call do_work(), and if it returned an awaitable, run that as a task.  The task copies the current context, so
+        the request ID send_reply() relies on travels with it.  With a thread pool executor, the task calls do_work()
+        on the executor.
+        """
+        if self._executor is not None and not self._executor_processes:
+            ret = self._work_in_executor(name, args, kwargs)
+        else:
+            ret = self._work(name, args, kwargs)
+            if inspect.isasyncgen(ret):
+                ret = self._stream_reply_async(ret)
+        if inspect.isawaitable(ret):
+            task = asyncio.ensure_future(ret)
+            self._work_tasks.add(task)
+            task.add_done_callback(self._on_work_done)
+
+    def _run_batch(self, batch, calls):
+        # type: (BatchReply, List[Any]) -> None
+        """
+        Run the calls of a batch request as a single task, which awaits each one before starting the next.
+        """
+        task = asyncio.ensure_future(self._work_batch_async(batch, calls))
+        self._work_tasks.add(task)
+        task.add_done_callback(self._on_work_done)
+
+    async def _work_batch_async(self, batch, calls):
+        # type: (BatchReply, List[Any]) -> None
+        for index, (name, args, kwargs) in enumerate(calls):
+            # The task runs in a context of its own, whatever is set here stays in it.
+            _current_batch_slot.set((batch, index))
+            if self._executor is not None and not self._executor_processes:
+                await self._work_in_executor(name, args, kwargs)
+                continue
+            ret = self._work(name, args, kwargs)
+            if inspect.isasyncgen(ret):
+                await self._stream_reply_async(ret)
+            elif inspect.isawaitable(ret):
+                await ret
+
+    async def _work_in_executor(self, name, args, kwargs):
+        # type: (str, List[Any], Dict[Any,Any]) -> None
+        """
+        Call do_work() on the executor, and await or stream whatever it returned back on the event loop.
+        """
+        ret = await self._loop.run_in_executor(self._executor, copy_context().run, self._work, name, args, kwargs)
+        if inspect.isasyncgen(ret):
+            await self._stream_reply_async(ret)
+        elif inspect.isawaitable(ret):
+            await ret
+
+    async def _stream_reply_async(self, generator):
+        # type: (Any) -> None
+        """
+        Same as UniWorker._stream_reply(), for async generators.  Async generators can't return a value, so the final
+        reply is None.
+        """
+        reply = self.bind_reply()
+        try:
+            async for chunk in generator:
+                reply(chunk, True)
+        except Exception as e:
+            logger.exception("Streaming handler raised an exception")
+            reply(e, False, True)
+            return
+        reply(None)
+
+    def do_work(self, name, args, kwargs):
+        # type: (str, List[Any], Dict[Any,Any]) -> Any
+        """
+        Same as UniWorker.do_work(), and registered coroutine methods reply with what they return once they're done.
+        """
+        ret = super(AsyncUniWorker, self).do_work(name, args, kwargs)
+        if inspect.iscoroutine(ret) and not self._rpc_methods[name].deferred:
+            return self._reply_when_done(name, ret)
+        return ret
+
+    async def _reply_when_done(self, name, coroutine):
+        # type: (str, Any) -> None
+        try:
+            result = await coroutine
+        except Exception as e:
+            self.on_work_exception(name, e)
+            return
+        self.send_reply(result)
+
+    def _on_work_done(self, task):
+        # type: (asyncio.Task) -> None
+        self._work_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("do_work raised an exception", exc_info=task.exception())
+
+    def _call_later(self, delay, callback, *args):
+        # type: (float, Callable[..., None], Any) -> None
+        asyncio.get_running_loop().call_later(delay, callback, *args)
+
+    def _send(self, to_send):
+        # type: (List[bytes]) -> None
+        if self._loop_thread in (None, get_ident()):
+            self._send_now(to_send)
+        else:
+            # Not in the caller's context, see UniWorker._send().
+            self._loop.call_soon_threadsafe(self._send_now, to_send, context=Context())
+
+    def _publish(self, to_send):
+        # type: (List[Any]) -> None
+        if self._emit_socket is None:
+            self._send_now(to_send, copy=False)
+        else:
+            self._emit_socket.send_multipart(self._emit_envelope(to_send), copy=False)
+
+    def _watch_emit_plane(self, socket):
+        # type: (zmq.asyncio.Socket) -> None
+        self._emit_socket = socket
+        self._emit_task = asyncio.get_running_loop().create_task(self._emit_plane_loop(socket))
+
+    def _close_emit_plane(self):
+        # type: () -> None
+        with self._emit_lock:
+            self._emit_plane_up = False
+        if self._emit_task is not None:
+            self._emit_task.cancel()
+            self._emit_task = None
+        if self._emit_socket is not None:
+            self._emit_socket.close()
+            self._emit_socket = None
+
+    async def _emit_plane_loop(self, socket):
+        # type: (zmq.asyncio.Socket) -> None
+        while True:
+            self._on_emit_subscription(await socket.recv_multipart())
+
+    def _send_now(self, to_send, copy=True, track=False):
+        # type: (List[bytes], bool, bool) -> None
+        # zmq.asyncio sends right away when the socket can take the message, otherwise the returned future finishes
+        # the send from the event loop.
+        self._socket.send_multipart(to_send, copy=copy, track=track)
+
+    async def _recv_loop(self):
+        # type: () -> None
+        while self._keep_running:
+            frames = await self._socket.recv_multipart(copy=False)
+            try:
+                self._on_recv(frames)
+            except Exception:
+                logger.exception("Failed to process message from client")
+
+    async def _tick_loop(self):
+        # type: () -> None
+        while self._keep_running:
+            await asyncio.sleep(HB_INTERVAL / 1000.0)
+            self._tick()
@@ -1,18 +1,32 @@
 import logging
-from queue import Queue, Empty
+from collections import Counter, deque
+from concurrent.futures import Future, TimeoutError
+import functools
+from itertools import count
+import os
+import random
+import struct
 from threading import Event, Lock
+from time import monotonic
 from abc import ABCMeta, abstractmethod
 import msgpack
 import zmq
 from tornado.ioloop import IOLoop, PeriodicCallback
 
 from zmq.eventloop.zmqstream import ZMQStream
-from xero.util.xero_serialization import XeroSerializer
-from xero.exceptions import LostRemoteError
+from xero.util.xero_cache import LruCache
+from xero.util.xero_codecs import Codec, CODEC_MSGPACK, DEFAULT_CODECS, check_codecs, codec_for_tag, get_codec
+from xero.util.xero_compression import Compression, CompressionStats, STATS_BATCH, STATS_EMIT, decompress_frames, \
+    get_compressor
+from xero.util.xero_failure_detector import FailureDetector, PhiAccrualFailureDetector
+from xero.util.xero_latency import LatencyStats, RttEstimator
+from xero.util.xero_serialization import default_registry, unwrap_frames
+from xero.util.xero_sub_queue import OVERFLOW_BLOCK, SubscriberQueue
+from xero.exceptions import LostRemoteError, UnknownMethodError
 from xero.xero_constants import *
 
 try:
-    from typing import Any, Dict, List, Optional, Tuple, Union
+    from typing import Any, Callable, Dict, FrozenSet, List, Optional, Sequence, Set, Tuple, Union
 except ImportError:
     Any = None
     List = None
@@ -25,35 +39,155 @@ logger = logging.getLogger(__name__)
 
 class UniClient(object):
     """
-    Implementation of "simple" ZeroMQ Paranoid Pirate communication scheme.  This class is the ROUTER, and performs the
-    "request" in RPC calls.  By design, only supports one remote worker (DEALER) in order to keep example simple.
-    Supports a very basic RPC interface, using MessagePack for encoding/decoding.
+    Implementation of the ZeroMQ Paranoid Pirate communication scheme.  This class is the ROUTER, and performs the
+    "request" in RPC calls.  Any number of remote workers (DEALERs) may connect; workers with spare capacity are kept
+    in a least-recently-used queue and each RPC call is routed to the least loaded of them.
+    Every request is tagged with a request ID so many calls, from many threads, can be in flight at once.
+    Supports a very basic RPC interface.  Messages are encoded with one of the codecs in xero.util.xero_codecs,
+    MessagePack by default, and set_method_codec() lets individual methods use another one.  With compression turned
+    on, large frames are compressed both ways, see xero.util.xero_compression.
+    Given an emit_endpoint, workers publish their emits to a SUB socket bound there, a data plane of its own with its
+    own queue limits, so a flood of emits never holds up replies and heartbeats on the ROUTER socket.
+    Workers that advertise their method table are called by method ID rather than name, and calls to methods none of
+    the connected workers has fail right away with UnknownMethodError.
+    Replies of methods declared with set_method_cache() are cached, so repeated calls are answered without a round
+    trip, until they expire or a worker invalidates them, see UniWorker.invalidate_cache().
+    Calls may be retried when they time out or their worker goes away, with exponential backoff and jitter.  Retries
+    carry the ID of the original request, which doubles as its idempotency key: a worker with a dedup table that
+    already replied to it sends the same reply again rather than working on it twice, see UniWorker.set_dedup_table().
+    With set_outbound_buffer(), calls made while no worker is connected wait for one rather than failing right away.
+    Heartbeats carry timestamps the workers echo back, which keeps an estimate of the round trip time to each of them,
+    and the service time of every call is recorded per method.  A timeout of RPC_TIMEOUT_AUTO derives the call's
+    deadline from both, see auto_timeout().
     """
 
     __metaclass__ = ABCMeta
 
-    def __init__(self, endpoint, context=None):
-        # type: (str, zmq.Context) -> None
+    def __init__(self, endpoint, context=None, max_in_flight=MAX_IN_FLIGHT, codecs=DEFAULT_CODECS, compression=None,
+                 compression_threshold=COMPRESSION_THRESHOLD, emit_credits=None, emit_endpoint=None, emit_hwm=EMIT_HWM,
+                 emit_conflate=False, emit_queue_size=None, emit_overflow=OVERFLOW_BLOCK,
+                 failure_detector=PhiAccrualFailureDetector):
+        # type: (str, zmq.Context, int, Sequence[str], Optional[str], int, Optional[int], Optional[str], int, bool, Optional[int], str, Callable[[], FailureDetector]) -> None
         """
         :param endpoint: ZeroMQ endpoint to bind to.
         :param context: ZeroMQ Context.
+        :param max_in_flight: Maximum number of outstanding requests sent to any one worker.
+        :param codecs: Names of the codecs this client uses, the first is the default for requests and emits.  Workers
+            that don't accept all of them are turned away.
+        :param compression: Name of the compressor used on every worker connection, or None not to compress.  Workers
+            that don't offer it are turned away.
+        :param compression_threshold: Frames smaller than this many bytes are sent uncompressed.
+        :param emit_credits: Turns on emit flow control: each worker may have this many emits waiting in the queue of
+            get_sub_message(), and is granted more as the application takes them.  None lets workers emit freely.
+        :param emit_endpoint: ZeroMQ endpoint to bind the emit data plane's SUB socket to, e.g. "tcp://*:5557".  Workers
+            are told to publish their emits there; None keeps emits on the ROUTER socket.
+        :param emit_hwm: High water mark of the data plane's sockets.  A worker's PUB socket drops emits beyond it,
+            keep it above emit_credits so flow control never has it drop any.
+        :param emit_conflate: Only keep the latest emit waiting on the data plane, for state updates where only the
+            newest one matters.  Can't be combined with emit_credits, as dropped emits never hand their credit back.
+        :param emit_queue_size: Most emits waiting in the queue of get_sub_message(), None for no limit.
+        :param emit_overflow: What happens to emits that find the queue full, see SubscriberQueue.  OVERFLOW_BLOCK
+            stops the IOLoop until the application takes some, holding up replies and heartbeats meanwhile; prefer
+            emit_credits, which keeps the queue from filling up in the first place.
+        :param failure_detector: Creates the failure detector that tells, from its heartbeats, when a worker went away,
+            one per worker.  See xero.util.xero_failure_detector, e.g. functools.partial(PhiAccrualFailureDetector,
+            threshold=12) to be more patient, or LivenessFailureDetector to give up after a fixed number of missed
+            heartbeats.
         """
-        self._q_received_messages = Queue()   # type: Queue[Any]
-        self._q_sub_messages = Queue()  # type: Queue[Any]
+        if emit_conflate and emit_endpoint is None:
+            raise ValueError("emit_conflate needs an emit_endpoint")
+        if emit_conflate and emit_credits is not None:
+            raise ValueError("Conflated emits can't be flow controlled")
+        # Emitted messages, as (worker ID, message) so taking them can hand credit back to their worker.
+        self._q_sub_messages = SubscriberQueue(emit_queue_size, emit_overflow)
+        self._emit_credits = emit_credits
+        # Credit is handed back half a window at a time, to keep credit messages few.
+        self._emit_credit_batch = max(emit_credits // 2, 1) if emit_credits is not None else None
+        # Topic prefixes of the emits we want, None for all of them.
+        self._subscriptions = None  # type: Optional[FrozenSet[str]]
+        # The emit data plane, see _create_emit_stream().
+        self._emit_hwm = emit_hwm
+        self._emit_conflate = emit_conflate
+        self._emit_endpoint = None  # type: Optional[str]
+        self._emit_stream = None  # type: Optional[ZMQStream]
         self._lock = Lock()
+        self._max_in_flight = max_in_flight
+        self._failure_detector = failure_detector
+        self._codecs = check_codecs(codecs)
+        self._codec = get_codec(self._codecs[0])
+        self._method_codecs = {}  # type: Dict[str, Codec]
+        # Cached final replies of the methods in _cached_methods, by encoded call, see set_method_cache().
+        self._response_cache = LruCache(RESPONSE_CACHE_BYTES)
+        self._cached_methods = {}  # type: Dict[str, Optional[float]]
+        # Bumped by every invalidation, so replies to calls sent before it aren't cached.
+        self._cache_epoch = 0
+        self._compression_stats = CompressionStats()
+        # Service times of the calls that got their final reply, per method, see auto_timeout().
+        self._latency_stats = LatencyStats()
+        self._compression = Compression(get_compressor(compression) if compression is not None else None,
+                                        compression_threshold, self._compression_stats)
+        # Session epoch, carried in heartbeats so workers notice on the first one that we restarted.  Request IDs start
+        # with it too, so they're unique across clients and restarts, and workers can tell retries by them.
+        self._session = os.urandom(8)
+        self._request_ids = count(1)
+        self._pending = {}  # type: Dict[bytes, PendingRequest]
+        # Requests backing off before being retried, by request ID.
+        self._retrying = {}  # type: Dict[bytes, PendingRequest]
+        # Requests waiting for a worker with spare capacity, oldest first.
+        self._backlog = deque()  # type: deque[PendingRequest]
+        # Most requests the backlog holds while no worker is connected, see set_outbound_buffer().
+        self._outbound_buffer = 0
 
+        self._workers = {}  # type: Dict[bytes, WorkerRep]
+        self._ready_workers = deque()  # type: deque[bytes]
+        # Encoded names of the methods the connected workers advertised, None while any worker didn't advertise any.
+        self._known_methods = None  # type: Optional[Set[bytes]]
+        self._connected_event = Event()
+        self._keep_running = True
+
+        self._create_stream(endpoint, context)
+        if emit_endpoint is not None:
+            self._create_emit_stream(emit_endpoint, context)
+
+    def _create_stream(self, endpoint, context):
+        # type: (str, Optional[zmq.Context]) -> None
+        """
+        Helper function to bind the ROUTER socket, wrap it in a ZMQStream and start the heartbeat timer.
+        """
         context = context or zmq.Context.instance()
         socket = context.socket(zmq.ROUTER)
         socket.bind(endpoint)
 
         self._stream = ZMQStream(socket, IOLoop())
-        self._stream.on_recv(self._on_message)
+        self._stream.on_recv(self._on_recv, copy=False)
 
-        self._worker_rep = None  # type: Optional[WorkerRep]
-        self._connected_event = Event()
         self._hb_check_timer = PeriodicCallback(self._heartbeat, HB_INTERVAL)
         self._hb_check_timer.start()
-        self._keep_running = True
+
+    def _create_emit_stream(self, endpoint, context):
+        # type: (str, Optional[zmq.Context]) -> None
+        """
+        Helper function to bind the emit data plane's SUB socket and wrap it in a ZMQStream on the same IOLoop.
+        """
+        self._emit_stream = ZMQStream(self._bind_emit_socket(endpoint, context or zmq.Context.instance()),
+                                      self._stream.io_loop)
+        self._emit_stream.on_recv(self._on_emit_recv, copy=False)
+
+    def _bind_emit_socket(self, endpoint, context):
+        # type: (str, zmq.Context) -> zmq.Socket
+        """
+        Bind the SUB socket workers publish their emits to, and remember where it ended up for the handshake.
+        """
+        socket = context.socket(zmq.SUB)
+        socket.setsockopt(zmq.LINGER, 0)
+        socket.setsockopt(zmq.RCVHWM, self._emit_hwm)
+        if self._emit_conflate:
+            socket.setsockopt(zmq.CONFLATE, 1)
+        # Workers already drop the emits we didn't subscribe to, see subscribe().
+        socket.setsockopt(zmq.SUBSCRIBE, b'')
+        socket.bind(endpoint)
+        self._emit_endpoint = socket.getsockopt_string(zmq.LAST_ENDPOINT)
+        return socket
 
     def run(self):
         # type: () -> None
@@ -80,20 +214,53 @@ class UniClient(object):
     def shutdown(self):
         # type: () -> None
         """
-        Shutdown the uniclient, stopping all timers and unbinding from the ZMQ socket.
+        Shutdown the uniclient, stopping all timers and unbinding from the ZMQ socket.  Any requests still waiting on
+        a reply fail with LostRemoteError.
         """
+        pending = []
         with self._lock:
             if self._stream is not None:
                 self._stream.on_recv(None)
                 self._stream.socket.setsockopt(zmq.LINGER, 0)
                 self._stream.close()
                 self._stream = None
-                self._worker_rep = None
+                pending = self._forget_workers()
+            if self._emit_stream is not None:
+                self._emit_stream.on_recv(None)
+                self._emit_stream.close()
+                self._emit_stream = None
+        self._fail_requests(pending, "Client was shut down.")
+
+    def _forget_workers(self):
+        # type: () -> List[PendingRequest]
+        """
+        Drop every registered worker and pending request.  Must be called with self._lock held.
+        :return: The requests that were still waiting on a reply.
+        """
+        self._workers.clear()
+        self._ready_workers.clear()
+        self._known_methods = None
+        self._backlog.clear()
+        self._connected_event.clear()
+        pending = list(self._pending.values()) + list(self._retrying.values())
+        self._pending.clear()
+        self._retrying.clear()
+        return pending
+
+    @staticmethod
+    def _fail_requests(pending, reason):
+        # type: (List[PendingRequest], str) -> None
+        """
+        Fail pending requests with LostRemoteError.  Call this without self._lock held.
+        """
+        for pending_request in pending:
+            if not pending_request.future.done():
+                pending_request.future.set_exception(LostRemoteError(reason))
 
     def wait_for_worker(self, timeout):
         # type: (float) -> None
         """
-        Wait for the client to establish a connection with the remote worker.
+        Wait for the client to establish a connection with at least one remote worker.
         Will return immediately if already connected.
         :param timeout: Max time, in seconds, to wait for the connection to establish.
         """
@@ -105,44 +272,484 @@ class UniClient(object):
         # type: () -> bool
         """
         Returns whether client is connected to a worker.
-        :return: A boolean flag to indicate whether a connection to the worker is established.
+        :return: A boolean flag to indicate whether a connection to at least one worker is established.
+        """
+        return len(self._workers) > 0
+
+    def worker_count(self):
+        # type: () -> int
+        """
+        Returns the number of workers currently registered with this client.
+        """
+        return len(self._workers)
+
+    def worker_suspicion(self):
+        # type: () -> Dict[bytes, float]
+        """
+        Returns how strongly each registered worker is suspected to have gone away, by worker ID, as its failure
+        detector tells from its heartbeats.  Workers are dropped once theirs reaches the detector's threshold.
+        """
+        with self._lock:
+            return {worker_id: worker_rep.failure_detector.suspicion()
+                    for worker_id, worker_rep in self._workers.items()}
+
+    def worker_rtt(self):
+        # type: () -> Dict[bytes, Optional[float]]
+        """
+        Returns the smoothed round trip time to each registered worker, in seconds, by worker ID, as measured with
+        heartbeats.  None for workers that didn't echo a heartbeat yet.
+        """
+        with self._lock:
+            return {worker_id: worker_rep.rtt.srtt for worker_id, worker_rep in self._workers.items()}
+
+    def latency_stats(self):
+        # type: () -> Dict[str, Dict[str, Any]]
+        """
+        Returns the service times of the calls made so far, per method, see LatencyStats.  The service time is the
+        time from sending a call to its final reply, less the round trip time to its worker.
+        """
+        return self._latency_stats.snapshot()
+
+    def auto_timeout(self, method):
+        # type: (str) -> float
         """
-        return self._worker_rep is not None
+        Returns the timeout, in seconds, that calls to method with a timeout of RPC_TIMEOUT_AUTO get:
+        AUTO_TIMEOUT_FACTOR times the 99th percentile of the method's service time, plus the smoothed round trip time
+        to the slowest worker and four times its variation, but at least AUTO_TIMEOUT_MIN.  RPC_TIMEOUT until
+        AUTO_TIMEOUT_MIN_SAMPLES calls to the method were observed.
+        """
+        service_time = self._latency_stats.percentile(method, AUTO_TIMEOUT_PERCENTILE, AUTO_TIMEOUT_MIN_SAMPLES)
+        if service_time is None:
+            return RPC_TIMEOUT
+        with self._lock:
+            rto = max([worker_rep.rtt.rto() for worker_rep in self._workers.values()] or [0.0])
+        return max(AUTO_TIMEOUT_FACTOR * service_time + rto, AUTO_TIMEOUT_MIN)
+
+    def _resolve_timeout(self, method, timeout):
+        # type: (str, Union[float, str, None]) -> Optional[float]
+        return self.auto_timeout(method) if timeout == RPC_TIMEOUT_AUTO else timeout
+
+    def compression_stats(self):
+        # type: () -> Dict[str, Dict[str, Any]]
+        """
+        Returns what compression achieved on the requests sent so far, per method, and the CPU time spent on
+        decompressing replies and emits.  See CompressionStats.
+        """
+        return self._compression_stats.snapshot()
+
+    def set_method_codec(self, method, codec):
+        # type: (str, Optional[str]) -> None
+        """
+        Encode calls to 'method' with another codec than the default, e.g. 'raw' for a method that takes and returns
+        payloads the application already serialized.  The worker replies in the same codec.
+        :param method: The RPC method.
+        :param codec: Name of one of this client's codecs, or None to go back to the default.
+        """
+        if codec is None:
+            self._method_codecs.pop(method, None)
+        elif codec not in self._codecs:
+            raise ValueError("Codec '{}' isn't one of this client's codecs {}".format(codec, self._codecs))
+        else:
+            self._method_codecs[method] = get_codec(codec)
 
-    def rpc(self, method, args=None, kwargs=None, timeout=RPC_TIMEOUT):
-        # type: (str, List[Any], Optional[Dict[str,Any]], Optional[float]) -> Any
+    def set_method_cache(self, method, cache=True, ttl=None):
+        # type: (str, bool, Optional[float]) -> None
         """
-        Call RPC 'method' on remote worker.
+        Cache the final replies to calls to 'method', for methods whose replies only change when their worker says so
+        with UniWorker.invalidate_cache().  Calls with arguments encoded the same way are answered from the cache
+        without a round trip.  Calls that take partial replies always go to a worker.
+        :param method: The RPC method.
+        :param cache: Whether to cache the method's replies, turning it off drops the ones already cached.
+        :param ttl: Seconds a cached reply stays valid, None until it's evicted or invalidated.
+        """
+        if cache:
+            self._cached_methods[method] = ttl
+        elif self._cached_methods.pop(method, False) is not False:
+            self.invalidate_cache(method)
+
+    def set_outbound_buffer(self, max_requests):
+        # type: (int) -> None
+        """
+        Hold requests made while no worker is connected, e.g. while the only worker reconnects, instead of failing them
+        with LostRemoteError right away.  They are sent in the order they were made once a worker connects, and fail
+        with LostRemoteError as soon as their timeout passes while they're held.  Requests being retried wait for a
+        worker whether or not holding is on, see rpc().
+        :param max_requests: Most requests held, the ones beyond it fail right away.  0 turns holding requests off.
+        """
+        if max_requests < 0:
+            raise ValueError("Outbound buffer size can't be negative, got {}".format(max_requests))
+        self._outbound_buffer = max_requests
+
+    def _can_hold(self):
+        # type: () -> bool
+        """
+        Whether a request can be held back until a worker connects.  Must be called with self._lock held.
+        """
+        return len(self._backlog) < self._outbound_buffer
+
+    def set_response_cache(self, max_bytes):
+        # type: (int) -> None
+        """
+        Limit the memory cached replies take up.  The least recently used ones are evicted to stay within it.
+        :param max_bytes: Most bytes of encoded calls and replies held, 0 turns caching off.
+        """
+        self._response_cache.set_max_bytes(max_bytes)
+
+    def response_cache_stats(self):
+        # type: () -> Dict[str, Any]
+        """
+        Returns the hits, misses, expirations and evictions of the cached replies, and the memory they take up.  See
+        LruCache.stats().
+        """
+        return self._response_cache.stats()
+
+    def invalidate_cache(self, method=None, args=None, kwargs=None):
+        # type: (Optional[str], Optional[List[Any]], Optional[Dict[str,Any]]) -> None
+        """
+        Drop cached replies, as workers have us do with UniWorker.invalidate_cache().  Replies to calls already on
+        their way aren't cached either.
+        :param method: The method whose replies to drop, None for all of them.
+        :param args: Arguments of the one call whose reply to drop.  None, along with kwargs, for all calls to method.
+        :param kwargs: Key arguments of the one call whose reply to drop.
+        """
+        cache_key = None
+        if method is not None and (args is not None or kwargs is not None):
+            try:
+                cache_key = self._cache_key(self._pack_call(method, args, kwargs))
+            except UnknownMethodError:
+                # No connected worker has it anymore, drop all of its replies.
+                pass
+        with self._lock:
+            self._cache_epoch += 1
+            if method is None:
+                self._response_cache.clear()
+            elif cache_key is None:
+                encoded_method = method.encode('utf-8')
+                self._response_cache.discard_if(lambda key: key[0] == encoded_method)
+            else:
+                self._response_cache.discard(cache_key)
+
+    @staticmethod
+    def _cache_key(msg):
+        # type: (List[Any]) -> Tuple[bytes, ...]
+        """
+        Key of a call in the response cache: its request frames, method name first.
+        """
+        return tuple(bytes(frame) for frame in msg)
+
+    def _cached_reply(self, method, cache_key):
+        # type: (str, Tuple[bytes, ...]) -> Tuple[bool, Any]
+        """
+        Look a call up in the response cache.
+        :return: Whether there was a reply cached, and the reply.  Each hit decodes a copy of its own.
+        """
+        payload = self._response_cache.get(cache_key)
+        if payload is None:
+            return False, None
+        try:
+            return True, self._decode(list(payload), method)
+        except (msgpack.OutOfData, msgpack.ExtraData):
+            return True, payload[1]
+
+    def _cache_reply(self, pending_request, payload):
+        # type: (PendingRequest, List[Any]) -> None
+        """
+        Keep the encoded final reply to a call of a cacheable method, unless cached replies were invalidated since the
+        call was sent.
+        """
+        # Copy what may be zero-copy views of the received frames.
+        payload = [bytes(frame) for frame in payload]
+        cache_key = pending_request.cache_key
+        size = sum(len(part) for part in cache_key) + sum(len(frame) for frame in payload)
+        with self._lock:
+            if pending_request.cache_epoch == self._cache_epoch:
+                self._response_cache.put(cache_key, payload, size, self._cached_methods.get(pending_request.method))
+
+    def rpc(self, method, args=None, kwargs=None, timeout=RPC_TIMEOUT, retries=0):
+        # type: (str, List[Any], Optional[Dict[str,Any]], Union[float, str, None], int) -> Any
+        """
+        Call RPC 'method' on the least loaded worker, blocking until the final reply arrives.  If every worker already
+        has max_in_flight requests outstanding, the request waits its turn, counting that time against the timeout.
+        Safe to call from many threads.
         :param method: String indicating which remote method to call.
         :param args: Arguments to provide to remote method.
         :param kwargs: Key arguments to provide to remote method.
-        :param timeout: RPC call timeout, in seconds.  Use None for no timeout.
+        :param timeout: RPC call timeout, in seconds, of each try.  Use None for no timeout, or RPC_TIMEOUT_AUTO to
+            derive it from the method's observed service times, see auto_timeout().
+        :param retries: How many more times to try the call if it times out or its worker goes away.  A worker with a
+            dedup table that already worked on the call replies the same again, so only the first try runs the method.
+            A retry that finds no worker connected waits for one for as long as the call may take in all, without
+            using up a try.
         """
-        data = [method.encode('utf-8'),
-                msgpack.packb([] if args is None else args, default=XeroSerializer.encoder),
-                msgpack.packb({} if kwargs is None else kwargs, default=XeroSerializer.encoder)]
-        self._request(data)
+        auto_timeout = timeout == RPC_TIMEOUT_AUTO
+        timeout = self._resolve_timeout(method, timeout)
+        msg = self._pack_call(method, args, kwargs)
+        cache_key = None
+        if method in self._cached_methods:
+            cache_key = self._cache_key(msg)
+            hit, reply = self._cached_reply(method, cache_key)
+            if hit:
+                return reply
+        pending_request = self._request(msg, timeout, cache_key=cache_key, retries=retries, auto_timeout=auto_timeout)
         try:
-            ret = self._q_received_messages.get(timeout=timeout)
-        except Empty:
-            self._unregister_worker()
-            raise LostRemoteError("Worker failed to reply to RPC call in time.")
-        return ret
-
-    def get_sub_message(self, timeout=None):
-        # type: (float) -> Any
-        return self._q_sub_messages.get(timeout=timeout)
-
-    def get_sub_messages(self, timeout=None):
-        # type: (float) -> List[Any]
-        ret = []
+            return pending_request.future.result(self._total_timeout(timeout, retries))
+        except TimeoutError:
+            # The IOLoop's own timer for this request should have fired by now, expire the request ourselves.
+            self._expire_request(pending_request.request_id)
+            return pending_request.future.result(0)
+
+    def rpc_nowait(self, method, args=None, kwargs=None, timeout=RPC_TIMEOUT, on_partial=None, retries=0):
+        # type: (str, List[Any], Optional[Dict[str,Any]], Union[float, str, None], Optional[Callable[[Any], None]], int) -> Future
+        """
+        Call RPC 'method' on the least loaded worker without waiting for the reply.  Safe to call from many threads.
+        :param method: String indicating which remote method to call.
+        :param args: Arguments to provide to remote method.
+        :param kwargs: Key arguments to provide to remote method.
+        :param timeout: RPC call timeout, in seconds, or RPC_TIMEOUT_AUTO, see rpc().  Use None for no timeout.
+        :param on_partial: Called from the IOLoop thread with each partial reply to this call.  When not given,
+            partial replies go to on_partial_message().
+        :param retries: How many more times to try the call, see rpc().
+        :return: A concurrent.futures.Future, completed from the IOLoop thread with the final reply, or failed with
+            LostRemoteError if the call times out or its worker goes away on every try.
+        """
+        auto_timeout = timeout == RPC_TIMEOUT_AUTO
+        timeout = self._resolve_timeout(method, timeout)
+        msg = self._pack_call(method, args, kwargs)
+        cache_key = None
+        if on_partial is None and method in self._cached_methods:
+            cache_key = self._cache_key(msg)
+            hit, reply = self._cached_reply(method, cache_key)
+            if hit:
+                future = self._create_future()
+                future.set_result(reply)
+                return future
+        return self._request(msg, timeout, on_partial, cache_key=cache_key, retries=retries,
+                             auto_timeout=auto_timeout).future
+
+    def rpc_stream(self, method, args=None, kwargs=None, timeout=RPC_TIMEOUT):
+        # type: (str, List[Any], Optional[Dict[str,Any]], Union[float, str, None]) -> ReplyStream
+        """
+        Call RPC 'method' and iterate over its partial replies as they arrive, e.g. the chunks a generator handler
+        yields, instead of waiting for the whole result.  Safe to call from many threads.
+        :param method: String indicating which remote method to call.
+        :param args: Arguments to provide to remote method.
+        :param kwargs: Key arguments to provide to remote method.
+        :param timeout: Timeout for the whole call, streaming included, in seconds, or RPC_TIMEOUT_AUTO, see rpc().
+            Use None for no timeout.
+        :return: A ReplyStream.  Iterating it raises LostRemoteError if the call times out or its worker goes away.
+        """
+        stream = self._create_reply_stream()
+        stream.attach(self.rpc_nowait(method, args, kwargs, timeout, stream.on_partial))
+        return stream
+
+    def _create_reply_stream(self):
+        # type: () -> ReplyStream
+        return ReplyStream()
+
+    def rpc_batch(self, calls, timeout=RPC_TIMEOUT, retries=0):
+        # type: (List[Tuple], Optional[float], int) -> List[Any]
+        """
+        Call many RPC methods on one worker with a single request.  The worker runs them in order and sends all their
+        results back in a single reply, so the per-message overhead is paid once for the whole batch.
+        Partial replies from the calls are not forwarded.
+        :param calls: Sequence of (method, args, kwargs) tuples, args and kwargs may be left off.
+        :param timeout: Timeout for the whole batch, in seconds.  Use None for no timeout.
+        :param retries: How many more times to try the batch, see rpc().
+        :return: List of each call's final reply, in the order of calls.
+        """
+        pending_request = self._request(self._pack_batch(calls), timeout, command=WORKER_BATCH_REQUEST, retries=retries)
         try:
-            while True:
-                ret.append(self._q_sub_messages.get(timeout=timeout))
-        except Empty:
-            # Out of entries.
-            pass
-        return ret
+            return pending_request.future.result(self._total_timeout(timeout, retries))
+        except TimeoutError:
+            self._expire_request(pending_request.request_id)
+            return pending_request.future.result(0)
+
+    def rpc_batch_nowait(self, calls, timeout=RPC_TIMEOUT, retries=0):
+        # type: (List[Tuple], Optional[float], int) -> Future
+        """
+        Non-blocking version of rpc_batch().
+        :return: A future completed with the list of each call's final reply.
+        """
+        return self._request(self._pack_batch(calls), timeout, command=WORKER_BATCH_REQUEST, retries=retries).future
+
+    @staticmethod
+    def _total_timeout(timeout, retries):
+        # type: (Optional[float], int) -> Optional[float]
+        """
+        Longest a call with retries may take: each try times out, and backs off as long as it may before the next.
+        """
+        if timeout is None:
+            return None
+        return timeout * (retries + 1) + RETRY_BACKOFF_MAX * retries
+
+    def _pack_batch(self, calls):
+        # type: (List[Tuple]) -> List[bytes]
+        """
+        Encode a vector of RPC calls into the single body of a batch request, using the default codec.
+        """
+        packed_calls = []
+        for call in calls:
+            # Unknown methods in a batch fail in their own slot on the worker, without failing the rest.
+            method = call[0]
+            args = call[1] if len(call) > 1 and call[1] is not None else []
+            kwargs = call[2] if len(call) > 2 and call[2] is not None else {}
+            packed_calls.append([method, args, kwargs])
+        return self._compression.compress(self._codec.tag, self._codec.encode(packed_calls), STATS_BATCH)
+
+    def _pack_call(self, method, args, kwargs):
+        # type: (str, Optional[List[Any]], Optional[Dict[str,Any]]) -> List[bytes]
+        """
+        Encode an RPC call into its request frames: method name, encoding, then the codec's frames for args and kwargs.
+        """
+        codec = self._method_codecs.get(method, self._codec)
+        frames = [method.encode('utf-8')]
+        self._check_method(frames[0], method)
+        frames.extend(self._compression.compress(
+            codec.tag, codec.encode_call([] if args is None else args, {} if kwargs is None else kwargs), method))
+        return frames
+
+    def _check_method(self, encoded_method, method):
+        # type: (bytes, str) -> None
+        """
+        Refuse calls to a method no connected worker advertised.
+        :raises UnknownMethodError: Every connected worker advertised its method table, and none has the method.
+        """
+        known_methods = self._known_methods
+        if known_methods is not None and encoded_method not in known_methods:
+            raise UnknownMethodError("No connected worker has method '{}'".format(method))
+
+    def _update_known_methods(self):
+        # type: () -> None
+        """
+        Gather the methods the connected workers advertised.  Must be called with self._lock held.
+        """
+        known_methods = set()  # type: Set[bytes]
+        for worker_rep in self._workers.values():
+            if worker_rep.method_ids is None:
+                self._known_methods = None
+                return
+            known_methods.update(worker_rep.method_ids)
+        self._known_methods = known_methods if self._workers else None
+
+    def _decode(self, message, method):
+        # type: (List[Any], str) -> Any
+        """
+        Decode the [encoding, frames...] payload of a reply or emit.
+        :param method: What the payload belongs to, for the compression stats.
+        :raises ValueError: The payload is in a codec this client doesn't use, or compressed with an unknown compressor.
+        """
+        codec = codec_for_tag(message[0], self._codecs)
+        return codec.decode(decompress_frames(message[0], message[1:], self._compression_stats, method))[0]
+
+    def get_sub_message(self, timeout=None, with_topic=False):
+        # type: (Optional[float], bool) -> Any
+        """
+        Get the next emitted message, waiting up to timeout for one.
+        :param timeout: Most seconds to wait, None to wait as long as it takes.
+        :param with_topic: Return (topic, message) rather than the message, the topic None for emits without one.
+        :raises queue.Empty: No message came in time.
+        """
+        worker_id, msg, topic = self._q_sub_messages.get(timeout=timeout)
+        self._return_emit_credit([worker_id])
+        return (topic, msg) if with_topic else msg
+
+    def get_sub_messages(self, timeout=None, max_items=None, with_topic=False):
+        # type: (Optional[float], Optional[int], bool) -> List[Any]
+        """
+        Get every emitted message that is already waiting, or wait up to timeout for at least one.
+        :param timeout: Most seconds to wait, 0 not to wait, None to wait as long as it takes.
+        :param max_items: Most messages to return, None for all of them.
+        :param with_topic: Return (topic, message) pairs, see get_sub_message().
+        """
+        items = self._q_sub_messages.drain(max_items, timeout)
+        self._return_emit_credit([worker_id for worker_id, _, _ in items])
+        if with_topic:
+            return [(topic, msg) for _, msg, topic in items]
+        return [msg for _, msg, _ in items]
+
+    def emit_queue_stats(self):
+        # type: () -> Dict[str, Any]
+        """
+        Returns the counters of the emit queue: how full it is and has been, and how many emits it dropped.  See
+        SubscriberQueue.stats().
+        """
+        return self._q_sub_messages.stats()
+
+    def _queue_emit(self, worker_id, msg, topic=None):
+        # type: (bytes, Any, Optional[str]) -> None
+        """
+        Queue up an emit for get_sub_message().
+        """
+        dropped = self._q_sub_messages.put((worker_id, msg, topic))
+        if dropped is not None:
+            # A dropped emit frees its worker's credit, just like one the application took.
+            self._return_emit_credit([dropped[0]])
+
+    def subscribe(self, prefix):
+        # type: (str) -> None
+        """
+        Receive the emits whose topic starts with prefix.  Until the first subscribe() every emit is received, after it
+        only those matching a subscribed prefix; emits without a topic only match ''.  Subscriptions are sent to the
+        workers, which drop unwanted emits before even encoding them.  Emits that were already on their way are
+        checked against the subscriptions on arrival.
+        :param prefix: Topic prefix, '' for every emit.
+        """
+        with self._lock:
+            # Replaced rather than changed, so the IOLoop thread can check emits against it without the lock.
+            self._subscriptions = (self._subscriptions or frozenset()) | {prefix}
+            self._send_subscriptions()
+
+    def unsubscribe(self, prefix):
+        # type: (str) -> None
+        """
+        Stop receiving the emits that only matched prefix, including those that were already on their way.
+        Unsubscribing from every prefix leaves no emit wanted.  Emits already waiting for get_sub_message() stay.
+        :param prefix: A prefix passed to subscribe() before.
+        """
+        with self._lock:
+            if self._subscriptions is None or prefix not in self._subscriptions:
+                return
+            self._subscriptions = self._subscriptions - {prefix}
+            self._send_subscriptions()
+
+    def _wants_topic(self, topic):
+        # type: (Optional[str]) -> bool
+        """
+        Whether an emit with topic matches the current subscriptions.
+        """
+        subscriptions = self._subscriptions
+        return subscriptions is None or (topic or '').startswith(tuple(subscriptions))
+
+    def _send_subscriptions(self):
+        # type: () -> None
+        """
+        Send the current subscriptions to every worker.  Must be called with self._lock held.
+        """
+        prefixes = default_registry.packb(sorted(self._subscriptions))
+        for worker_id in self._workers:
+            self._send([worker_id, UNI_CLIENT_HEADER, WORKER_SUBSCRIBE, prefixes])
+
+    def _return_emit_credit(self, worker_ids):
+        # type: (List[bytes]) -> None
+        """
+        With emit flow control on, grant the workers that sent the emits the application just took credit for as many
+        new ones.  Safe to call from any thread.
+        :param worker_ids: The worker of each emit taken.
+        """
+        if self._emit_credits is None or not worker_ids:
+            return
+        # Once the application caught up, hand back everything due, so an idle worker always has its whole window.
+        caught_up = self._q_sub_messages.empty()
+        with self._lock:
+            for worker_id, count in Counter(worker_ids).items():
+                worker_rep = self._workers.get(worker_id)
+                if worker_rep is None:
+                    continue
+                worker_rep.emit_credit_due += count
+                if worker_rep.emit_credit_due >= self._emit_credit_batch or caught_up:
+                    self._send([worker_id, UNI_CLIENT_HEADER, WORKER_CREDIT,
+                                struct.pack('!I', worker_rep.emit_credit_due)])
+                    worker_rep.emit_credit_due = 0
 
     def _on_reply_timeout(self):
         # type: () -> None
@@ -154,28 +761,267 @@ class UniClient(object):
         self._stream.io_loop.stop()
         self.on_timeout()
 
-    def _request(self, msg):
-        # type: (List[bytes]) -> None
+    def _try_acquire_worker(self):
+        # type: () -> Optional[WorkerRep]
+        """
+        Pick the worker with the fewest outstanding requests off the ready queue, preferring the least recently used
+        on ties.  Must be called with self._lock held.
+        :return: The worker the request should be routed to, or None if every worker is at capacity.
+        """
+        if not self._ready_workers:
+            return None
+
+        worker_id = min(self._ready_workers, key=lambda ready_id: self._workers[ready_id].in_flight)
+        self._ready_workers.remove(worker_id)
+        worker_rep = self._workers[worker_id]
+        worker_rep.in_flight += 1
+        if worker_rep.in_flight < self._max_in_flight:
+            self._ready_workers.append(worker_id)
+        return worker_rep
+
+    def _release_worker(self, worker_rep):
+        # type: (WorkerRep) -> None
+        """
+        Give back one request's worth of a worker's capacity, putting it on the back of the ready queue if it had none,
+        and hand it the next request that was waiting for capacity.  Must be called with self._lock held.
+        """
+        worker_rep.in_flight = max(worker_rep.in_flight - 1, 0)
+        if self._workers.get(worker_rep.id) is worker_rep and worker_rep.id not in self._ready_workers:
+            self._ready_workers.append(worker_rep.id)
+        self._dispatch_backlog()
+
+    def _dispatch_backlog(self):
+        # type: () -> None
+        """
+        Send requests that were waiting for a worker with capacity, oldest first.  Must be called with self._lock held.
+        """
+        while self._backlog:
+            worker_rep = self._try_acquire_worker()
+            if worker_rep is None:
+                return
+            self._send_request(worker_rep, self._backlog.popleft())
+
+    def _next_request_id(self):
+        # type: () -> bytes
+        """
+        Generate the ID that tags a request and its replies on the wire.  Must be called with self._lock held.
         """
-        Send msgpack encoded message via ZeroMQ.
+        return self._session + struct.pack('!Q', next(self._request_ids))
+
+    def _request(self, msg, timeout=None, on_partial=None, command=WORKER_REQUEST, cache_key=None, retries=0,
+                 auto_timeout=False):
+        # type: (List[bytes], Optional[float], Optional[Callable[[Any], None]], bytes, Optional[Tuple[bytes, ...]], int, bool) -> PendingRequest
+        """
+        Send msgpack encoded message via ZeroMQ to the least loaded worker, or queue it until a worker has capacity.
         :param msg: msgpack encoded message.
+        :param timeout: Seconds until the request expires, or None to wait forever.
+        :param on_partial: Per-call partial reply callback.
+        :param command: Request message type, WORKER_REQUEST or WORKER_BATCH_REQUEST.
+        :param cache_key: Key to cache the final reply under, for calls to cacheable methods.
+        :param retries: How many more times to try the request if it times out or its worker goes away.
+        :param auto_timeout: Whether timeout was derived with auto_timeout().
+        :return: The pending request, whose future completes when the final reply arrives.
+        """
+        with self._lock:
+            if not self._workers and not self._can_hold():
+                raise LostRemoteError("No worker is connected.")
+            pending_request = PendingRequest(self._next_request_id(), msg, self._create_future(), on_partial, command)
+            if cache_key is not None:
+                pending_request.cache_key = cache_key
+                pending_request.cache_epoch = self._cache_epoch
+            pending_request.timeout = timeout
+            pending_request.auto_timeout = auto_timeout
+            pending_request.retries = retries
+            total_timeout = self._total_timeout(timeout, retries)
+            if total_timeout is not None:
+                pending_request.deadline = monotonic() + total_timeout
+            self._try_request(pending_request)
+        return pending_request
+
+    def _try_request(self, pending_request):
+        # type: (PendingRequest) -> None
+        """
+        Send a request to the least loaded worker, or queue it until a worker has capacity, and time it out.  Must be
+        called with self._lock held.
+        """
+        self._pending[pending_request.request_id] = pending_request
+        if pending_request.timeout is not None:
+            self._start_request_timer(pending_request, pending_request.timeout)
+
+        worker_rep = self._try_acquire_worker()
+        if worker_rep is not None:
+            self._send_request(worker_rep, pending_request)
+        else:
+            self._backlog.append(pending_request)
+
+    def _send_request(self, worker_rep, pending_request):
+        # type: (WorkerRep, PendingRequest) -> None
+        """
+        Send a pending request out to an acquired worker.  Must be called with self._lock held.
+        :param worker_rep: Worker returned by _try_acquire_worker().
+        :param pending_request: The request to send.
         """
+        pending_request.worker_id = worker_rep.id
+        pending_request.sent_at = monotonic()
+        if pending_request.held:
+            # The try starts now that a worker connected.
+            pending_request.held = False
+            if pending_request.timeout is not None:
+                self._start_request_timer(pending_request, pending_request.timeout)
+        command = pending_request.command
+        msg = pending_request.msg
+        if command == WORKER_REQUEST and worker_rep.method_ids is not None:
+            method_id = worker_rep.method_ids.get(msg[0])
+            if method_id is not None:
+                # Call by method ID, the frames are shared with the pending request, which may be sent again.
+                command = WORKER_REQUEST_ID
+                msg = [method_id] + msg[1:]
+
         # prepare full message
+        to_send = [worker_rep.id]
+        to_send.extend([UNI_CLIENT_HEADER, command, pending_request.request_id])
+        to_send.extend(msg)
+        self._send(to_send)
+
+    def _start_request_timer(self, pending_request, delay):
+        # type: (PendingRequest, float) -> None
+        """
+        Expire a request after delay seconds, unless it's timed anew before.  Must be called with self._lock held.
+        """
+        pending_request.timer += 1
+        self._call_later(delay, self._expire_request, pending_request.request_id, pending_request.timer)
+
+    def _hold_request(self, pending_request):
+        # type: (PendingRequest) -> None
+        """
+        Have a backlogged request that's being retried wait for a worker to connect as long as its deadline allows,
+        rather than use up a try on there being no worker.  Must be called with self._lock held.
+        """
+        pending_request.held = True
+        if pending_request.deadline is not None:
+            self._start_request_timer(pending_request, max(pending_request.deadline - monotonic(), 0.0))
+
+    def _expire_request(self, request_id, timer=None):
+        # type: (bytes, Optional[int]) -> None
+        """
+        Retry or fail a request that ran out of time.  A worker that doesn't reply in time is considered lost, so it's
+        unregistered, unless the timeout was derived with auto_timeout(): that one is tight on purpose, so missing it
+        only says the call was slow, and whether the worker is lost is left to its failure detector.  Does nothing if
+        the request already completed.
+        :param request_id: ID of the request that timed out.
+        :param timer: The timer that fired, see PendingRequest.timer, None to fail the request without retrying it.
+        """
+        if timer is None:
+            # A request backing off before its next try isn't pending.
+            with self._lock:
+                backing_off = self._retrying.pop(request_id, None)
+            if backing_off is not None:
+                self._fail_requests([backing_off], "Worker failed to reply to RPC call in time.")
+                return
         with self._lock:
-            if self._worker_rep is not None:
-                to_send = [self._worker_rep.id]
-                to_send.extend([UNI_CLIENT_HEADER, WORKER_REQUEST])
-                to_send.extend(msg)
-
-                # OK, calling this in the callback is extremely important, so be careful about modifying it.
-                # All the other ZMQ message sends happen in the context of this thread, which means they work fine.
-                # However, this call will typically happen in the context of whatever thread communicates with this
-                # thread to issue RPC calls.  That means if you don't send the messages in the context of the callback,
-                # they won't get sent immediately-they'll get sent when the IOloop starts again.  This will look like
-                # really slow ZeroMQ sends.
-                self._stream.io_loop.add_callback(lambda x: self._stream.send_multipart(x), to_send)
+            pending_request = self._pending.get(request_id)
+            if pending_request is None or (timer is not None and timer != pending_request.timer):
+                # Completed, or timed anew since.
+                return
+            if (timer is not None and not pending_request.held and pending_request.worker_id is None and
+                    not self._workers and pending_request.retrying):
+                self._hold_request(pending_request)
+                return
+            del self._pending[request_id]
+            if pending_request.worker_id is None:
+                self._backlog.remove(pending_request)
+            connected = bool(self._workers)
+            if pending_request.worker_id is not None and pending_request.auto_timeout:
+                # The worker's late reply is discarded, so its slot is free from now on.
+                worker_rep = self._workers.get(pending_request.worker_id)
+                if worker_rep is not None:
+                    self._release_worker(worker_rep)
+        retry_or_fail = self._fail_requests if timer is None or pending_request.held else self._retry_requests
+        worker_id = pending_request.worker_id
+        if worker_id is None and not connected:
+            retry_or_fail([pending_request], "No worker connected before the RPC call timed out.")
+        elif worker_id is None:
+            retry_or_fail([pending_request], "No worker became idle before the RPC call timed out.")
+        else:
+            if pending_request.command == WORKER_REQUEST:
+                # The call took at least this long, recorded so automatic timeouts that turn out too short grow.
+                self._latency_stats.record(pending_request.method, monotonic() - pending_request.sent_at)
+            retry_or_fail([pending_request], "Worker failed to reply to RPC call in time.")
+            if not pending_request.auto_timeout:
+                self._unregister_worker(worker_id)
+
+    def _retry_requests(self, pending, reason):
+        # type: (List[PendingRequest], str) -> None
+        """
+        Try pending requests that didn't get their final reply again after backing off, and fail the ones out of
+        retries with LostRemoteError.  Call this without self._lock held.
+        """
+        failed = []
+        for pending_request in pending:
+            if pending_request.retries <= 0 or pending_request.future.done():
+                failed.append(pending_request)
+                continue
+            pending_request.retries -= 1
+            pending_request.attempt += 1
+            pending_request.worker_id = None
+            # Exponential backoff with full jitter, so clients that lost the same worker don't retry in lockstep.
+            delay = random.uniform(0, min(RETRY_BACKOFF * 2 ** (pending_request.attempt - 1), RETRY_BACKOFF_MAX))
+            with self._lock:
+                self._retrying[pending_request.request_id] = pending_request
+            self.on_log_event("request.retry", "{} Retrying in {:.3f}s.".format(reason, delay))
+            self._call_later(delay, self._retry_request, pending_request.request_id)
+        self._fail_requests(failed, reason)
+
+    def _retry_request(self, request_id):
+        # type: (bytes) -> None
+        """
+        Send a request that backed off again, under the same request ID.
+        """
+        with self._lock:
+            pending_request = self._retrying.pop(request_id, None)
+            if pending_request is None:
+                # Failed meanwhile, e.g. by shutdown().
+                return
+            if self._workers:
+                self._try_request(pending_request)
             else:
-                raise LostRemoteError("No worker is connected.")
+                self._pending[request_id] = pending_request
+                self._backlog.append(pending_request)
+                self._hold_request(pending_request)
+
+    def _create_future(self):
+        # type: () -> Future
+        """
+        Create the future a pending request's final reply is delivered through.
+        """
+        return Future()
+
+    def _call_later(self, delay, callback, *args):
+        # type: (float, Callable[..., None], Any) -> None
+        """
+        Run callback on the IOLoop after delay seconds.  Safe to call from any thread.
+        """
+        self._stream.io_loop.add_callback(lambda: self._stream.io_loop.call_later(delay, callback, *args))
+
+    def _send(self, to_send):
+        # type: (List[bytes]) -> None
+        """
+        Send a multipart message from any thread.
+        """
+        # OK, calling this in the callback is extremely important, so be careful about modifying it.
+        # All the other ZMQ message sends happen in the context of this thread, which means they work fine.
+        # However, this call will typically happen in the context of whatever thread communicates with this
+        # thread to issue RPC calls.  That means if you don't send the messages in the context of the callback,
+        # they won't get sent immediately-they'll get sent when the IOloop starts again.  This will look like
+        # really slow ZeroMQ sends.
+        self._stream.io_loop.add_callback(lambda x: self._stream.send_multipart(x, copy=False), to_send)
+
+    def _send_now(self, to_send):
+        # type: (List[bytes]) -> None
+        """
+        Send a multipart message immediately.  Only call this from the IOLoop's thread.
+        """
+        self._stream.send_multipart(to_send)
 
     def on_log_event(self, event, message):
         # type: (str, str) -> None
@@ -186,6 +1032,26 @@ class UniClient(object):
         """
         logger.debug(event + message)
 
+    def _on_recv(self, frames):
+        # type: (List[zmq.Frame]) -> None
+        """
+        Receive callback of the stream, which hands over zmq.Frames so large payloads aren't copied.
+        """
+        self._on_message(unwrap_frames(frames))
+
+    def _on_emit_recv(self, frames):
+        # type: (List[zmq.Frame]) -> None
+        """
+        Receive callback of the emit data plane, whose messages are laid out like emits on the ROUTER socket.
+        """
+        message = unwrap_frames(frames)
+        if self._emit_conflate:
+            message = default_registry.unpackb(message[0])
+        if len(message) < 2 or message[1] not in (WORKER_EMIT, WORKER_EMIT_BATCH):
+            logger.error("Received unexpected message on the emit data plane.")
+            return
+        self._on_message(message)
+
     def _on_message(self, message):
         # type: (List[bytes]) -> None
         """
@@ -199,9 +1065,11 @@ class UniClient(object):
         worker_cmds = {
             WORKER_READY: self._on_worker_ready,
             WORKER_PARTIAL_REPLY: self._on_worker_partial_reply,
-            WORKER_FINAL_REPLY: self._on_worker_final_reply,
+            WORKER_FINAL_REPLY: functools.partial(self._on_worker_final_reply, cacheable=True),
             WORKER_EXCEPTION: self._on_worker_final_reply,
+            WORKER_BATCH_REPLY: self._on_worker_final_reply,
             WORKER_EMIT: self._on_worker_emit,
+            WORKER_EMIT_BATCH: self._on_worker_emit_batch,
             WORKER_HEARTBEAT: self._on_worker_heartbeat,
             WORKER_DISCONNECT: self._on_worker_disconnect,
         }
@@ -215,13 +1083,61 @@ class UniClient(object):
         # type: (bytes, List[bytes]) -> None
         """
         This gets called when a worker tells us it's ready to receive messages.  This should be the first message we receive
-        from a new worker.
+        from a new worker.  The worker offers its settings, we answer with the ones picked for the connection.
         :param return_address: List of return addresses/Worker IDs.
         :param message: ZeroMQ message.
         :return:
         """
         worker_id = return_address
-        self._register_worker(worker_id)
+        offer = default_registry.unpackb(message[0]) if message else {}
+        settings = self._negotiate(worker_id, offer)
+        if settings is None:
+            self._send_now([worker_id, UNI_CLIENT_HEADER, WORKER_DISCONNECT])
+            return
+        session = offer.get('session')
+        with self._lock:
+            worker_rep = self._workers.get(worker_id)
+            restarted = worker_rep is not None and worker_rep.session != session
+        if restarted:
+            # Whatever the worker was working on went away with its previous session.
+            self._unregister_worker(worker_id)
+        self._send_now([worker_id, UNI_CLIENT_HEADER, WORKER_READY, default_registry.packb(settings)])
+        self._register_worker(worker_id, offer.get('methods'), session)
+
+    def _negotiate(self, worker_id, offer):
+        # type: (bytes, Dict[str, Any]) -> Optional[Dict[str, Any]]
+        """
+        Pick the connection settings out of what a worker offered in its ready message.  Workers that can't publish
+        their emits on a data plane keep sending them over the ROUTER socket.
+        :return: The settings to answer with, or None to turn the worker away.
+        """
+        # Workers that don't say otherwise only speak MessagePack.
+        worker_codecs = offer.get('codecs', [CODEC_MSGPACK])
+        missing = [name for name in self._codecs if name not in worker_codecs]
+        if missing:
+            self.on_log_event("worker.refuse", "Worker doesn't accept codecs {}.".format(missing))
+            logger.error("Turning away worker that doesn't accept codecs {}".format(missing))
+            return None
+        settings = {'codec': self._codec.name, 'session': self._session}  # type: Dict[str, Any]
+        compressor = self._compression.compressor
+        if compressor is not None:
+            if compressor.name not in offer.get('compressors', []):
+                self.on_log_event("worker.refuse", "Worker doesn't offer compressor '{}'.".format(compressor.name))
+                logger.error("Turning away worker that doesn't offer compressor '{}'".format(compressor.name))
+                return None
+            settings['compression'] = compressor.name
+            settings['compression_threshold'] = self._compression.threshold
+        if self._emit_credits is not None:
+            settings['emit_credits'] = self._emit_credits
+        if self._emit_endpoint is not None and offer.get('emit_plane'):
+            settings['emit_endpoint'] = self._emit_endpoint
+            settings['emit_hwm'] = self._emit_hwm
+            settings['emit_conflate'] = self._emit_conflate
+            settings['emit_id'] = worker_id
+        with self._lock:
+            if self._subscriptions is not None:
+                settings['subscriptions'] = sorted(self._subscriptions)
+        return settings
 
     def _on_worker_partial_reply(self, return_address, message):
         # type: (bytes, List[bytes]) -> None
@@ -230,68 +1146,159 @@ class UniClient(object):
         :param return_address: Worker ZMQ ID.
         :param message: The worker's reply message.
         """
-        message.pop(0)
+        request_id = message.pop(0)
+        pending_request = self._pending.get(request_id)
         try:
-            msg = msgpack.unpackb(message[0], raw=False)
+            msg = self._decode(message, pending_request.method if pending_request is not None else None)
         except (msgpack.OutOfData, msgpack.ExtraData):
-            msg = message[0]
-        self.on_partial_message(msg)
+            msg = message[1]
+        except ValueError:
+            logger.exception("Can't decode partial reply, discarding")
+            return
+        if pending_request is not None and pending_request.on_partial is not None:
+            pending_request.on_partial(msg)
+        else:
+            self.on_partial_message(msg)
 
-    def _on_worker_final_reply(self, return_address, message):
-        # type: (bytes, List[bytes]) -> None
+    def _on_worker_final_reply(self, return_address, message, cacheable=False):
+        # type: (bytes, List[bytes], bool) -> None
         """
-        Process a received worker's ZMQ final reply.  It will be forwarded to the requesting client.
+        Process a received worker's ZMQ final reply.  It will be forwarded to the requesting client, and the worker
+        goes back onto the ready queue.
         :param return_address: Worker ZMQ ID.
         :param message: The worker's reply message.
+        :param cacheable: The reply is a result rather than an exception or batch, which may go in the response cache.
         """
 
+        request_id = message.pop(0)
         with self._lock:
-            if self._worker_rep is None or return_address != self._worker_rep.id:
+            worker_rep = self._workers.get(return_address)
+            if worker_rep is None:
                 logger.info("Got final reply from unknown worker, discarding")
+                self._ask_to_reconnect(return_address)
                 return
 
-            if return_address == self._worker_rep.id:
-                self._worker_rep.on_heartbeat()
+            worker_rep.on_message()
+            pending_request = self._pending.pop(request_id, None)
+            if pending_request is None:
+                # Most likely the reply to a call that already timed out.
+                logger.info("Got final reply to unknown request, discarding")
+                return
+            self._release_worker(worker_rep)
+            srtt = worker_rep.rtt.srtt
+        if pending_request.command == WORKER_REQUEST:
+            self._latency_stats.record(pending_request.method,
+                                       max(monotonic() - pending_request.sent_at - (srtt or 0.0), 0.0))
 
-        message.pop(0)
         try:
-            msg = msgpack.unpackb(message[0], object_hook=XeroSerializer.decoder, raw=False)
+            msg = self._decode(message, pending_request.method)
         except (msgpack.OutOfData, msgpack.ExtraData):
-            msg = message[0]
-        self._q_received_messages.put_nowait(msg)
+            msg = message[1]
+        except ValueError as e:
+            if not pending_request.future.done():
+                pending_request.future.set_exception(e)
+            return
+        if cacheable and pending_request.cache_key is not None:
+            self._cache_reply(pending_request, message)
+        if not pending_request.future.done():
+            pending_request.future.set_result(msg)
 
     def _on_worker_emit(self, return_address, message):
         # type: (bytes, List[bytes]) -> None
 
-        with self._lock:
-            if self._worker_rep is not None:
-                ret_id = return_address
-                if ret_id == self._worker_rep.id:
-                    self._worker_rep.on_heartbeat()
-                else:
-                    logger.error("Received heartbeat message from unknown worker.")
+        self._on_worker_heartbeat(return_address, [], heartbeat=False)
 
-        message.pop(0)
+        marker = message.pop(0)
+        if marker == EMIT_INVALIDATE_CACHE:
+            self._on_cache_invalidation(message)
+            return
+        # Otherwise the marker frame holds the emit's topic, empty for none.
+        topic = str(marker, 'utf-8') if marker else None
+        if not self._wants_topic(topic):
+            # Sent before the worker learned of an unsubscribe().
+            self._return_emit_credit([return_address])
+            return
         try:
-            msg = msgpack.unpackb(message[0], object_hook=XeroSerializer.decoder, raw=False)
+            msg = self._decode(message, STATS_EMIT)
         except (msgpack.OutOfData, msgpack.ExtraData):
-            msg = message[0]
-        self._q_sub_messages.put(msg)
+            msg = message[1]
+        except ValueError:
+            logger.exception("Can't decode emitted message, discarding")
+            return
+        self._queue_emit(return_address, msg, topic)
 
-    def _on_worker_heartbeat(self, return_address, message):
+    def _on_cache_invalidation(self, message):
+        # type: (List[bytes]) -> None
+        """
+        Process a worker's invalidation of cached replies, see UniWorker.invalidate_cache().
+        :param message: [[method, args, kwargs]], packed.
+        """
+        try:
+            method, args, kwargs = default_registry.unpackb(message[0])
+        except Exception:
+            logger.exception("Can't decode cache invalidation, dropping the whole response cache")
+            method, args, kwargs = None, None, None
+        self.invalidate_cache(method, args, kwargs)
+
+    def _on_worker_emit_batch(self, return_address, message):
         # type: (bytes, List[bytes]) -> None
         """
-        Process worker ZMQ heartbeat message.
+        Process a message holding many coalesced emits, which are queued up in the order they were emitted.
+        """
+        self._on_worker_heartbeat(return_address, [], heartbeat=False)
+
+        packed_topics = message.pop(0)
+        try:
+            msgs = self._decode(message, STATS_EMIT)
+            topics = default_registry.unpackb(packed_topics) if packed_topics else [None] * len(msgs)
+        except ValueError:
+            logger.exception("Can't decode emitted messages, discarding")
+            return
+        unwanted = []
+        for msg, topic in zip(msgs, topics):
+            if self._wants_topic(topic):
+                self._queue_emit(return_address, msg, topic)
+            else:
+                unwanted.append(return_address)
+        self._return_emit_credit(unwanted)
+
+    def _on_worker_heartbeat(self, return_address, message, heartbeat=True):
+        # type: (bytes, List[bytes], bool) -> None
+        """
+        Process worker ZMQ heartbeat message.  A worker we don't know, e.g. because we restarted, or whose session
+        changed is asked to shake hands again right away.
         :param return_address: Worker ZMQ ID.
-        :param message: Heartbeat message is only the header, so unused.
+        :param message: [worker session, echoed timestamp, seconds the worker held it], empty from workers that don't
+            send a session, and without the timestamp from those that don't echo one.
+        :param heartbeat: Whether the message is a heartbeat, which the worker's failure detector learns the pace of,
+            rather than any other message that shows the worker is there.
         """
         with self._lock:
-            if self._worker_rep is not None:
-                ret_id = return_address
-                if ret_id == self._worker_rep.id:
-                    self._worker_rep.on_heartbeat()
+            worker_rep = self._workers.get(return_address)
+            restarted = (worker_rep is not None and worker_rep.session is not None and bool(message) and
+                         message[0] != worker_rep.session)
+            if worker_rep is not None and not restarted:
+                if len(message) >= 3:
+                    sent_at, held = struct.unpack('!d', message[1])[0], struct.unpack('!d', message[2])[0]
+                    worker_rep.on_rtt(monotonic() - sent_at - held)
+                if heartbeat:
+                    worker_rep.on_heartbeat()
                 else:
-                    logger.error("Received heartbeat message from unknown worker.")
+                    worker_rep.on_message()
+                return
+        if restarted:
+            self._unregister_worker(return_address)
+        else:
+            logger.info("Received heartbeat message from unknown worker.")
+        self._ask_to_reconnect(return_address)
+
+    def _ask_to_reconnect(self, worker_id):
+        # type: (bytes) -> None
+        """
+        Have a worker send its ready message now rather than once its heartbeats time out: heartbeat it with a session
+        it doesn't have.  Only call this from the IOLoop's thread.
+        """
+        self._send_now([worker_id, UNI_CLIENT_HEADER, WORKER_HEARTBEAT, self._session, b''])
 
     def _on_worker_disconnect(self, return_address, message):
         # type: (bytes, List[bytes]) -> None
@@ -306,44 +1313,97 @@ class UniClient(object):
     def _heartbeat(self):
         # type: () -> None
         """
-        This gets called periodically.  Check for dead worker and remove.
+        This gets called periodically.  Check every worker's liveness, remove dead ones and heartbeat the rest.
         """
+        dead_workers = []
         with self._lock:
-            if self._worker_rep is not None:
-                self._worker_rep.curr_liveness -= 1
-                if not self._worker_rep.is_alive():
-                    self._worker_rep = None
-                    self.on_log_event("worker.unregister", "Worker disconnected.")
+            for worker_rep in list(self._workers.values()):
+                if not worker_rep.is_alive():
+                    dead_workers.append(worker_rep.id)
                 else:
-                    msg = [self._worker_rep.id, UNI_CLIENT_HEADER, WORKER_HEARTBEAT]
+                    # The worker echoes the timestamp back in its next heartbeat, to measure the round trip time by.
+                    msg = [worker_rep.id, UNI_CLIENT_HEADER, WORKER_HEARTBEAT, self._session, worker_rep.session or b'',
+                           struct.pack('!d', monotonic())]
                     logger.debug("Client Sending heartbeat")
-                    self._stream.send_multipart(msg)
+                    self._send_now(msg)
+        for worker_id in dead_workers:
+            self._unregister_worker(worker_id)
 
-    def _register_worker(self, worker_id):
-        # type: (bytes) -> None
+    def _register_worker(self, worker_id, methods=None, session=None):
+        # type: (bytes, Optional[List[str]], Optional[bytes]) -> None
         """
-        Register a worker and associate with a service.
+        Register a worker and put it on the ready queue.
         :param worker_id: The ID of the worker to register.
+        :param methods: The worker's method table, method names by ID, if it advertised one.
+        :param session: The worker's session epoch, if it sent one.
         """
         logger.info("_register_worker")
-        if self._worker_rep is None:
-            self._worker_rep = WorkerRep(worker_id)
+        method_ids = None
+        if methods is not None:
+            method_ids = {name.encode('utf-8'): struct.pack('!H', method_id) for method_id, name in enumerate(methods)}
+        with self._lock:
+            worker_rep = self._workers.get(worker_id)
+            if worker_rep is not None:
+                # The worker lost track of us and re-sent its ready message; treat it as any message.  The handshake
+                # answer gave it a fresh emit credit window.  It's still in the same session, so the invalidations it
+                # sent reached us and the response cache stays valid.
+                worker_rep.on_message()
+                worker_rep.emit_credit_due = 0
+                worker_rep.method_ids = method_ids
+                self._update_known_methods()
+                return
+            # A new worker, or one that restarted, may have missed telling us about changes while it wasn't connected.
+            self._cache_epoch += 1
+            self._response_cache.clear()
+            worker_rep = WorkerRep(worker_id, self._failure_detector())
+            worker_rep.method_ids = method_ids
+            worker_rep.session = session
+            self._workers[worker_id] = worker_rep
+            self._update_known_methods()
+            self._ready_workers.append(worker_id)
+            self._dispatch_backlog()
             self._connected_event.set()
-            self.on_log_event("worker.register", "Worker for '{}' is connected.".format(worker_id))
-        else:
-            logger.warning("Received a worker registration message when another worker is already registered.")
+        self.on_log_event("worker.register", "Worker for '{}' is connected.".format(worker_id))
 
-    def _unregister_worker(self, worker_id=None):
+    def _unregister_worker(self, worker_id):
         # type: (bytes) -> None
         """
-        Unregister a worker.
+        Unregister a worker, removing it from the worker pool and the ready queue.  Requests still outstanding on the
+        worker fail with LostRemoteError.
+        :param worker_id: The ID of the worker to unregister.
         """
         with self._lock:
-            if worker_id is None or self._worker_rep is not None and worker_id == self._worker_rep.id:
-                self._worker_rep = None
+            if self._workers.pop(worker_id, None) is None:
+                return
+            self._update_known_methods()
+            lost_requests = [pending_request for pending_request in self._pending.values()
+                             if pending_request.worker_id == worker_id]
+            for pending_request in lost_requests:
+                del self._pending[pending_request.request_id]
+            try:
+                self._ready_workers.remove(worker_id)
+            except ValueError:
+                # Worker was busy with a request.
+                pass
+            stranded_requests = []
+            if not self._workers:
                 self._connected_event.clear()
+                # Nothing is left to service the backlog, beyond what may be held until a worker connects.  Requests
+                # being retried wait for one as long as their deadline allows, see _hold_request().
+                held = 0
+                for pending_request in list(self._backlog):
+                    if pending_request.retrying:
+                        continue
+                    if held < self._outbound_buffer:
+                        held += 1
+                        continue
+                    self._backlog.remove(pending_request)
+                    del self._pending[pending_request.request_id]
+                    stranded_requests.append(pending_request)
 
-        self.on_log_event("worker.unregister", "Worker disconnected.")
+        self._retry_requests(lost_requests, "Worker disconnected before replying to RPC call.")
+        self._retry_requests(stranded_requests, "No worker is connected.")
+        self.on_log_event("worker.unregister", "Worker '{}' disconnected.".format(worker_id))
 
     def _start_reply_timeout(self, timeout):
         # type: (float) -> None
@@ -393,23 +1453,43 @@ class UniClient(object):
 
 class WorkerRep(object):
     """
-    Helper class to represent the connected worker.
+    Helper class to represent a connected worker.
     """
 
-    def __init__(self, worker_id):
-        # type: (bytes) -> None
+    def __init__(self, worker_id, failure_detector=None):
+        # type: (bytes, Optional[FailureDetector]) -> None
         self.id = worker_id
-        self.curr_liveness = HB_LIVENESS
+        self.failure_detector = failure_detector if failure_detector is not None else PhiAccrualFailureDetector()
+        self.in_flight = 0
+        # Emits the application took, that the worker wasn't granted new credit for yet.
+        self.emit_credit_due = 0
+        # Encoded method name to packed method ID, for workers that advertised their method table.
+        self.method_ids = None  # type: Optional[Dict[bytes, bytes]]
+        # Session epoch the worker shook hands with, for workers that send one.
+        self.session = None  # type: Optional[bytes]
+        self.rtt = RttEstimator()
 
     def on_heartbeat(self):
         # type: () -> None
         """
         Called when a heartbeat message from the worker was received.
         """
-        if self.is_alive():
-            self.curr_liveness = HB_LIVENESS
-        else:
-            logger.warning("Received heartbeat from dead worker")
+        self.failure_detector.heartbeat()
+
+    def on_message(self):
+        # type: () -> None
+        """
+        Called when any other message from the worker was received.
+        """
+        self.failure_detector.touch()
+
+    def on_rtt(self, rtt):
+        # type: (float) -> None
+        """
+        Called with a round trip time measured with a heartbeat the worker echoed.
+        """
+        if rtt >= 0.0:
+            self.rtt.sample(rtt)
 
     def is_alive(self):
         # type: () -> bool
@@ -417,5 +1497,106 @@ class WorkerRep(object):
         Returns True when the worker is considered alive.
         :return: True if worker alive, otherwise false.
         """
-        return self.curr_liveness > 0
+        return self.failure_detector.is_available()
+
+
+class PendingRequest(object):
+    """
+    Helper class to represent a request that is waiting on its final reply.
+    """
+
+    def __init__(self, request_id, msg, future, on_partial=None, command=WORKER_REQUEST):
+        # type: (bytes, List[bytes], Future, Optional[Callable[[Any], None]], bytes) -> None
+        self.request_id = request_id
+        self.msg = msg
+        self.command = command
+        self.future = future
+        self.on_partial = on_partial
+        self.worker_id = None  # type: Optional[bytes]
+        # Seconds each try may take, how many more tries are left, and the number of the current one.
+        self.timeout = None  # type: Optional[float]
+        # Whether the timeout was derived with UniClient.auto_timeout().
+        self.auto_timeout = False
+        self.retries = 0
+        self.attempt = 0
+        # When every try, and the backoff between them, is up, None without a timeout.
+        self.deadline = None  # type: Optional[float]
+        # Number of the timer timing the request, earlier ones fire to no effect.
+        self.timer = 0
+        # Whether the request waits for a worker to connect, see UniClient._hold_request().
+        self.held = False
+        # When the current try was sent to a worker.
+        self.sent_at = 0.0
+        # Where to cache the final reply, and the response cache epoch the request was sent in.
+        self.cache_key = None  # type: Optional[Tuple[bytes, ...]]
+        self.cache_epoch = None  # type: Optional[int]
+
+    @property
+    def retrying(self):
+        # type: () -> bool
+        """
+        Whether the request is a retry, or may be retried.
+        """
+        return self.attempt > 0 or self.retries > 0
+
+    @property
+    def method(self):
+        # type: () -> str
+        """
+        The method called, taken from the request's first frame.
+        """
+        if self.command == WORKER_BATCH_REQUEST:
+            return STATS_BATCH
+        return str(self.msg[0], 'utf-8')
+
+
+class ReplyStream(object):
+    """
+    Iterator over the partial replies of a call made with rpc_stream(), yielding them as they arrive.  Iteration stops
+    when the final reply comes in, which is then available as result.
+    """
+
+    def __init__(self):
+        # type: () -> None
+        self.result = None  # type: Any
+        self._chunks = SubscriberQueue()
+        self._future = None  # type: Optional[Future]
+
+    def attach(self, future):
+        # type: (Future) -> None
+        """
+        Follow the future of the call whose partial replies are being streamed, its completion ends the stream.
+        """
+        self._future = future
+        future.add_done_callback(self._on_done)
+
+    def on_partial(self, msg):
+        # type: (Any) -> None
+        self._put((True, msg))
+
+    def _on_done(self, future):
+        # type: (Future) -> None
+        self._put((False, None))
+
+    def _put(self, item):
+        # type: (Tuple[bool, Any]) -> None
+        self._chunks.put(item)
+
+    def _end(self):
+        # type: () -> None
+        """
+        The final reply came in: keep the stream ended for any further next(), and take the result.
+        """
+        self._put((False, None))
+        self.result = self._future.result()
+
+    def __iter__(self):
+        return self
 
+    def __next__(self):
+        # type: () -> Any
+        partial, msg = self._chunks.get()
+        if partial:
+            return msg
+        self._end()
+        raise StopIteration()
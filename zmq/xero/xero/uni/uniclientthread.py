@@ -1,16 +1,17 @@
 from threading import Thread, current_thread
 from abc import ABCMeta
+import zmq
 
 from xero.uni.uniclient import UniClient
+from xero.util.xero_codecs import DEFAULT_CODECS
+from xero.util.xero_failure_detector import FailureDetector, PhiAccrualFailureDetector
+from xero.util.xero_sub_queue import OVERFLOW_BLOCK
+from xero.xero_constants import COMPRESSION_THRESHOLD, EMIT_HWM, MAX_IN_FLIGHT
 
 try:
-    from typing import Any, List, Optional, Tuple, Union
+    from typing import Callable, Optional, Sequence
 except ImportError:
-    Any = None
-    List = None
     Optional = None
-    Tuple = None
-    Union = None
 
 
 class UniClientThread(UniClient, Thread):
@@ -21,14 +22,30 @@ class UniClientThread(UniClient, Thread):
 
     __metaclass__ = ABCMeta
 
-    def __init__(self, endpoint, context=None):
-        # type: (str, zmq.Context) -> None
+    def __init__(self, endpoint, context=None, max_in_flight=MAX_IN_FLIGHT, codecs=DEFAULT_CODECS, compression=None,
+                 compression_threshold=COMPRESSION_THRESHOLD, emit_credits=None, emit_endpoint=None, emit_hwm=EMIT_HWM,
+                 emit_conflate=False, emit_queue_size=None, emit_overflow=OVERFLOW_BLOCK,
+                 failure_detector=PhiAccrualFailureDetector):
+        # type: (str, zmq.Context, int, Sequence[str], Optional[str], int, Optional[int], Optional[str], int, bool, Optional[int], str, Callable[[], FailureDetector]) -> None
         """
         :param endpoint: ZeroMQ endpoint to bind to.
         :param context: ZeroMQ Context.
+        :param max_in_flight: Maximum number of outstanding requests sent to any one worker.
+        :param codecs: Names of the codecs this client uses, see UniClient.
+        :param compression: Name of the compressor to use, or None not to compress.
+        :param compression_threshold: Frames smaller than this many bytes are sent uncompressed.
+        :param emit_credits: Emits each worker may have waiting, see UniClient.  None turns flow control off.
+        :param emit_endpoint: Endpoint to bind the emit data plane to, see UniClient.  None keeps emits on the ROUTER.
+        :param emit_hwm: High water mark of the data plane's sockets.
+        :param emit_conflate: Only keep the latest emit waiting on the data plane.
+        :param emit_queue_size: Most emits waiting in the queue of get_sub_message(), None for no limit.
+        :param emit_overflow: What happens to emits that find the queue full, see SubscriberQueue.
+        :param failure_detector: Creates the failure detector of each worker, see UniClient.
         """
         # Worker and Thread have different init signatures, so we'll call them separately.
-        UniClient.__init__(self, endpoint, context)
+        UniClient.__init__(self, endpoint, context, max_in_flight, codecs, compression, compression_threshold,
+                           emit_credits, emit_endpoint, emit_hwm, emit_conflate, emit_queue_size, emit_overflow,
+                           failure_detector)
         Thread.__init__(self)
 
     def run(self):
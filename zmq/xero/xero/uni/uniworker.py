@@ -1,16 +1,28 @@
 import logging
-from threading import Event, Lock
-from abc import ABCMeta, abstractmethod
-import msgpack
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from contextvars import Context, ContextVar, copy_context
+import functools
+import inspect
+import os
+import struct
+from threading import Condition, Event, Lock, get_ident
+from time import monotonic
+from abc import ABCMeta
 import zmq
 from tornado.ioloop import IOLoop, PeriodicCallback
 from zmq.eventloop.zmqstream import ZMQStream
-from xero.util.xero_serialization import XeroSerializer
-from xero.exceptions import LostRemoteError
+from xero.util.xero_cache import LruCache
+from xero.util.xero_codecs import Codec, RawCodec, DEFAULT_CODECS, check_codecs, codec_for_tag, get_codec
+from xero.util.xero_compression import Compression, CompressionStats, DEFAULT_COMPRESSORS, STATS_BATCH, STATS_EMIT, \
+    decompress_frames, get_compressor
+from xero.util.xero_failure_detector import FailureDetector, PhiAccrualFailureDetector
+from xero.util.xero_serialization import default_registry, unwrap_frames
+from xero.exceptions import BackpressureError, LostRemoteError
 from xero.xero_constants import *
 
 try:
-    from typing import Any, Dict, List, Optional, Tuple
+    from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
 except ImportError:
     Any = None
     List = None
@@ -18,28 +30,131 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+#: What emit() does once the client's emit credit ran out, see UniWorker.set_emit_backpressure().
+BACKPRESSURE_BLOCK = 'block'
+BACKPRESSURE_BUFFER = 'buffer'
+BACKPRESSURE_RAISE = 'raise'
+
+#: The request currently being serviced by do_work(); send_reply() uses it to address and encode its reply.
+_current_request = ContextVar('xero_current_request', default=None)  # type: ContextVar[Optional[RequestInfo]]
+#: (BatchReply, index) of the batched call currently being serviced, final replies are collected there instead of sent.
+_current_batch_slot = ContextVar('xero_current_batch_slot', default=None)  # type: ContextVar[Optional[Tuple[BatchReply, int]]]
+
+
+def rpc_method(name=None, deferred=False, cache=False, cache_ttl=None):
+    # type: (Any, bool, bool, Optional[float]) -> Any
+    """
+    Decorator registering a UniWorker method as an RPC method, which the default do_work() dispatches to.  What the
+    method returns is sent as the final reply, generator methods are streamed.  Works on plain, class and static
+    methods (put @rpc_method below @staticmethod/@classmethod), and both as @rpc_method and @rpc_method(...).
+    :param name: Name clients call the method by, defaults to the method's own name.
+    :param deferred: The method replies by itself, through a callable from bind_reply(), so what it returns is ignored.
+    :param cache: Memoize the method's final replies, for methods that are pure functions of their arguments.  Calls
+        with arguments encoded the same way are answered from the cache, without being decoded or run, and without
+        any partial replies.  See UniWorker.set_result_cache().
+    :param cache_ttl: Seconds a memoized reply stays valid, None until it's evicted.
+    """
+    if callable(name):
+        return rpc_method()(name)
+
+    def decorate(func):
+        # type: (Callable[..., Any]) -> Callable[..., Any]
+        if cache and (inspect.isgeneratorfunction(func) or inspect.isasyncgenfunction(func)):
+            raise ValueError("Streaming method '{}' can't be cached".format(func.__name__))
+        func._xero_rpc_method = RpcMethod(name or func.__name__, deferred, cache=cache, cache_ttl=cache_ttl)
+        return func
+
+    return decorate
+
 
 class UniWorker(object):
     """
     Implementation of "simple" ZeroMQ Paranoid Pirate communication scheme.  This class is the DEALER, and performs the
     "reply" in RPC calls.  By design, only supports one remote client (ROUTER) in order to keep example simple.
-    Supports a very basic RPC interface, using MessagePack for encoding/decoding.
+    Supports a very basic RPC interface.  Messages are encoded with one of the codecs in xero.util.xero_codecs,
+    MessagePack by default.  The worker lists the codecs it accepts in its ready message, and the client answers with
+    the one emits should use; requests are replied to in whatever codec they came in with.
+    The client may also turn on compression of large frames, see xero.util.xero_compression, and have emits published
+    on a PUB socket of their own, so they never queue up in front of replies and heartbeats.
+    RPC methods are declared with the @rpc_method decorator.  Their table is advertised in the ready message, which
+    lets the client call them by a small integer ID and refuse calls to methods no worker has without a round trip.
+    Replies of methods declared with cache=True are memoized, keyed by the encoded arguments, and invalidate_cache()
+    tells the client to drop the replies it cached when the data behind them changes.  Given an executor, requests are
+    worked on there rather than on the IOLoop's thread, so long jobs don't hold up heartbeats and several requests can
+    be worked on at once.
     """
 
     __metaclass__ = ABCMeta
 
-    def __init__(self, endpoint, context=None):
-        # type: (str, zmq.Context) -> None
+    def __init__(self, endpoint, context=None, codecs=DEFAULT_CODECS, compressors=DEFAULT_COMPRESSORS, executor=None,
+                 failure_detector=PhiAccrualFailureDetector):
+        # type: (str, zmq.Context, Sequence[str], Sequence[str], Optional[Executor], Callable[[], FailureDetector]) -> None
         """
         Initialize the worker.
         :param endpoint: ZeroMQ endpoint to connect to.
         :param context: ZeroMQ Context
+        :param codecs: Names of the codecs this worker accepts, the first is used for emits until the client picked one.
+        :param compressors: Names of the compressors this worker offers the client.
+        :param executor: Executor to work on requests with, None to work on them on the IOLoop's thread.  A thread
+            pool runs do_work() itself, replies sent from its threads are handed over to the IOLoop.  A process pool
+            runs the registered methods the default do_work() calls, as long as they neither stream, reply by
+            themselves nor are coroutines; they have to be picklable, i.e. module level functions or static methods.
+            The worker doesn't shut the executor down.
+        :param failure_detector: Creates the failure detector that tells from the client's heartbeats whether it's
+            still there, see xero.util.xero_failure_detector.
         """
         self._context = context or zmq.Context.instance()
         self._endpoint = endpoint
+        self._codecs = check_codecs(codecs)
+        self._codec = get_codec(self._codecs[0])
+        self._compressors = tuple(compressors)
+        for name in self._compressors:
+            get_compressor(name)
+        self._compression_stats = CompressionStats()
+        self._compression = Compression(stats=self._compression_stats)
+        self._rpc_methods = self._collect_rpc_methods()
+        # Method names by the ID the client calls them by, their index.
+        self._method_table = sorted(self._rpc_methods)
+        # Memoized final replies of cacheable methods, see set_result_cache().
+        self._result_cache = LruCache(RESULT_CACHE_BYTES)
+        # Final replies sent, by request ID, and when each request still being worked on came in, so a request the
+        # client retries isn't worked on again.  Off until set_dedup_table() turns it on.  Replies are sent from
+        # executor threads too, hence the lock.
+        self._completed = LruCache(0)
+        self._in_progress = {}  # type: Dict[bytes, float]
+        self._in_progress_ttl = DEDUP_IN_PROGRESS_TTL
+        self._dedup_lock = Lock()
+        self._executor = executor
+        self._executor_processes = isinstance(executor, ProcessPoolExecutor)
+        # Thread the IOLoop runs on, None until it started.  Replies from any other thread are handed over to it.
+        self._loop_thread = None  # type: Optional[int]
+        # Emits, with their topics, waiting to be coalesced, see set_emit_batching().
+        self._emit_lock = Lock()
+        self._emit_batch = []  # type: List[Tuple[Any, Optional[str]]]
+        self._emit_batch_size = 1
+        self._emit_batch_delay = EMIT_BATCH_DELAY
+        # Emit flow control, see set_emit_backpressure().  None credits means the client doesn't use flow control.
+        self._emit_credits = None  # type: Optional[int]
+        self._emit_credit_granted = Condition(self._emit_lock)
+        self._emit_backlog = deque()  # type: deque[Tuple[Any, Optional[str]]]
+        self._backpressure = BACKPRESSURE_BUFFER
+        self._emit_buffer_size = EMIT_BUFFER_SIZE
+        self._emit_block_timeout = None  # type: Optional[float]
+        # Topic prefixes the client subscribed to, None while it wants every emit.
+        self._subscriptions = None  # type: Optional[Tuple[str, ...]]
+        # Emit data plane, the PUB socket the client may have us publish emits on instead of sending them over the
+        # DEALER.  Emits only switch over once the client's SUB socket subscribed.
+        self._emit_stream = None  # type: Optional[ZMQStream]
+        self._emit_id = b''
+        self._emit_conflate = False
+        self._emit_plane_up = False
         self._stream = None  # type: Optional[ZMQStream]
         self._tmo = None
         self._need_handshake = True
+        # Session epochs, ours and the one of the client we shook hands with, carried in heartbeats so either side
+        # restarting is noticed on its first heartbeat.
+        self._session = os.urandom(8)
+        self._client_session = None  # type: Optional[bytes]
         self._ticker = None  # type: Optional[PeriodicCallback]
         self._delayed_cb = None
         self._connected_event = Event()
@@ -47,7 +162,10 @@ class UniWorker(object):
 
         self._create_stream()
 
-        self._curr_liveness = HB_LIVENESS
+        self._client_detector = failure_detector()
+        # Timestamp of the client's latest heartbeat and when it arrived, echoed back in our next heartbeat so the
+        # client can measure the round trip time.
+        self._heartbeat_echo = None  # type: Optional[Tuple[bytes, float]]
         self._keep_running = True
 
     def _create_stream(self):
@@ -59,7 +177,9 @@ class UniWorker(object):
         socket = self._context.socket(zmq.DEALER)
 
         self._stream = ZMQStream(socket, IOLoop())
-        self._stream.on_recv(self._on_message)
+        # Learn the IOLoop's thread from the IOLoop itself, however it ends up being started.
+        self._stream.io_loop.add_callback(self._note_loop_thread)
+        self._stream.on_recv(self._on_recv, copy=False)
         self._stream.socket.setsockopt(zmq.LINGER, 0)
         self._stream.connect(self._endpoint)
 
@@ -67,6 +187,21 @@ class UniWorker(object):
         self._send_ready()
         self._ticker.start()
 
+    def _collect_rpc_methods(self):
+        # type: () -> Dict[str, RpcMethod]
+        """
+        Find the methods of this worker's class marked with @rpc_method, bound to this instance.
+        """
+        methods = {}  # type: Dict[str, RpcMethod]
+        # Base classes first, so methods overridden in a subclass win.
+        for klass in reversed(type(self).__mro__):
+            for attr, value in vars(klass).items():
+                spec = getattr(getattr(value, '__func__', value), '_xero_rpc_method', None)
+                if isinstance(spec, RpcMethod):
+                    methods[spec.name] = RpcMethod(spec.name, spec.deferred, getattr(self, attr), spec.cache,
+                                                   spec.cache_ttl)
+        return methods
+
     def run(self):
         # type: () -> None
         """
@@ -76,6 +211,10 @@ class UniWorker(object):
         if self._keep_running:
             self._stream.io_loop.start()
 
+    def _note_loop_thread(self):
+        # type: () -> None
+        self._loop_thread = get_ident()
+
     def stop(self):
         # type: () -> None
         """
@@ -101,6 +240,7 @@ class UniWorker(object):
             if not self._stream:
                 return
 
+            self._close_emit_plane()
             self._stream.on_recv(None)
             self._send_disconnect()
             self._stream.close()
@@ -119,6 +259,14 @@ class UniWorker(object):
         if not event_status:
             raise LostRemoteError("No worker is connected.")
 
+    def client_suspicion(self):
+        # type: () -> float
+        """
+        Returns how strongly the client is suspected to have gone away, as the failure detector tells from its
+        heartbeats.  The worker disconnects and says it's ready again once it reaches the detector's threshold.
+        """
+        return self._client_detector.suspicion()
+
     def is_connected(self):
         # type: () -> bool
         """
@@ -127,60 +275,392 @@ class UniWorker(object):
         """
         return not self._need_handshake
 
-    def send_reply(self, msg, partial=False, exception=False):
-        # type: (Any, bool, bool) -> None
+    def current_request_id(self):
+        # type: () -> Optional[bytes]
+        """
+        Returns the ID of the request do_work() is currently servicing, or None outside of do_work().
+        """
+        request = _current_request.get()
+        return request.request_id if request is not None else None
+
+    def compression_stats(self):
+        # type: () -> Dict[str, Dict[str, Any]]
+        """
+        Returns what compression achieved on the replies and emits sent so far, per method.  See CompressionStats.
+        """
+        return self._compression_stats.snapshot()
+
+    def set_result_cache(self, max_bytes):
+        # type: (int) -> None
+        """
+        Limit the memory memoized replies of methods declared with @rpc_method(cache=True) take up.  The least
+        recently used ones are evicted to stay within it.
+        :param max_bytes: Most bytes of encoded arguments and replies held, 0 turns memoization off.
+        """
+        self._result_cache.set_max_bytes(max_bytes)
+
+    def result_cache_stats(self):
+        # type: () -> Dict[str, Any]
+        """
+        Returns the hits, misses, expirations and evictions of the memoized replies, and the memory they take up.  See
+        LruCache.stats().
+        """
+        return self._result_cache.stats()
+
+    def set_dedup_table(self, max_bytes=DEDUP_TABLE_BYTES, in_progress_ttl=DEDUP_IN_PROGRESS_TTL):
+        # type: (int, float) -> None
+        """
+        Keep the final replies sent, so a request the client retries after its reply was lost gets the kept reply
+        instead of being worked on again, as long as it wasn't evicted meanwhile.  A retry of a request still being
+        worked on is dropped, its reply is on the way.  Off by default, as every final reply is then copied to be kept;
+        turn it on for workers whose clients retry calls to methods that mustn't run twice.
+        :param max_bytes: Most bytes of replies kept, the least recently sent ones are evicted to stay within it.  0
+            turns the table off.
+        :param in_progress_ttl: Seconds after which a request that didn't get its final reply is given up on, e.g. one a
+            deferred handler never answered, so its retries are worked on again.
+        """
+        with self._dedup_lock:
+            self._completed.set_max_bytes(max_bytes)
+            self._in_progress_ttl = in_progress_ttl
+            if max_bytes == 0:
+                self._in_progress.clear()
+
+    def dedup_table_stats(self):
+        # type: () -> Dict[str, Any]
+        """
+        Returns how many retried requests were answered with a kept reply, as hits, and the memory the kept replies
+        take up.  See LruCache.stats().
+        """
+        return self._completed.stats()
+
+    def invalidate_cache(self, method=None, args=None, kwargs=None):
+        # type: (Optional[str], Optional[List[Any]], Optional[Dict[str,Any]]) -> None
+        """
+        Tell the client the data behind some cached replies changed, so it drops them from its response cache, see
+        UniClient.set_method_cache().  Our own memoized replies of the method are dropped too.  Safe to call from any
+        thread.  The invalidation is sent in order with replies, ahead of any reply sent after it, and isn't subject
+        to emit flow control or subscriptions.
+        :param method: The method whose replies are stale, None for all of them.
+        :param args: Arguments of the one call whose reply is stale.  None, along with kwargs, for all calls to method.
+        :param kwargs: Key arguments of the one call whose reply is stale.
+        :raises LostRemoteError: No client is connected.
+        """
+        if method is None:
+            self._result_cache.clear()
+        else:
+            self._result_cache.discard_if(lambda key: key[0] == method)
+        if not self.is_connected():
+            raise LostRemoteError("No client is connected.")
+        # Sent the way replies are, so it can't fall behind one sent after it.
+        self._send_reply_frames([WORKER_EMIT, EMIT_INVALIDATE_CACHE, default_registry.packb([method, args, kwargs])])
+
+    def bind_reply(self):
+        # type: () -> Callable[..., None]
+        """
+        Returns send_reply() bound to the request currently being serviced, for handlers that reply after do_work()
+        has returned.
+        """
+        batch_slot = _current_batch_slot.get()
+        if batch_slot is not None:
+            return functools.partial(batch_slot[0].reply, batch_slot[1])
+        return functools.partial(self._reply, _current_request.get())
+
+    def send_reply(self, msg, partial=False, exception=False, request_id=None, codec=None):
+        # type: (Any, bool, bool, Optional[bytes], Optional[Codec]) -> None
         """
         Send a ZeroMQ message in reply to a client request.
-        This should only be called out of the overridden do_work method.
+        This should be called out of the overridden do_work method, or via a callable from bind_reply().
 
         :param msg: The message to be sent out.
         :param partial: Flag indicating whether the response is a partial or final ZMQ message.
+        :param request_id: The request being replied to, defaults to the one do_work() is currently servicing.
+        :param codec: Codec to encode msg with, defaults to the one the request being serviced came in with.
         """
+        request = _current_request.get()
+        if request_id is None:
+            batch_slot = _current_batch_slot.get()
+            if batch_slot is not None:
+                batch_slot[0].reply(batch_slot[1], msg, partial)
+                return
+        elif request is None or request.request_id != request_id:
+            request = RequestInfo(request_id)
+        if request is None:
+            raise RuntimeError("send_reply() needs a request_id outside of do_work()")
+        self._reply(request, msg, partial, exception, codec)
+
+    def _reply(self, request, msg, partial=False, exception=False, codec=None):
+        # type: (RequestInfo, Any, bool, bool, Optional[Codec]) -> None
+        """
+        Send a reply to the given request, see send_reply().
+        """
+        codec = codec or request.codec or self._codec
+        if exception and isinstance(codec, RawCodec):
+            # Exceptions aren't bytes, send them in the codec agreed on with the client.
+            codec = self._codec
 
-        msg = msgpack.Packer(default=XeroSerializer.encoder).pack(msg)
         if exception:
             to_send = [WORKER_EXCEPTION]
         elif partial:
             to_send = [WORKER_PARTIAL_REPLY]
         else:
             to_send = [WORKER_FINAL_REPLY]
-        to_send.append(b'')
-        if isinstance(msg, list):
-            to_send.extend(msg)
+        to_send.append(request.request_id)
+        payload = self._compression.compress(codec.tag, codec.encode(msg), request.method)
+        to_send.extend(payload)
+        if request.cache_key is not None and not (partial or exception):
+            self._memoize(request, payload)
+
+        self._send_reply_frames(to_send)
+
+    def _send_reply_frames(self, to_send):
+        # type: (List[Any]) -> None
+        """
+        Send a reply right away from the IOLoop's thread, or hand it over to the IOLoop from any other thread, e.g.
+        an executor's.
+        """
+        if to_send[0] in (WORKER_FINAL_REPLY, WORKER_EXCEPTION, WORKER_BATCH_REPLY) and self._completed.max_bytes:
+            self._complete(to_send)
+        if self._loop_thread == get_ident():
+            self._send_now(to_send, copy=False, track=True)
         else:
-            to_send.append(msg)
+            self._send(to_send)
+
+    def _complete(self, to_send):
+        # type: (List[Any]) -> None
+        """
+        Keep the final reply to a request, for answering the client if it retries the request.
+        """
+        request_id = to_send[1]
+        size = sum(len(frame) for frame in to_send)
+        # Copy what may be zero-copy views of buffers the method returned.
+        kept = [bytes(frame) for frame in to_send] if size <= self._completed.max_bytes else None
+        with self._dedup_lock:
+            if kept is not None:
+                self._completed.put(request_id, kept, size)
+            # Together with keeping the reply, so a retry arriving meanwhile always finds the one or the other.
+            self._in_progress.pop(request_id, None)
 
-        self._stream.send_multipart(to_send, track=True, copy=False)
+    def _forget_stale_requests(self):
+        # type: () -> None
+        """
+        Give up on the requests that have been worked on for longer than the in-progress TTL without a final reply.
+        """
+        with self._dedup_lock:
+            if not self._in_progress:
+                return
+            expired = monotonic() - self._in_progress_ttl
+            for request_id in [request_id for request_id, arrived in self._in_progress.items() if arrived < expired]:
+                del self._in_progress[request_id]
 
-    def emit(self, msg):
-        # type: (Any) -> None
+    def set_emit_batching(self, max_messages, max_delay=EMIT_BATCH_DELAY):
+        # type: (int, float) -> None
+        """
+        Coalesce emits.  Rather than sending a message per emit(), emits are collected until max_messages are waiting
+        or the oldest one waited max_delay seconds, and then sent as a single message holding a packed list.  The client
+        queues them up just like emits sent one by one.  While the emit codec is 'raw', which can't pack a list, emits
+        are still sent one by one.
+        :param max_messages: Most emits sent in one message, 1 turns batching off.
+        :param max_delay: Most seconds an emit waits for others to be sent with.
+        """
+        with self._emit_lock:
+            self._emit_batch_size = max(max_messages, 1)
+            self._emit_batch_delay = max_delay
+        self._flush_emits()
+
+    def set_emit_backpressure(self, policy, buffer_size=EMIT_BUFFER_SIZE, timeout=None):
+        # type: (str, int, Optional[float]) -> None
+        """
+        Choose what emit() does when the client turned on emit flow control and the worker ran out of emit credit,
+        i.e. the client's application didn't take enough of the previous emits yet.
+        :param policy: BACKPRESSURE_BUFFER (the default) holds up to buffer_size emits back until credit comes in,
+            then raises BackpressureError.  BACKPRESSURE_BLOCK waits for credit, up to timeout seconds, then raises
+            BackpressureError; never use it from the IOLoop's thread, which is where credit comes in.
+            BACKPRESSURE_RAISE raises BackpressureError right away.
+        :param buffer_size: Most emits held back with BACKPRESSURE_BUFFER.
+        :param timeout: Most seconds to wait with BACKPRESSURE_BLOCK, None to wait as long as it takes.
+        """
+        if policy not in (BACKPRESSURE_BLOCK, BACKPRESSURE_BUFFER, BACKPRESSURE_RAISE):
+            raise ValueError("Unknown backpressure policy '{}'".format(policy))
+        with self._emit_lock:
+            self._backpressure = policy
+            self._emit_buffer_size = buffer_size
+            self._emit_block_timeout = timeout
+
+    def emit(self, msg, topic=None):
+        # type: (Any, Optional[str]) -> None
+        """
+        Send a message to the client, outside of any request.
+        :param msg: The message.
+        :param topic: What the message is about, sent along with it.  Once the client subscribed to topic prefixes,
+            emits whose topic doesn't start with one of them are dropped right here, before being encoded.  No topic
+            counts as ''.
+        :raises LostRemoteError: No client is connected.
+        :raises BackpressureError: The client has flow control on and can't take any more emits right now, see
+            set_emit_backpressure().
+        """
         if not self.is_connected():
             raise LostRemoteError("No client is connected.")
-        msg = msgpack.Packer(default=XeroSerializer.encoder).pack(msg)
+        if topic is not None and topic.encode('utf-8') == EMIT_INVALIDATE_CACHE:
+            raise ValueError("Topic {!r} is reserved".format(topic))
+        subscriptions = self._subscriptions
+        if subscriptions is not None and not (topic or '').startswith(subscriptions):
+            return
+        with self._emit_lock:
+            if self._emit_credits is not None and (self._emit_credits <= 0 or self._emit_backlog):
+                if self._backpressure == BACKPRESSURE_BUFFER and len(self._emit_backlog) < self._emit_buffer_size:
+                    self._emit_backlog.append((msg, topic))
+                    return
+                if self._backpressure != BACKPRESSURE_BLOCK:
+                    raise BackpressureError("Client ran out of emit credit.")
+                granted = self._emit_credit_granted.wait_for(
+                    lambda: self._emit_credits is None or (self._emit_credits > 0 and not self._emit_backlog),
+                    self._emit_block_timeout)
+                if not granted:
+                    raise BackpressureError("Client didn't grant emit credit in time.")
+            if self._emit_credits is not None:
+                self._emit_credits -= 1
+            self._send_emit(msg, topic)
+
+    def _send_emit(self, msg, topic=None):
+        # type: (Any, Optional[str]) -> None
+        """
+        Send an emit, or add it to the batch being coalesced.  Must be called with self._emit_lock held.
+        """
+        if self._emit_batch_size > 1 and not isinstance(self._codec, RawCodec):
+            self._emit_batch.append((msg, topic))
+            if len(self._emit_batch) >= self._emit_batch_size:
+                self._send_emit_batch()
+            elif len(self._emit_batch) == 1:
+                self._call_later(self._emit_batch_delay, self._flush_emits)
+            return
+        # The topic goes in the frame that marks cache invalidations, empty for none.
         to_send = [WORKER_EMIT]
-        to_send.append(b'')
-        if isinstance(msg, list):
-            to_send.extend(msg)
+        to_send.append(topic.encode('utf-8') if topic else b'')
+        codec = self._codec
+        to_send.extend(self._compression.compress(codec.tag, codec.encode(msg), STATS_EMIT))
+        self._send_emit_message(to_send)
+
+    def _on_credit(self, credits):
+        # type: (int) -> None
+        """
+        The client granted more emit credit.  Emits that were held back go out first.
+        """
+        with self._emit_lock:
+            if self._emit_credits is None:
+                return
+            self._emit_credits += credits
+            while self._emit_backlog and self._emit_credits > 0:
+                self._emit_credits -= 1
+                self._send_emit(*self._emit_backlog.popleft())
+            self._emit_credit_granted.notify_all()
+
+    def _flush_emits(self):
+        # type: () -> None
+        """
+        Send the emits waiting to be coalesced, if any.
+        """
+        with self._emit_lock:
+            if self._emit_batch:
+                self._send_emit_batch()
+
+    def _send_emit_batch(self):
+        # type: () -> None
+        """
+        Send the emits collected so far as a single message.  Must be called with self._emit_lock held, which keeps
+        batches in order.
+        """
+        batch = self._emit_batch
+        self._emit_batch = []
+        codec = self._codec
+        topics = [topic for _, topic in batch]
+        # Each emit's topic, packed, unless none of them has one.
+        to_send = [WORKER_EMIT_BATCH, default_registry.packb(topics) if any(topics) else b'']
+        to_send.extend(self._compression.compress(codec.tag, codec.encode([msg for msg, _ in batch]), STATS_EMIT))
+        self._send_emit_message(to_send)
+
+    def _send_emit_message(self, to_send):
+        # type: (List[Any]) -> None
+        """
+        Send an emit message on the data plane when it's up, over the DEALER otherwise.  Must be called with
+        self._emit_lock held.
+        """
+        if self._emit_plane_up:
+            self._publish(to_send)
         else:
-            to_send.append(msg)
-        self._stream.io_loop.add_callback(lambda x: self._stream.send_multipart(x, track=True, copy=False), to_send)
+            self._send(to_send)
+
+    def _publish(self, to_send):
+        # type: (List[Any]) -> None
+        """
+        Publish an emit message on the data plane from any thread, by handing it over to the IOLoop.
+        """
+        self._stream.io_loop.add_callback(self._publish_now, to_send)
+
+    def _publish_now(self, to_send):
+        # type: (List[Any]) -> None
+        """
+        Publish an emit message on the data plane.  Only call this from the IOLoop's thread.  Should the data plane
+        have been closed in the meantime, the message goes over the DEALER instead.
+        """
+        if self._emit_stream is None:
+            self._send_now(to_send, copy=False)
+        else:
+            self._emit_stream.send_multipart(self._emit_envelope(to_send), copy=False)
+
+    def _emit_envelope(self, to_send):
+        # type: (List[Any]) -> List[Any]
+        """
+        Wrap an emit message for the data plane.  The client's SUB socket can't tell workers apart, so every message
+        carries the ID the client knows us by.
+        """
+        to_send = [self._emit_id] + to_send
+        if self._emit_conflate:
+            # Conflating sockets only keep single frame messages.
+            to_send = [default_registry.packb([memoryview(frame).tobytes() for frame in to_send])]
+        return to_send
+
+    def _call_later(self, delay, callback, *args):
+        # type: (float, Callable[..., None], Any) -> None
+        """
+        Run callback on the IOLoop after delay seconds.  Safe to call from any thread.
+        """
+        self._stream.io_loop.add_callback(lambda: self._stream.io_loop.call_later(delay, callback, *args))
+
+    def _send(self, to_send):
+        # type: (List[bytes]) -> None
+        """
+        Send a multipart message from any thread, by handing it over to the IOLoop.
+        """
+        stream = self._stream
+        if stream is None:
+            # E.g. an executor finishing a job after shutdown().
+            logger.warning("Dropping message, the worker has shut down")
+            return
+        # Callbacks run in a copy of the context they were added from.  Hand over in an empty one, so the request being
+        # worked on here doesn't leak into the stream's handlers, and from there into the next requests.
+        Context().run(stream.io_loop.add_callback, lambda x: stream.send_multipart(x, track=True, copy=False), to_send)
+
+    def _send_now(self, to_send, copy=True, track=False):
+        # type: (List[bytes], bool, bool) -> None
+        """
+        Send a multipart message immediately.  Only call this from the IOLoop's thread.
+        """
+        self._stream.send_multipart(to_send, copy=copy, track=track)
 
     def _tick(self):
         # type: () -> None
         """
         Periodic callback to check connectivity to client.
         """
-        if self._curr_liveness >= 0:
-            self._curr_liveness -= 1
-
-        if self._curr_liveness > 0:
+        self._forget_stale_requests()
+        if not self._connected_event.is_set():
+            self._send_ready()
+        elif self._client_detector.is_available():
             self._send_heartbeat()
-        elif self._curr_liveness == 0:
+        else:
             # Connection died, close on our side.
             self.on_log_event("uniworker.tick", "Connection to uniclient timed out, disconnecting")
             self._connected_event.clear()
-        else:
-            self._send_ready()
 
     def _send_heartbeat(self):
         # type: () -> None
@@ -190,7 +670,12 @@ class UniWorker(object):
         # Heartbeats should go out immediately, if a lot of messages to be emitted are queued up heartbeats should
         # still be sent out regularly.  Therefore, send it out via the stream's socket, rather than the stream itself
         # See https://pyzmq.readthedocs.io/en/latest/eventloop.html#send
-        self._stream.send_multipart([WORKER_HEARTBEAT])
+        to_send = [WORKER_HEARTBEAT, self._session]
+        echo = self._heartbeat_echo
+        if echo is not None:
+            self._heartbeat_echo = None
+            to_send.extend([echo[0], struct.pack('!d', monotonic() - echo[1])])
+        self._send_now(to_send)
 
     def _send_disconnect(self):
         # type: () -> None
@@ -198,7 +683,7 @@ class UniWorker(object):
         Send a disconnect message to the client.
         """
         # Send out via the socket, this message takes priority.
-        self._stream.send_multipart([WORKER_DISCONNECT])
+        self._send_now([WORKER_DISCONNECT])
 
     def _send_ready(self):
         # type: () -> None
@@ -206,7 +691,92 @@ class UniWorker(object):
         Send a ready message to the client.
         """
         self.on_log_event("uniworker.ready", "Sending ready to client.")
-        self._stream.send_multipart([WORKER_READY])
+        # Back to the defaults until the client answered.
+        self._codec = get_codec(self._codecs[0])
+        self._compression = Compression(stats=self._compression_stats)
+        self._close_emit_plane()
+        self._send_now([WORKER_READY, default_registry.packb(self._ready_settings())])
+
+    def _ready_settings(self):
+        # type: () -> Dict[str, Any]
+        """
+        The settings this worker offers the client in its ready message.
+        """
+        settings = {'codecs': list(self._codecs), 'compressors': list(self._compressors), 'emit_plane': True,
+                    'session': self._session}
+        if self._method_table:
+            settings['methods'] = self._method_table
+        return settings
+
+    def _open_emit_plane(self, settings):
+        # type: (Dict[str, Any]) -> None
+        """
+        Connect the PUB socket the client asked emits to be published on, if it did.  It's an XPUB, so we hear when the
+        client's SUB socket subscribed: a PUB socket drops whatever it sends before that, so emits keep going over the
+        DEALER until then.  Emits sent right before the switch may arrive after the ones sent right after it.
+        """
+        self._close_emit_plane()
+        endpoint = settings.get('emit_endpoint')
+        if endpoint is None:
+            return
+        socket = self._context.socket(zmq.XPUB)
+        socket.setsockopt(zmq.LINGER, 0)
+        socket.setsockopt(zmq.SNDHWM, settings.get('emit_hwm', EMIT_HWM))
+        if settings.get('emit_conflate'):
+            socket.setsockopt(zmq.CONFLATE, 1)
+        socket.connect(self._emit_plane_endpoint(endpoint))
+        with self._emit_lock:
+            self._emit_id = settings['emit_id']
+            self._emit_conflate = bool(settings.get('emit_conflate'))
+        self._watch_emit_plane(socket)
+
+    def _emit_plane_endpoint(self, endpoint):
+        # type: (str) -> str
+        """
+        The endpoint to connect the PUB socket to.  A client that bound its SUB socket to every interface is reached
+        on the host the DEALER reaches it on.
+        """
+        transport, _, address = endpoint.partition('://')
+        host, _, port = address.rpartition(':')
+        if host in ('*', '0.0.0.0', '[::]'):
+            host = self._endpoint.partition('://')[2].rpartition(':')[0]
+            return '{}://{}:{}'.format(transport, host, port)
+        return endpoint
+
+    def _watch_emit_plane(self, socket):
+        # type: (zmq.Socket) -> None
+        """
+        Start listening for the client's subscription on the data plane's socket.
+        """
+        self._emit_stream = ZMQStream(socket, self._stream.io_loop)
+        self._emit_stream.on_recv(self._on_emit_subscription)
+
+    def _on_emit_subscription(self, frames):
+        # type: (List[bytes]) -> None
+        """
+        The client's SUB socket subscribed or went away, emits go over the data plane only while it's listening.
+        """
+        with self._emit_lock:
+            self._emit_plane_up = frames[0][:1] == b'\x01'
+
+    def _close_emit_plane(self):
+        # type: () -> None
+        """
+        Close the data plane's socket, emits go over the DEALER again.
+        """
+        with self._emit_lock:
+            self._emit_plane_up = False
+        if self._emit_stream is not None:
+            self._emit_stream.on_recv(None)
+            self._emit_stream.close()
+            self._emit_stream = None
+
+    def _on_recv(self, frames):
+        # type: (List[zmq.Frame]) -> None
+        """
+        Receive callback of the stream, which hands over zmq.Frames so large payloads aren't copied.
+        """
+        self._on_message(unwrap_frames(frames))
 
     def _on_message(self, msg):
         # type: (List[bytes]) -> None
@@ -223,31 +793,298 @@ class UniWorker(object):
             return
         # 3rd part is message type
         msg_type = msg.pop(0)
-        # any message resets the liveness counter
+        if msg_type == WORKER_HEARTBEAT and self._is_stale_session(msg):
+            return
+        if msg_type == WORKER_READY:
+            # The client's answer to our ready message, applied before anyone sees us connected.
+            self._on_handshake(default_registry.unpackb(msg[0]) if msg else {})
+        # any message shows the client is there
+        if msg_type == WORKER_HEARTBEAT:
+            self._client_detector.heartbeat()
+        else:
+            self._client_detector.touch()
         self._need_handshake = False
-        self._connected_event.set()
-        self._curr_liveness = HB_LIVENESS
         if msg_type == WORKER_DISCONNECT:  # disconnect
-            self._curr_liveness = 0  # reconnect will be triggered by hb timer
+            self._connected_event.clear()  # reconnect will be triggered by hb timer
+        else:
+            self._connected_event.set()
+        if msg_type == WORKER_DISCONNECT:
+            pass
+        elif msg_type == WORKER_READY:
+            pass
+        elif msg_type in (WORKER_REQUEST, WORKER_REQUEST_ID, WORKER_BATCH_REQUEST) and self._is_retry(msg[0]):
+            pass
         elif msg_type == WORKER_REQUEST:  # request
             # remaining parts are the user message
             self._on_request(msg)
+        elif msg_type == WORKER_REQUEST_ID:
+            self._on_request_by_id(msg)
+        elif msg_type == WORKER_BATCH_REQUEST:
+            self._on_batch_request(msg)
+        elif msg_type == WORKER_CREDIT:
+            self._on_credit(struct.unpack('!I', msg[0])[0])
+        elif msg_type == WORKER_SUBSCRIBE:
+            self._set_subscriptions(default_registry.unpackb(msg[0]))
         elif msg_type == WORKER_HEARTBEAT:
             # received hardbeat - timer handled above
-            pass
+            if len(msg) >= 3:
+                self._heartbeat_echo = (msg[2], monotonic())
         else:
             logger.error("Uniworker received unrecognized message")
 
+    def _is_stale_session(self, msg):
+        # type: (List[bytes]) -> bool
+        """
+        Check the session epochs of a client heartbeat against the client we shook hands with and ourselves, and shake
+        hands again right away if they don't match, i.e. the client restarted or doesn't know us.
+        :param msg: [client session, our session as the client knows it, timestamp to echo], empty from clients that
+            don't send sessions.
+        :return: Whether the heartbeat is from a session that's over, and must be ignored.
+        """
+        if len(msg) < 2 or (msg[0] == self._client_session and msg[1] == self._session):
+            return False
+        if self._need_handshake:
+            # Our ready message already went out for this mismatch, and the tick sends it again until the client
+            # answers.  Every one the client gets re-registers us, so don't send more.
+            return True
+        self.on_log_event("uniworker.session", "Client restarted or lost track of us, reconnecting")
+        self._need_handshake = True
+        self._connected_event.clear()
+        self._send_ready()
+        return True
+
+    def _is_retry(self, request_id):
+        # type: (bytes) -> bool
+        """
+        Answer a request the client sent again with the final reply we already sent it, or drop it if it's still being
+        worked on; its reply goes out once it's done.  Request IDs are unique across clients, so there's no telling
+        retries and requests apart by anything else.  Only while the dedup table is on, and a request that has been
+        worked on for longer than its TTL is worked on again.
+        :return: Whether the request is a retry, which mustn't be worked on again.
+        """
+        if not self._completed.max_bytes:
+            return False
+        with self._dedup_lock:
+            arrived = self._in_progress.get(request_id)
+            if arrived is not None and monotonic() - arrived < self._in_progress_ttl:
+                return True
+            to_send = self._completed.get(request_id)
+            if to_send is None:
+                self._in_progress[request_id] = monotonic()
+                return False
+        self.on_log_event("uniworker.retry", "Resending final reply to a retried request")
+        self._send_now(to_send)
+        return True
+
+    def _set_subscriptions(self, prefixes):
+        # type: (Optional[List[str]]) -> None
+        """
+        Replace the topic prefixes the client subscribed to, None meaning it wants every emit.
+        """
+        self._subscriptions = tuple(prefixes) if prefixes is not None else None
+
+    def _on_handshake(self, settings):
+        # type: (Dict[str, Any]) -> None
+        """
+        Apply the settings the client picked out of the ones offered in our ready message.
+        """
+        self._client_session = settings.get('session')
+        self._client_detector.reset()
+        self._set_subscriptions(settings.get('subscriptions'))
+        self._open_emit_plane(settings)
+        # Memoized replies are compressed the way the previous client wanted.
+        self._result_cache.clear()
+        codec_name = settings.get('codec')
+        if codec_name in self._codecs:
+            self._codec = get_codec(codec_name)
+        elif codec_name is not None:
+            logger.error("Client picked codec '{}', which this worker doesn't accept".format(codec_name))
+
+        compressor_name = settings.get('compression')
+        if compressor_name in self._compressors:
+            threshold = settings.get('compression_threshold', COMPRESSION_THRESHOLD)
+            self._compression = Compression(get_compressor(compressor_name), threshold, self._compression_stats)
+        elif compressor_name is not None:
+            logger.error("Client picked compressor '{}', which this worker doesn't offer".format(compressor_name))
+
+        with self._emit_lock:
+            # The client starts out with an empty queue, whatever credit was left from before is void.
+            self._emit_credits = settings.get('emit_credits')
+            if self._emit_credits is None:
+                # No flow control, send whatever was held back.
+                while self._emit_backlog:
+                    self._send_emit(*self._emit_backlog.popleft())
+                self._emit_credit_granted.notify_all()
+        self._on_credit(0)
+
+    def _open_payload(self, request_id, tag, frames, method):
+        # type: (bytes, bytes, List[Any], str) -> Tuple[Optional[Codec], List[Any]]
+        """
+        Find the codec a request was encoded with and undo any compression.  Requests in codecs this worker doesn't
+        accept, or compressed in a way it can't undo, are failed.
+        :return: The codec and the frames to decode with it, or None and no frames if the request was failed.
+        """
+        try:
+            return codec_for_tag(tag, self._codecs), decompress_frames(tag, frames, self._compression_stats, method)
+        except ValueError as e:
+            logger.error("Rejecting request: {}".format(e))
+            self.send_reply(e, exception=True, request_id=request_id, codec=self._codec)
+            return None, []
+
     def _on_request(self, message):
         # type: (List[bytes]) -> None
         """
         This gets called on incoming RPC messages, will break up the encoded message into something do_work() can process
-        :param message: 
+        :param message: [request ID, method name, encoding, args, kwargs, out-of-band buffers...]
+        """
+        self._serve_request(message[0], str(message[1], 'utf-8'), message[2], message[3:])
+
+    def _on_request_by_id(self, message):
+        # type: (List[bytes]) -> None
+        """
+        This gets called on incoming RPC messages that call the method by its ID in the advertised method table.
+        :param message: [request ID, method ID, encoding, args, kwargs, out-of-band buffers...]
+        """
+        method_id = struct.unpack('!H', message[1])[0]
+        if method_id >= len(self._method_table):
+            self.send_reply(Exception('method ID {} not found'.format(method_id)), exception=True,
+                            request_id=message[0], codec=self._codec)
+            return
+        self._serve_request(message[0], self._method_table[method_id], message[2], message[3:])
+
+    def _serve_request(self, request_id, name, tag, frames):
+        # type: (bytes, str, bytes, List[Any]) -> None
+        """
+        Decode a request's arguments and hand it to do_work(), or answer it with a memoized reply.
+        """
+        method = self._rpc_methods.get(name)
+        cache_key = None
+        if method is not None and method.cache:
+            # The arguments as they came in, still encoded and maybe compressed.
+            cache_key = (name, tag) + tuple(bytes(frame) for frame in frames)
+            payload = self._result_cache.get(cache_key)
+            if payload is not None:
+                self._send_reply_frames([WORKER_FINAL_REPLY, request_id] + payload)
+                return
+        codec, frames = self._open_payload(request_id, tag, frames, name)
+        if codec is None:
+            return
+        args, kwargs = codec.decode_call(frames)
+        token = _current_request.set(RequestInfo(request_id, name, codec, cache_key))
+        try:
+            self._run_work(name, args, kwargs)
+        finally:
+            _current_request.reset(token)
+
+    def _on_batch_request(self, message):
+        # type: (List[bytes]) -> None
+        """
+        This gets called on incoming batch RPC messages.  Each call in the batch goes through do_work() in order, and
+        their final replies are gathered up into a single batch reply.  Partial replies are dropped.  With a thread pool
+        executor the calls still run one after the other, as a single job.  Calls that finish after do_work() returned,
+        i.e. deferred ones and registered methods sent off to a process pool, may overlap with the calls after them.
+        :param message: [request ID, encoding, list of [method name, args, kwargs], out-of-band buffers...]
         """
-        name = str(message[0], 'utf-8')
-        args = msgpack.unpackb(message[1], object_hook=XeroSerializer.decoder, raw=False)
-        kwargs = msgpack.unpackb(message[2], object_hook=XeroSerializer.decoder, raw=False)
-        self.do_work(name, args, kwargs)
+        request_id = message[0]
+        codec, frames = self._open_payload(request_id, message[1], message[2:], STATS_BATCH)
+        if codec is None:
+            return
+        calls = codec.decode(frames)[0]
+        batch = BatchReply(len(calls), functools.partial(self._send_batch_reply, request_id, codec))
+        token = _current_request.set(RequestInfo(request_id, STATS_BATCH, codec))
+        try:
+            self._run_batch(batch, calls)
+        finally:
+            _current_request.reset(token)
+
+    def _run_batch(self, batch, calls):
+        # type: (BatchReply, List[Any]) -> None
+        """
+        Hand the calls of a batch request to do_work() one after the other, as a single job on the executor if it's a
+        thread pool.  Called with the batch request set as the current request.
+        """
+        if self._executor is None or self._executor_processes:
+            self._work_batch(batch, calls)
+        else:
+            future = self._executor.submit(copy_context().run, self._work_batch, batch, calls)
+            future.add_done_callback(self._on_executor_done)
+
+    def _work_batch(self, batch, calls):
+        # type: (BatchReply, List[Any]) -> None
+        for index, (name, args, kwargs) in enumerate(calls):
+            slot_token = _current_batch_slot.set((batch, index))
+            try:
+                self._work(name, args, kwargs)
+            finally:
+                _current_batch_slot.reset(slot_token)
+
+    def _memoize(self, request, payload):
+        # type: (RequestInfo, List[Any]) -> None
+        """
+        Keep the encoded final reply to a request for a cacheable method.
+        """
+        # Copy what may be zero-copy views of buffers the method returned.
+        payload = [bytes(frame) for frame in payload]
+        size = sum(len(part) for part in request.cache_key) + sum(len(frame) for frame in payload)
+        self._result_cache.put(request.cache_key, payload, size, self._rpc_methods[request.method].cache_ttl)
+
+    def _send_batch_reply(self, request_id, codec, results):
+        # type: (bytes, Codec, List[Any]) -> None
+        """
+        Send the gathered final replies of a batch request.
+        """
+        to_send = [WORKER_BATCH_REPLY, request_id]
+        to_send.extend(self._compression.compress(codec.tag, codec.encode(results), STATS_BATCH))
+        self._send_reply_frames(to_send)
+
+    def _run_work(self, name, args, kwargs):
+        # type: (str, List[Any], Dict[Any,Any]) -> None
+        """
+        Hand a decoded request to do_work(), on the executor if it's a thread pool.  Called with the request's ID set as
+        the current request; the executor's thread runs in a copy of the context, so send_reply() still finds it.
+        """
+        if self._executor is None or self._executor_processes:
+            self._work(name, args, kwargs)
+        else:
+            future = self._executor.submit(copy_context().run, self._work, name, args, kwargs)
+            future.add_done_callback(self._on_executor_done)
+
+    def _work(self, name, args, kwargs):
+        # type: (str, List[Any], Dict[Any,Any]) -> Any
+        """
+        Call do_work(), and stream what it returned if that's a generator.
+        :return: What do_work() returned otherwise.
+        """
+        ret = self.do_work(name, args, kwargs)
+        if inspect.isgenerator(ret):
+            self._stream_reply(ret)
+            return None
+        return ret
+
+    @staticmethod
+    def _on_executor_done(future):
+        # type: (Future) -> None
+        if not future.cancelled() and future.exception() is not None:
+            logger.error("do_work raised an exception", exc_info=future.exception())
+
+    def _stream_reply(self, generator):
+        # type: (Any) -> None
+        """
+        Send each chunk a generator handler yields as a partial reply, and what it returns as the final reply.  An
+        exception raised by the generator is sent as the exception reply.
+        """
+        reply = self.bind_reply()
+        while True:
+            try:
+                chunk = next(generator)
+            except StopIteration as e:
+                reply(e.value)
+                return
+            except Exception as e:
+                logger.exception("Streaming handler raised an exception")
+                reply(e, False, True)
+                return
+            reply(chunk, True)
 
     def on_log_event(self, event, message):
         # type: (str, str) -> None
@@ -258,13 +1095,127 @@ class UniWorker(object):
         """
         logger.debug("{}: {}".format(event, message))
 
-    @abstractmethod
     def do_work(self, name, args, kwargs):
-        # type: (str, List[Any], Dict[Any,Any]) -> None
+        # type: (str, List[Any], Dict[Any,Any]) -> Any
         """
-        Override this method for worker-specific message handling.
+        Calls the method registered under name with @rpc_method and replies with its result.  Override this method for
+        worker-specific message handling instead.  Either reply with send_reply(), or return a generator: every chunk
+        it yields is streamed to the client as a partial reply, and its return value is sent as the final reply.  The
+        generator runs on the thread do_work() was called on, one chunk after the other.
         :param name: The 'name' of the function/rpc call.
         :param args: Function call arguments.
         :param kwargs: Function call key arguments.
         """
-        raise NotImplementedError()
+        method = self._rpc_methods.get(name)
+        try:
+            if method is None:
+                raise Exception('method {} not found'.format(name))
+            if not method.streaming:
+                self.on_work_start(name)
+            if self._executor_processes and not (method.deferred or method.streaming or method.coroutine):
+                future = self._executor.submit(method.func, *args, **kwargs)
+                # The callback runs on one of the executor's threads, give it the request to reply to.
+                future.add_done_callback(functools.partial(copy_context().run, self._on_process_done, name))
+                return None
+            result = method.func(*args, **kwargs)
+        except Exception as e:
+            self.on_work_exception(name, e)
+            return None
+        if inspect.isgenerator(result) or inspect.isawaitable(result) or inspect.isasyncgen(result):
+            # Streamed by _run_work(), or run as a task by AsyncUniWorker.
+            return result
+        if not method.deferred:
+            self.send_reply(result)
+        return None
+
+    def _on_process_done(self, name, future):
+        # type: (str, Future) -> None
+        """
+        Reply with the result of a registered method that ran on the process pool.
+        """
+        try:
+            result = future.result()
+        except Exception as e:
+            self.on_work_exception(name, e)
+            return
+        self.send_reply(result)
+
+    def on_work_start(self, name):
+        # type: (str) -> None
+        """
+        Called by the default do_work() right before it calls a registered method that doesn't stream, e.g. to send
+        a partial reply acknowledging the request.  Designed for override.
+        :param name: The method.
+        """
+        pass
+
+    def on_work_exception(self, name, exception):
+        # type: (str, Exception) -> None
+        """
+        Called by the default do_work() when the method called isn't registered or raised an exception.  Sends the
+        exception as the reply, designed for override.
+        :param name: The method.
+        :param exception: What was raised.
+        """
+        logger.warning("Exception in job '{}': {}".format(name, exception))
+        self.send_reply(exception, exception=True)
+
+
+class RequestInfo(object):
+    """
+    Helper class describing a request being serviced, so its replies can be addressed and encoded.
+    """
+
+    def __init__(self, request_id, method=None, codec=None, cache_key=None):
+        # type: (bytes, Optional[str], Optional[Codec], Optional[Tuple]) -> None
+        self.request_id = request_id
+        self.method = method
+        self.codec = codec
+        # Where to memoize the final reply, for cacheable methods.
+        self.cache_key = cache_key
+
+
+class BatchReply(object):
+    """
+    Helper class that gathers the final replies of the calls in a batch request, and sends them all at once when the
+    last one comes in.
+    """
+
+    def __init__(self, count, send_cb):
+        # type: (int, Callable[[List[Any]], None]) -> None
+        self._results = [None] * count  # type: List[Any]
+        self._remaining = count
+        self._send_cb = send_cb
+        self._lock = Lock()
+        if count == 0:
+            send_cb(self._results)
+
+    def reply(self, index, msg, partial=False, exception=False):
+        # type: (int, Any, bool, bool) -> None
+        """
+        Record the reply of the call at index.  Has the same signature as a send_reply() callable from bind_reply().
+        """
+        if partial:
+            return
+        with self._lock:
+            self._results[index] = msg
+            self._remaining -= 1
+            done = self._remaining == 0
+        if done:
+            self._send_cb(self._results)
+
+
+class RpcMethod(object):
+    """
+    Helper class describing a method registered with @rpc_method.
+    """
+
+    def __init__(self, name, deferred=False, func=None, cache=False, cache_ttl=None):
+        # type: (str, bool, Optional[Callable[..., Any]], bool, Optional[float]) -> None
+        self.name = name
+        self.deferred = deferred
+        self.func = func
+        self.cache = cache
+        self.cache_ttl = cache_ttl
+        self.streaming = func is not None and (inspect.isgeneratorfunction(func) or inspect.isasyncgenfunction(func))
+        self.coroutine = inspect.iscoroutinefunction(func)
@@ -1,8 +1,17 @@
+from concurrent.futures import Executor
 from threading import Thread, current_thread
 from abc import ABCMeta
 import zmq
 
 from xero.uni.uniworker import UniWorker
+from xero.util.xero_codecs import DEFAULT_CODECS
+from xero.util.xero_compression import DEFAULT_COMPRESSORS
+from xero.util.xero_failure_detector import FailureDetector, PhiAccrualFailureDetector
+
+try:
+    from typing import Callable, Optional, Sequence
+except ImportError:
+    Optional = None
 
 
 class UniWorkerThread(UniWorker, Thread):
@@ -13,10 +22,11 @@ class UniWorkerThread(UniWorker, Thread):
 
     __metaclass__ = ABCMeta
 
-    def __init__(self, endpoint, context=None):
-        # type: (str, zmq.Context) -> None
+    def __init__(self, endpoint, context=None, codecs=DEFAULT_CODECS, compressors=DEFAULT_COMPRESSORS, executor=None,
+                 failure_detector=PhiAccrualFailureDetector):
+        # type: (str, zmq.Context, Sequence[str], Sequence[str], Optional[Executor], Callable[[], FailureDetector]) -> None
         # Worker and Thread have different init signatures, so we'll call them separately.
-        UniWorker.__init__(self, endpoint, context)
+        UniWorker.__init__(self, endpoint, context, codecs, compressors, executor, failure_detector)
         Thread.__init__(self)
 
     def run(self):
@@ -0,0 +1,159 @@
+import logging
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+try:
+    from typing import Any, Callable, Dict, Hashable, Optional
+except ImportError:
+    Any = None
+
+logger = logging.getLogger(__name__)
+
+
+class LruCache(object):
+    """
+    Least recently used cache holding at most max_bytes, as told by the size given with each entry.  Entries may
+    expire after a time to live of their own.  Thread safe.
+    """
+
+    def __init__(self, max_bytes):
+        # type: (int) -> None
+        """
+        :param max_bytes: Most bytes held, least recently used entries are evicted to stay within it.
+        """
+        if max_bytes < 0:
+            raise ValueError("Cache size can't be negative, got {}".format(max_bytes))
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()  # type: OrderedDict[Hashable, CacheEntry]
+        self._size = 0
+        self._lock = Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def get(self, key, default=None):
+        # type: (Hashable, Any) -> Any
+        """
+        :return: The value cached under key, or default if there is none or it expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires is not None and entry.expires <= monotonic():
+                self._remove(key)
+                self._expirations += 1
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry.value
+
+    def put(self, key, value, size, ttl=None):
+        # type: (Hashable, Any, int, Optional[float]) -> bool
+        """
+        Cache a value, evicting the least recently used entries as needed to stay within max_bytes.
+        :param size: Bytes the entry counts for.
+        :param ttl: Seconds the entry stays valid, None until it's evicted.
+        :return: Whether the value was cached, it isn't if it's larger than the whole cache.
+        """
+        with self._lock:
+            self._remove(key)
+            if size > self._max_bytes:
+                return False
+            self._entries[key] = CacheEntry(value, size, monotonic() + ttl if ttl is not None else None)
+            self._size += size
+            self._evict()
+            return True
+
+    def discard(self, key):
+        # type: (Hashable) -> None
+        """
+        Drop the entry cached under key, if any.
+        """
+        with self._lock:
+            self._remove(key)
+
+    def discard_if(self, predicate):
+        # type: (Callable[[Hashable], bool]) -> int
+        """
+        Drop every entry whose key the predicate is true for.
+        :return: How many entries were dropped.
+        """
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self):
+        # type: () -> None
+        """
+        Drop every entry.  The statistics are kept.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    @property
+    def max_bytes(self):
+        # type: () -> int
+        return self._max_bytes
+
+    def set_max_bytes(self, max_bytes):
+        # type: (int) -> None
+        if max_bytes < 0:
+            raise ValueError("Cache size can't be negative, got {}".format(max_bytes))
+        with self._lock:
+            self._max_bytes = max_bytes
+            self._evict()
+
+    def stats(self):
+        # type: () -> Dict[str, Any]
+        """
+        :return: Entries and bytes held, the limit, and how many lookups hit, missed, found their entry expired and
+            how many entries were evicted to make room.
+        """
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self._max_bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'expirations': self._expirations,
+                'evictions': self._evictions,
+            }
+
+    def __len__(self):
+        # type: () -> int
+        return len(self._entries)
+
+    def _remove(self, key):
+        # type: (Hashable) -> None
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry.size
+
+    def _evict(self):
+        # type: () -> None
+        while self._size > self._max_bytes:
+            _, entry = self._entries.popitem(last=False)
+            self._size -= entry.size
+            self._evictions += 1
+
+
+class CacheEntry(object):
+    """
+    Helper class holding a cached value along with its size and expiry time.
+    """
+
+    __slots__ = ('value', 'size', 'expires')
+
+    def __init__(self, value, size, expires=None):
+        # type: (Any, int, Optional[float]) -> None
+        self.value = value
+        self.size = size
+        self.expires = expires
@@ -0,0 +1,228 @@
+import logging
+import pickle
+from xero.util.xero_serialization import default_registry, XeroTypeRegistry
+from xero.xero_constants import ZERO_COPY_THRESHOLD
+
+try:
+    from typing import Any, Dict, List, Optional, Sequence, Tuple
+except ImportError:
+    Any = None
+
+logger = logging.getLogger(__name__)
+
+CODEC_MSGPACK = 'msgpack'
+CODEC_PICKLE = 'pickle'
+CODEC_RAW = 'raw'
+
+#: Codecs UniClient and UniWorker agree to use unless told otherwise.  Pickle is left out on purpose: unpickling runs
+#: arbitrary code, so it must only be turned on when both ends trust each other.
+DEFAULT_CODECS = (CODEC_MSGPACK, CODEC_RAW)
+
+
+class Codec(object):
+    """
+    Base class of the wire encodings.  A codec turns a message into a list of frames, made up of 'count' body frames
+    followed by any number of extra frames (out-of-band buffers), and back.  Frames may be bytes or any buffer, they are
+    sent with copy=False.
+    Every codec has a name, used in the handshake, and a one byte ID, which tags every message it encoded.
+    """
+
+    name = None  # type: str
+    id = None  # type: int
+
+    @property
+    def tag(self):
+        # type: () -> bytes
+        """
+        The encoding frame put in front of the frames this codec produced.
+        """
+        return bytes([self.id])
+
+    def encode(self, *objs):
+        # type: (Any) -> List[Any]
+        """
+        Encode objects into len(objs) body frames, followed by their extra frames.
+        """
+        raise NotImplementedError()
+
+    def decode(self, frames, count=1):
+        # type: (Sequence[Any], int) -> List[Any]
+        """
+        Reverse of encode().
+        :return: List of count decoded objects.
+        """
+        raise NotImplementedError()
+
+    def encode_call(self, args, kwargs):
+        # type: (List[Any], Dict[str,Any]) -> List[Any]
+        """
+        Encode the arguments of an RPC call.
+        """
+        return self.encode(args, kwargs)
+
+    def decode_call(self, frames):
+        # type: (Sequence[Any]) -> Tuple[List[Any], Dict[str,Any]]
+        """
+        Reverse of encode_call().
+        :return: args, kwargs
+        """
+        args, kwargs = self.decode(frames, 2)
+        return args, kwargs
+
+
+class MsgpackCodec(Codec):
+    """
+    MessagePack through a XeroTypeRegistry, so registered application types, NumPy arrays and buffers all work.
+    """
+
+    name = CODEC_MSGPACK
+    id = 0
+
+    def __init__(self, registry=default_registry):
+        # type: (XeroTypeRegistry) -> None
+        self.registry = registry
+
+    def encode(self, *objs):
+        # type: (Any) -> List[Any]
+        return self.registry.pack_frames(*objs)
+
+    def decode(self, frames, count=1):
+        # type: (Sequence[Any], int) -> List[Any]
+        return self.registry.unpack_frames(frames, count)
+
+
+class PickleCodec(Codec):
+    """
+    Pickle protocol 5.  Handles any picklable object, and buffers of at least ZERO_COPY_THRESHOLD bytes that support
+    out-of-band pickling (NumPy arrays, PickleBuffer, ...) become frames of their own.
+    Unpickling can run arbitrary code, only enable this codec between peers that trust each other.
+    """
+
+    name = CODEC_PICKLE
+    id = 1
+
+    def __init__(self, protocol=5):
+        # type: (int) -> None
+        self.protocol = protocol
+
+    def encode(self, *objs):
+        # type: (Any) -> List[Any]
+        buffers = []  # type: List[Any]
+
+        def out_of_band(buffer):
+            # type: (pickle.PickleBuffer) -> bool
+            raw = buffer.raw()
+            if raw.nbytes < ZERO_COPY_THRESHOLD:
+                return True
+            buffers.append(raw)
+            return False
+
+        frames = [pickle.dumps(obj, protocol=self.protocol, buffer_callback=out_of_band) for obj in objs]
+        frames.extend(buffers)
+        return frames
+
+    def decode(self, frames, count=1):
+        # type: (Sequence[Any], int) -> List[Any]
+        # Bodies were pickled one after the other, each taking its buffers off the same iterator.
+        buffers = iter(frames[count:])
+        return [pickle.loads(frame, buffers=buffers) for frame in frames[:count]]
+
+
+class RawCodec(Codec):
+    """
+    Passthrough for payloads that are already serialized.  Every message must be a bytes-like object, or a str, which is
+    sent UTF-8 encoded.  An RPC call's positional arguments each become a frame, keyword arguments aren't supported.
+    Received payloads are bytes, or read-only memoryviews from ZERO_COPY_THRESHOLD bytes on.
+    """
+
+    name = CODEC_RAW
+    id = 2
+
+    def encode(self, *objs):
+        # type: (Any) -> List[Any]
+        frames = []
+        for obj in objs:
+            if isinstance(obj, str):
+                obj = obj.encode('utf-8')
+            else:
+                memoryview(obj)
+            frames.append(obj)
+        return frames
+
+    def decode(self, frames, count=1):
+        # type: (Sequence[Any], int) -> List[Any]
+        return list(frames[:count])
+
+    def encode_call(self, args, kwargs):
+        # type: (List[Any], Dict[str,Any]) -> List[Any]
+        if kwargs:
+            raise TypeError("The raw codec doesn't support keyword arguments")
+        return self.encode(*args)
+
+    def decode_call(self, frames):
+        # type: (Sequence[Any]) -> Tuple[List[Any], Dict[str,Any]]
+        return list(frames), {}
+
+
+_codecs_by_name = {}  # type: Dict[str, Codec]
+_codecs_by_id = {}  # type: Dict[int, Codec]
+
+
+def register_codec(codec):
+    # type: (Codec) -> None
+    """
+    Make a codec available to UniClient and UniWorker, which can then list its name in their codecs.  Applications
+    should use IDs 16-255; a codec registered under an existing name replaces it.
+    """
+    if not 0 <= codec.id <= 255:
+        raise ValueError("Codec ID must be within 0-255, got {}".format(codec.id))
+    existing = _codecs_by_id.get(codec.id)
+    if existing is not None and existing.name != codec.name:
+        raise ValueError("Codec ID {} is already used by '{}'".format(codec.id, existing.name))
+    previous = _codecs_by_name.get(codec.name)
+    if previous is not None:
+        del _codecs_by_id[previous.id]
+    _codecs_by_name[codec.name] = codec
+    _codecs_by_id[codec.id] = codec
+
+
+def get_codec(name):
+    # type: (str) -> Codec
+    try:
+        return _codecs_by_name[name]
+    except KeyError:
+        raise ValueError("Unknown codec '{}'".format(name))
+
+
+def codec_for_tag(tag, accepted):
+    # type: (bytes, Sequence[str]) -> Codec
+    """
+    Look up the codec named by a received encoding frame.
+    :param tag: The encoding frame.
+    :param accepted: Names of the codecs the receiver is willing to decode.
+    """
+    # The codec ID is the first byte, compression may have appended more.
+    codec = _codecs_by_id.get(tag[0]) if len(tag) else None
+    if codec is None:
+        raise ValueError("Unknown codec ID {!r}".format(bytes(tag)))
+    if codec.name not in accepted:
+        raise ValueError("Codec '{}' isn't enabled".format(codec.name))
+    return codec
+
+
+def check_codecs(names):
+    # type: (Sequence[str]) -> Tuple[str, ...]
+    """
+    Validate a list of codec names, as taken by UniClient and UniWorker.
+    """
+    names = tuple(names)
+    if not names:
+        raise ValueError("At least one codec is needed")
+    for name in names:
+        get_codec(name)
+    return names
+
+
+register_codec(MsgpackCodec())
+register_codec(PickleCodec())
+register_codec(RawCodec())
@@ -0,0 +1,258 @@
+import logging
+import lzma
+import time
+import zlib
+from threading import Lock
+from xero.xero_constants import COMPRESSION_THRESHOLD
+
+try:
+    from typing import Any, Dict, List, Optional, Sequence, Tuple
+except ImportError:
+    Any = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSOR_ZLIB = 'zlib'
+COMPRESSOR_LZMA = 'lzma'
+
+#: Compressors UniWorker offers unless told otherwise.
+DEFAULT_COMPRESSORS = (COMPRESSOR_ZLIB, COMPRESSOR_LZMA)
+
+#: CompressionStats keys of the messages that don't belong to a single method.
+STATS_EMIT = '(emit)'
+STATS_BATCH = '(batch)'
+
+
+class Compressor(object):
+    """
+    Base class of the compression algorithms.  Every compressor has a name, used in the handshake, and a one byte ID,
+    which tags every message it compressed.  ID 0 means uncompressed.
+    """
+
+    name = None  # type: str
+    id = None  # type: int
+
+    def compress(self, data):
+        # type: (Any) -> bytes
+        raise NotImplementedError()
+
+    def decompress(self, data):
+        # type: (Any) -> bytes
+        raise NotImplementedError()
+
+
+class ZlibCompressor(Compressor):
+
+    name = COMPRESSOR_ZLIB
+    id = 1
+
+    def __init__(self, level=zlib.Z_DEFAULT_COMPRESSION):
+        # type: (int) -> None
+        self.level = level
+
+    def compress(self, data):
+        # type: (Any) -> bytes
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data):
+        # type: (Any) -> bytes
+        return zlib.decompress(data)
+
+
+class LzmaCompressor(Compressor):
+
+    name = COMPRESSOR_LZMA
+    id = 2
+
+    def __init__(self, preset=None):
+        # type: (Optional[int]) -> None
+        self.preset = preset
+
+    def compress(self, data):
+        # type: (Any) -> bytes
+        return lzma.compress(data, preset=self.preset)
+
+    def decompress(self, data):
+        # type: (Any) -> bytes
+        return lzma.decompress(data)
+
+
+_compressors_by_name = {}  # type: Dict[str, Compressor]
+_compressors_by_id = {}  # type: Dict[int, Compressor]
+
+
+def register_compressor(compressor):
+    # type: (Compressor) -> None
+    """
+    Make a compressor, e.g. one wrapping lz4 or zstandard, available to UniClient and UniWorker.  Applications should
+    use IDs 16-255; a compressor registered under an existing name replaces it, which is also how to change the level
+    of the built-in ones.
+    """
+    if not 1 <= compressor.id <= 255:
+        raise ValueError("Compressor ID must be within 1-255, got {}".format(compressor.id))
+    existing = _compressors_by_id.get(compressor.id)
+    if existing is not None and existing.name != compressor.name:
+        raise ValueError("Compressor ID {} is already used by '{}'".format(compressor.id, existing.name))
+    previous = _compressors_by_name.get(compressor.name)
+    if previous is not None:
+        del _compressors_by_id[previous.id]
+    _compressors_by_name[compressor.name] = compressor
+    _compressors_by_id[compressor.id] = compressor
+
+
+def get_compressor(name):
+    # type: (str) -> Compressor
+    try:
+        return _compressors_by_name[name]
+    except KeyError:
+        raise ValueError("Unknown compressor '{}'".format(name))
+
+
+class CompressionStats(object):
+    """
+    Per-method compression counters, to tune the compression threshold with.  Thread safe.
+    """
+
+    def __init__(self):
+        # type: () -> None
+        self._lock = Lock()
+        self._methods = {}  # type: Dict[str, Dict[str, Any]]
+
+    def _entry(self, method):
+        # type: (str) -> Dict[str, Any]
+        entry = self._methods.get(method)
+        if entry is None:
+            entry = self._methods[method] = {
+                'messages': 0,
+                'compressed': 0,
+                'raw_bytes': 0,
+                'wire_bytes': 0,
+                'compress_cpu': 0.0,
+                'decompressed': 0,
+                'decompress_cpu': 0.0,
+            }
+        return entry
+
+    def record_compress(self, method, compressed, raw_bytes, wire_bytes, cpu):
+        # type: (str, bool, int, int, float) -> None
+        """
+        Record an outgoing message that went through compression.
+        :param method: The RPC method the message belongs to.
+        :param compressed: Whether any frame of the message ended up compressed.
+        :param raw_bytes: Payload size before compression.
+        :param wire_bytes: Payload size as sent.
+        :param cpu: CPU seconds spent compressing.
+        """
+        with self._lock:
+            entry = self._entry(method)
+            entry['messages'] += 1
+            entry['compressed'] += compressed
+            entry['raw_bytes'] += raw_bytes
+            entry['wire_bytes'] += wire_bytes
+            entry['compress_cpu'] += cpu
+
+    def record_decompress(self, method, cpu):
+        # type: (str, float) -> None
+        """
+        Record a received compressed message.
+        """
+        with self._lock:
+            entry = self._entry(method)
+            entry['decompressed'] += 1
+            entry['decompress_cpu'] += cpu
+
+    def snapshot(self):
+        # type: () -> Dict[str, Dict[str, Any]]
+        """
+        :return: Per method: messages sent through compression and how many got compressed, payload bytes before and
+            after, their ratio, CPU seconds spent compressing, and received messages decompressed and the CPU seconds
+            that took.
+        """
+        with self._lock:
+            ret = {}
+            for method, entry in self._methods.items():
+                ret[method] = dict(entry)
+                ret[method]['ratio'] = entry['raw_bytes'] / entry['wire_bytes'] if entry['wire_bytes'] else 1.0
+            return ret
+
+
+class Compression(object):
+    """
+    Compression settings of a connection.  Frames of an encoded message that are at least threshold bytes are
+    compressed, if that actually makes them smaller.  When any frame was compressed, the encoding frame is extended
+    with the compressor's ID and a flag byte per frame, so messages that skipped compression are sent exactly as
+    before.
+    """
+
+    def __init__(self, compressor=None, threshold=COMPRESSION_THRESHOLD, stats=None):
+        # type: (Optional[Compressor], int, Optional[CompressionStats]) -> None
+        """
+        :param compressor: The compressor to use, or None to send everything uncompressed.
+        :param threshold: Frames smaller than this many bytes aren't compressed.
+        :param stats: Where to record what compression achieved.
+        """
+        self.compressor = compressor
+        self.threshold = threshold
+        self.stats = stats
+
+    def compress(self, tag, frames, method):
+        # type: (bytes, List[Any], str) -> List[Any]
+        """
+        Compress the frames of an encoded message.
+        :param tag: The codec's encoding frame.
+        :param frames: The codec's frames.
+        :param method: The RPC method the message belongs to, for the stats.
+        :return: The encoding frame followed by the frames to send.
+        """
+        compressor = self.compressor
+        if compressor is None:
+            return [tag] + frames
+
+        start = time.thread_time()
+        flags = bytearray(len(frames))
+        raw_bytes = wire_bytes = 0
+        out = [tag]
+        for index, frame in enumerate(frames):
+            size = memoryview(frame).nbytes
+            raw_bytes += size
+            if size >= self.threshold:
+                packed = compressor.compress(frame)
+                if len(packed) < size:
+                    frame = packed
+                    size = len(packed)
+                    flags[index] = 1
+            wire_bytes += size
+            out.append(frame)
+        compressed = any(flags)
+        if compressed:
+            out[0] = tag + bytes([compressor.id]) + bytes(flags)
+        if self.stats is not None:
+            self.stats.record_compress(method, compressed, raw_bytes, wire_bytes, time.thread_time() - start)
+        return out
+
+
+def decompress_frames(tag, frames, stats=None, method=None):
+    # type: (bytes, Sequence[Any], Optional[CompressionStats], Optional[str]) -> Sequence[Any]
+    """
+    Reverse of Compression.compress(), works out from the encoding frame whether and how the frames were compressed.
+    :param tag: The received encoding frame.
+    :param frames: The received frames following it.
+    :return: The frames as the codec produced them.
+    """
+    if len(tag) <= 1:
+        return frames
+    try:
+        compressor = _compressors_by_id[tag[1]]
+    except KeyError:
+        raise ValueError("Unknown compressor ID {}".format(tag[1]))
+    start = time.thread_time()
+    flags = tag[2:]
+    frames = [compressor.decompress(frame) if index < len(flags) and flags[index] else frame
+              for index, frame in enumerate(frames)]
+    if stats is not None:
+        stats.record_decompress(method, time.thread_time() - start)
+    return frames
+
+
+register_compressor(ZlibCompressor())
+register_compressor(LzmaCompressor())
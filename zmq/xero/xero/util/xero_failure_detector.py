@@ -0,0 +1,185 @@
+import logging
+import math
+from abc import ABCMeta, abstractmethod
+from collections import deque
+from time import monotonic
+
+from xero.xero_constants import HB_INTERVAL, HB_LIVENESS, PHI_ACCEPTABLE_PAUSE, PHI_MAX_SAMPLES, PHI_MIN_STD_DEV, \
+    PHI_THRESHOLD
+
+try:
+    from typing import Optional
+except ImportError:
+    Optional = None
+
+logger = logging.getLogger(__name__)
+
+
+class FailureDetector(object):
+    """
+    Tells whether the peer at the other end of a connection is still there, from when its messages arrive.  Each
+    connection has a detector of its own.  Heartbeats are the messages the peer sends at a steady pace, any other
+    message only shows the peer is there.  Subclasses work out how suspicious the silence since the last message is.
+    """
+
+    __metaclass__ = ABCMeta
+
+    def __init__(self, threshold):
+        # type: (float) -> None
+        """
+        :param threshold: Suspicion level from which the peer counts as failed.
+        """
+        self.threshold = threshold
+        self._last_heartbeat = None  # type: Optional[float]
+        self._last_message = 0.0
+        self.reset()
+
+    def reset(self, now=None):
+        # type: (Optional[float]) -> None
+        """
+        Start over on a new connection, counting the silence from now.
+        """
+        self._last_heartbeat = None
+        self._last_message = monotonic() if now is None else now
+
+    def heartbeat(self, now=None):
+        # type: (Optional[float]) -> None
+        """
+        Record the arrival of a heartbeat.
+        """
+        now = monotonic() if now is None else now
+        if self._last_heartbeat is not None:
+            self.on_interval(now - self._last_heartbeat)
+        self._last_heartbeat = now
+        self._last_message = now
+
+    def touch(self, now=None):
+        # type: (Optional[float]) -> None
+        """
+        Record the arrival of any other message.
+        """
+        self._last_message = monotonic() if now is None else now
+
+    def on_interval(self, interval):
+        # type: (float) -> None
+        """
+        Called with the time between each two heartbeats, designed to be overridden by detectors that learn from them.
+        """
+        pass
+
+    def silence(self, now=None):
+        # type: (Optional[float]) -> float
+        """
+        Returns the seconds since the last message arrived.
+        """
+        return (monotonic() if now is None else now) - self._last_message
+
+    @abstractmethod
+    def suspicion(self, now=None):
+        # type: (Optional[float]) -> float
+        """
+        Returns how strongly the peer is suspected to have failed, 0 when it's just been heard from.
+        """
+        pass
+
+    def is_available(self, now=None):
+        # type: (Optional[float]) -> bool
+        """
+        Returns whether the peer's suspicion level is below the threshold.
+        """
+        return self.suspicion(now) < self.threshold
+
+
+class LivenessFailureDetector(FailureDetector):
+    """
+    Counts the heartbeat intervals gone by without a message, and gives up on the peer after a fixed number of them.
+    """
+
+    def __init__(self, threshold=HB_LIVENESS, interval=HB_INTERVAL / 1000.0):
+        # type: (float, float) -> None
+        """
+        :param threshold: Heartbeat intervals without a message after which the peer counts as failed.
+        :param interval: Seconds between heartbeats.
+        """
+        self._interval = interval
+        super(LivenessFailureDetector, self).__init__(threshold)
+
+    def suspicion(self, now=None):
+        # type: (Optional[float]) -> float
+        return self.silence(now) / self._interval
+
+
+class PhiAccrualFailureDetector(FailureDetector):
+    """
+    Phi accrual failure detector, after Hayashibara et al.  Learns the mean and deviation of the time between heartbeats,
+    and expresses the suspicion as phi = -log10 of the probability that a heartbeat still arrives after this much
+    silence.  A phi of 8 means a one in 10^8 chance of being wrong about the peer having failed.  So it gives up
+    quickly on a steady link, and allows for more on a jittery one.
+    """
+
+    def __init__(self, threshold=PHI_THRESHOLD, max_samples=PHI_MAX_SAMPLES, min_std_dev=PHI_MIN_STD_DEV,
+                 acceptable_pause=PHI_ACCEPTABLE_PAUSE, first_heartbeat_estimate=HB_INTERVAL / 1000.0):
+        # type: (float, int, float, float, float) -> None
+        """
+        :param threshold: Phi from which the peer counts as failed.
+        :param max_samples: How many of the latest heartbeat intervals the mean and deviation are taken over.
+        :param min_std_dev: Least deviation assumed, in seconds, so a very steady link doesn't make any late heartbeat
+            look like a failure.
+        :param acceptable_pause: Seconds of silence allowed on top of the mean interval, e.g. for GC pauses or a
+            handler holding up the peer's event loop.
+        :param first_heartbeat_estimate: Seconds between heartbeats assumed until some were observed.
+        """
+        self._max_samples = max_samples
+        self._min_std_dev = min_std_dev
+        self._acceptable_pause = acceptable_pause
+        self._first_heartbeat_estimate = first_heartbeat_estimate
+        self._intervals = deque()  # type: deque[float]
+        self._sum = 0.0
+        self._squared_sum = 0.0
+        super(PhiAccrualFailureDetector, self).__init__(threshold)
+
+    def reset(self, now=None):
+        # type: (Optional[float]) -> None
+        super(PhiAccrualFailureDetector, self).reset(now)
+        self._intervals.clear()
+        self._sum = 0.0
+        self._squared_sum = 0.0
+        # Seed the history with the estimate, give or take a quarter of it.
+        std_dev = self._first_heartbeat_estimate / 4.0
+        self.on_interval(self._first_heartbeat_estimate - std_dev)
+        self.on_interval(self._first_heartbeat_estimate + std_dev)
+
+    def on_interval(self, interval):
+        # type: (float) -> None
+        if len(self._intervals) >= self._max_samples:
+            dropped = self._intervals.popleft()
+            self._sum -= dropped
+            self._squared_sum -= dropped * dropped
+        self._intervals.append(interval)
+        self._sum += interval
+        self._squared_sum += interval * interval
+
+    def suspicion(self, now=None):
+        # type: (Optional[float]) -> float
+        count = len(self._intervals)
+        mean = self._sum / count
+        std_dev = max(math.sqrt(max(self._squared_sum / count - mean * mean, 0.0)), self._min_std_dev)
+        return phi(self.silence(now), mean + self._acceptable_pause, std_dev)
+
+
+def phi(elapsed, mean, std_dev):
+    # type: (float, float, float) -> float
+    """
+    -log10 of the probability that a normally distributed interval exceeds elapsed, using the logistic approximation
+    of the normal distribution's CDF.
+    """
+    y = (elapsed - mean) / std_dev
+    exponent = -y * (1.5976 + 0.070566 * y * y)
+    if exponent > 700.0:
+        # Far sooner than the mean, exp() would overflow.
+        return 0.0
+    e = math.exp(exponent)
+    if elapsed > mean:
+        # Past the point of any chance left, exp() underflowed.
+        return -math.log10(e / (1.0 + e)) if e > 0.0 else float('inf')
+    return -math.log10(1.0 - 1.0 / (1.0 + e))
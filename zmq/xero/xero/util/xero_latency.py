@@ -0,0 +1,161 @@
+import logging
+import math
+from threading import Lock
+
+from xero.xero_constants import LATENCY_RESOLUTION, LATENCY_WINDOW
+
+try:
+    from typing import Any, Dict, Optional
+except ImportError:
+    Any = None
+    Optional = None
+
+logger = logging.getLogger(__name__)
+
+#: Shortest duration told apart, in seconds, anything shorter falls in the first bucket.
+LATENCY_MIN = 1e-6
+
+
+class RttEstimator(object):
+    """
+    Smoothed round trip time and its variation, kept the way TCP keeps them (RFC 6298).
+    """
+
+    def __init__(self):
+        # type: () -> None
+        self.srtt = None  # type: Optional[float]
+        self.rttvar = None  # type: Optional[float]
+        self.samples = 0
+
+    def sample(self, rtt):
+        # type: (float) -> None
+        """
+        Update the estimate with a measured round trip time, in seconds.
+        """
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2.0
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.samples += 1
+
+    def rto(self):
+        # type: () -> float
+        """
+        Returns the smoothed round trip time plus four times its variation, which a reply should arrive within on
+        top of its service time, 0 until a round trip was measured.
+        """
+        if self.srtt is None:
+            return 0.0
+        return self.srtt + 4.0 * self.rttvar
+
+
+class LatencyHistogram(object):
+    """
+    Histogram of durations in logarithmic buckets, resolution buckets per doubling, so percentiles are off by at most
+    2^(1/resolution).  Once window durations were recorded every count is halved, so the histogram follows changes in
+    the durations rather than averaging over all of them.  Not thread safe.
+    """
+
+    def __init__(self, window=LATENCY_WINDOW, resolution=LATENCY_RESOLUTION):
+        # type: (int, int) -> None
+        """
+        :param window: Recorded durations after which the counts are halved.
+        :param resolution: Buckets per doubling of the duration.
+        """
+        self._window = window
+        self._resolution = resolution
+        self._counts = {}  # type: Dict[int, float]
+        self._count = 0.0
+        self._max = 0.0
+        # Durations recorded overall, left alone by decay.
+        self.total = 0
+
+    def record(self, seconds):
+        # type: (float) -> None
+        index = self._bucket(seconds)
+        self._counts[index] = self._counts.get(index, 0.0) + 1.0
+        self._count += 1.0
+        self._max = max(self._max, seconds)
+        self.total += 1
+        if self._count >= self._window:
+            for index in self._counts:
+                self._counts[index] /= 2.0
+            self._count /= 2.0
+
+    def percentile(self, q):
+        # type: (float) -> Optional[float]
+        """
+        Returns the duration that fraction q of the recorded ones didn't exceed, None if none were recorded.
+        """
+        if not self._counts:
+            return None
+        target = q * self._count
+        seen = 0.0
+        for index in sorted(self._counts):
+            seen += self._counts[index]
+            if seen >= target:
+                return min(self._upper_bound(index), self._max)
+        return self._max
+
+    def _bucket(self, seconds):
+        # type: (float) -> int
+        if seconds <= LATENCY_MIN:
+            return 0
+        return int(math.ceil(math.log2(seconds / LATENCY_MIN) * self._resolution))
+
+    def _upper_bound(self, index):
+        # type: (int) -> float
+        return LATENCY_MIN * 2.0 ** (float(index) / self._resolution)
+
+
+class LatencyStats(object):
+    """
+    Per-method latency histograms.  Thread safe.
+    """
+
+    def __init__(self, window=LATENCY_WINDOW):
+        # type: (int) -> None
+        """
+        :param window: Recorded durations after which a method's histogram halves its counts, see LatencyHistogram.
+        """
+        self._lock = Lock()
+        self._window = window
+        self._methods = {}  # type: Dict[str, LatencyHistogram]
+
+    def record(self, method, seconds):
+        # type: (str, float) -> None
+        """
+        Record how long a call to method took.
+        """
+        with self._lock:
+            histogram = self._methods.get(method)
+            if histogram is None:
+                histogram = self._methods[method] = LatencyHistogram(self._window)
+            histogram.record(seconds)
+
+    def percentile(self, method, q, min_samples=1):
+        # type: (str, float, int) -> Optional[float]
+        """
+        Returns the duration that fraction q of the calls to method didn't exceed, None if fewer than min_samples
+        calls were recorded.
+        """
+        with self._lock:
+            histogram = self._methods.get(method)
+            if histogram is None or histogram.total < min_samples:
+                return None
+            return histogram.percentile(q)
+
+    def snapshot(self):
+        # type: () -> Dict[str, Dict[str, Any]]
+        """
+        :return: Per method: calls recorded, and the median, 90th and 99th percentile of their durations in seconds.
+        """
+        with self._lock:
+            return {method: {
+                'calls': histogram.total,
+                'p50': histogram.percentile(0.5),
+                'p90': histogram.percentile(0.9),
+                'p99': histogram.percentile(0.99),
+            } for method, histogram in self._methods.items()}
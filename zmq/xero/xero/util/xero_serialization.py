@@ -1,13 +1,36 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+import builtins
+import dataclasses
 import logging
+import struct
+import threading
+import msgpack
+from xero.xero_constants import ZERO_COPY_THRESHOLD
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 logger = logging.getLogger(__name__)
 
 try:
-    from typing import Any, Dict
+    from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Type
 except ImportError:
     Any = None
 
+# ExtType codes used by the built-in encoders.  Codes below EXT_USER_MIN are reserved for xero.
+EXT_DATETIME = 1
+EXT_TIMEDELTA = 2
+EXT_EXCEPTION = 3
+EXT_BUFFER = 4
+EXT_NDARRAY = 5
+EXT_USER_MIN = 16
+
+_DATETIME = struct.Struct('!HBBBBBI')
+_DATETIME_TZ = struct.Struct('!HBBBBBIi')
+_TIMEDELTA = struct.Struct('!iiI')
+
 
 class XeroSerializer(object):
     """
@@ -76,3 +99,330 @@ class XeroSerializer(object):
             return exception
         else:
             raise RuntimeError("XeroSerializer doesn't know how to decode {}".format(d))
+
+
+class OutOfBand(object):
+    """
+    Wrap a bytes-like object to send it as its own zero-copy ZMQ frame instead of inside the MessagePack body.  It is
+    received as a read-only memoryview over the frame.  The wrapped buffer must not be modified until it was sent.
+    """
+
+    __slots__ = ('buffer',)
+
+    def __init__(self, buffer):
+        # type: (Any) -> None
+        self.buffer = buffer
+
+
+class XeroTypeRegistry(object):
+    """
+    Encodes application-level objects as compact MessagePack ExtTypes.  Every registered class gets an ExtType code and a
+    pair of functions turning an instance into bytes and back.  Encoding dispatches on the object's type, decoding on
+    the ExtType code, so plain maps and lists are left alone entirely.
+
+    datetime, timedelta and exceptions are registered out of the box.  Dataclasses, NamedTuples and __slots__ classes
+    can be registered with just a code; anything else needs its own encode/decode functions.
+
+    pack_frames()/unpack_frames() additionally move large binary payloads out of the MessagePack body into frames of
+    their own: NumPy arrays of at least ZERO_COPY_THRESHOLD bytes, buffer-protocol objects MessagePack can't handle
+    itself (array.array, mmap, PickleBuffer...) and anything wrapped in OutOfBand.  The body then only carries a small
+    descriptor, the frames are sent with copy=False and rebuilt on the receiving side as views over the received frame,
+    without copying.  Received arrays are therefore read-only.
+    """
+
+    def __init__(self, legacy_maps=True):
+        # type: (bool) -> None
+        """
+        :param legacy_maps: Also decode maps produced by XeroSerializer.encoder ('__type__' keys), so peers still on
+            the old encoding keep working.  Maps whose '__type__' isn't one the old encoder wrote are left alone.  This
+            puts an object_hook on every decoded map; set default_registry's legacy_maps to False once no peer sends
+            them any more.
+        """
+        self.legacy_maps = legacy_maps
+        self._encoders = {}  # type: Dict[type, Tuple[int, Callable[[Any], bytes]]]
+        self._decoders = {}  # type: Dict[int, Callable[[bytes], Any]]
+        self._resolved = {}  # type: Dict[type, Callable[[Any], Any]]
+        # Out-of-band frames of the pack_frames()/unpack_frames() call running on this thread.
+        self._local = threading.local()
+
+        self.register(datetime, EXT_DATETIME, _encode_datetime, _decode_datetime)
+        self.register(timedelta, EXT_TIMEDELTA, _encode_timedelta, _decode_timedelta)
+        self.register(BaseException, EXT_EXCEPTION, self._encode_exception, self._decode_exception)
+        self.register(OutOfBand, EXT_BUFFER, self._encode_buffer, self._decode_buffer)
+        if numpy is not None:
+            self.register(numpy.ndarray, EXT_NDARRAY, self._encode_ndarray, self._decode_ndarray)
+
+    def register(self, cls, code, encode=None, decode=None):
+        # type: (Type, int, Optional[Callable[[Any], bytes]], Optional[Callable[[bytes], Any]]) -> None
+        """
+        Register a class to be sent as an ExtType.  Subclasses are encoded with their base's encoder unless they are
+        registered themselves.
+        :param cls: The class to register.
+        :param code: ExtType code, 0-127.  Applications should use EXT_USER_MIN and above.
+        :param encode: Turns an instance into bytes.  Optional for dataclasses, NamedTuples and __slots__ classes.
+        :param decode: Turns bytes back into an instance.  Optional for dataclasses, NamedTuples and __slots__ classes.
+        """
+        if not 0 <= code <= 127:
+            raise ValueError("ExtType code must be within 0-127, got {}".format(code))
+        if code in self._decoders and self._encoders.get(cls, (None,))[0] != code:
+            raise ValueError("ExtType code {} is already registered".format(code))
+        if encode is None or decode is None:
+            field_names = _field_names(cls)
+            encode = encode or (lambda obj: self.packb([getattr(obj, name) for name in field_names]))
+            decode = decode or (lambda data: _build_from_fields(cls, field_names, self.unpackb(data)))
+        self._encoders[cls] = (code, encode)
+        self._decoders[code] = decode
+        self._resolved.clear()
+
+    def encoder(self, obj):
+        # type: (Any) -> Any
+        """
+        A MessagePack 'default' hook turning registered objects into ExtTypes.  Packing is done with strict_types, so
+        subclasses of the types MessagePack handles natively (NamedTuples, dict subclasses...) come through here too:
+        registered ones become ExtTypes, the rest are packed as their plain base type.  Plain tuples become lists.
+        """
+        cls = type(obj)
+        try:
+            convert = self._resolved[cls]
+        except KeyError:
+            convert = self._resolve(cls)
+            self._resolved[cls] = convert
+        return convert(obj)
+
+    def _resolve(self, cls):
+        # type: (Type) -> Callable[[Any], Any]
+        """
+        Work out how instances of cls get encoded.
+        """
+        for klass in cls.__mro__:
+            if klass in self._encoders:
+                code, encode = self._encoders[klass]
+                return lambda obj: msgpack.ExtType(code, encode(obj))
+        if issubclass(cls, (tuple, list)):
+            return list
+        for native in (dict, str, bytes, bytearray, int, float):
+            if issubclass(cls, native):
+                return native
+        if numpy is not None and issubclass(cls, numpy.generic):
+            return lambda obj: obj.item()
+
+        def buffer_or_unknown(obj):
+            try:
+                memoryview(obj)
+            except TypeError:
+                raise TypeError("XeroTypeRegistry doesn't know how to encode object type {}".format(cls))
+            return msgpack.ExtType(EXT_BUFFER, self._encode_buffer(OutOfBand(obj)))
+        return buffer_or_unknown
+
+    def ext_hook(self, code, data):
+        # type: (int, bytes) -> Any
+        """
+        A MessagePack 'ext_hook' turning ExtTypes back into objects.
+        """
+        try:
+            decode = self._decoders[code]
+        except KeyError:
+            logger.warning("XeroTypeRegistry doesn't know how to decode ExtType code {}".format(code))
+            return msgpack.ExtType(code, data)
+        return decode(data)
+
+    def packb(self, obj):
+        # type: (Any) -> bytes
+        # Packers are reused, each thread keeps its own.  Encoders of registered types call packb() again while the
+        # outer object is being packed, a nested call finds the pool empty and gets a Packer of its own.
+        packers = getattr(self._local, 'packers', None)
+        if packers is None:
+            packers = self._local.packers = []
+        packer = packers.pop() if packers else msgpack.Packer(default=self.encoder, use_bin_type=True,
+                                                              strict_types=True)
+        try:
+            return packer.pack(obj)
+        finally:
+            packers.append(packer)
+
+    def unpackb(self, data):
+        # type: (bytes) -> Any
+        if self.legacy_maps:
+            return msgpack.unpackb(data, ext_hook=self.ext_hook, object_hook=_decode_legacy_map, raw=False)
+        return msgpack.unpackb(data, ext_hook=self.ext_hook, raw=False)
+
+    def pack_frames(self, *objs):
+        # type: (Any) -> List[Any]
+        """
+        Pack each object into a MessagePack frame, followed by the out-of-band frames they refer to.
+        :return: List of len(objs) packed bodies, followed by buffers to be sent with copy=False.
+        """
+        outer_buffers = getattr(self._local, 'buffers', None)
+        self._local.buffers = buffers = []
+        try:
+            frames = [self.packb(obj) for obj in objs]
+        finally:
+            self._local.buffers = outer_buffers
+        frames.extend(buffers)
+        return frames
+
+    def unpack_frames(self, frames, count=1):
+        # type: (Sequence[Any], int) -> List[Any]
+        """
+        Reverse of pack_frames().
+        :param frames: The packed bodies followed by their out-of-band frames.
+        :param count: How many of the frames are packed bodies.
+        :return: List of count unpacked objects.
+        """
+        outer_frames = getattr(self._local, 'frames', None)
+        self._local.frames = frames[count:]
+        try:
+            return [self.unpackb(frame) for frame in frames[:count]]
+        finally:
+            self._local.frames = outer_frames
+
+    def _add_buffer(self, buffer):
+        # type: (memoryview) -> Any
+        """
+        Send buffer out-of-band if pack_frames() is running, otherwise inline.
+        :return: The frame index of the buffer, or the bytes to put inline.
+        """
+        buffers = getattr(self._local, 'buffers', None)
+        if buffers is None:
+            return buffer.tobytes()
+        buffers.append(buffer)
+        return len(buffers) - 1
+
+    def _get_buffer(self, ref):
+        # type: (Any) -> Any
+        """
+        Resolve what _add_buffer() returned into the received buffer.
+        """
+        if isinstance(ref, int):
+            return memoryview(self._local.frames[ref])
+        return ref
+
+    def _encode_buffer(self, obj):
+        # type: (OutOfBand) -> bytes
+        buffer = memoryview(obj.buffer)
+        if not buffer.contiguous:
+            buffer = memoryview(buffer.tobytes())
+        return self.packb(self._add_buffer(buffer.cast('B')))
+
+    def _decode_buffer(self, data):
+        # type: (bytes) -> memoryview
+        return memoryview(self._get_buffer(self.unpackb(data)))
+
+    def _encode_ndarray(self, obj):
+        # type: (numpy.ndarray) -> bytes
+        if obj.dtype.hasobject:
+            raise TypeError("Can't encode NumPy arrays of Python objects")
+        if obj.nbytes < ZERO_COPY_THRESHOLD:
+            return self.packb([obj.dtype.str, list(obj.shape), obj.tobytes()])
+        buffer = memoryview(numpy.ascontiguousarray(obj)).cast('B')
+        return self.packb([obj.dtype.str, list(obj.shape), self._add_buffer(buffer)])
+
+    def _decode_ndarray(self, data):
+        # type: (bytes) -> numpy.ndarray
+        dtype, shape, ref = self.unpackb(data)
+        return numpy.frombuffer(self._get_buffer(ref), dtype=numpy.dtype(dtype)).reshape(shape)
+
+    def _encode_exception(self, obj):
+        # type: (BaseException) -> bytes
+        try:
+            return self.packb([type(obj).__name__, list(obj.args)])
+        except TypeError:
+            # Arguments that can't be encoded themselves.
+            return self.packb([type(obj).__name__, [format(obj)]])
+
+    def _decode_exception(self, data):
+        # type: (bytes) -> BaseException
+        class_name, args = self.unpackb(data)
+        # Rebuild built-in exceptions as themselves, anything else becomes a plain Exception.
+        cls = getattr(builtins, class_name, None)
+        if isinstance(cls, type) and issubclass(cls, BaseException):
+            try:
+                return cls(*args)
+            except TypeError:
+                pass
+        return Exception(*args)
+
+
+def _encode_datetime(obj):
+    # type: (datetime) -> bytes
+    fields = (obj.year, obj.month, obj.day, obj.hour, obj.minute, obj.second, obj.microsecond)
+    offset = obj.utcoffset()
+    if offset is None:
+        return _DATETIME.pack(*fields)
+    return _DATETIME_TZ.pack(*(fields + (int(offset.total_seconds()),)))
+
+
+def _decode_datetime(data):
+    # type: (bytes) -> datetime
+    if len(data) == _DATETIME.size:
+        return datetime(*_DATETIME.unpack(data))
+    fields = _DATETIME_TZ.unpack(data)
+    return datetime(*fields[:7], tzinfo=timezone(timedelta(seconds=fields[7])))
+
+
+def _encode_timedelta(obj):
+    # type: (timedelta) -> bytes
+    return _TIMEDELTA.pack(obj.days, obj.seconds, obj.microseconds)
+
+
+def _decode_timedelta(data):
+    # type: (bytes) -> timedelta
+    days, seconds, microseconds = _TIMEDELTA.unpack(data)
+    return timedelta(days=days, seconds=seconds, microseconds=microseconds)
+
+
+def _field_names(cls):
+    # type: (Type) -> Tuple[str, ...]
+    """
+    Work out which attributes make up an instance of a dataclass, NamedTuple or __slots__ class.
+    """
+    if dataclasses.is_dataclass(cls):
+        return tuple(field.name for field in dataclasses.fields(cls))
+    if issubclass(cls, tuple) and hasattr(cls, '_fields'):
+        return tuple(cls._fields)
+    slots = []
+    for klass in reversed(cls.__mro__):
+        klass_slots = klass.__dict__.get('__slots__', ())
+        slots.extend([klass_slots] if isinstance(klass_slots, str) else klass_slots)
+    if slots:
+        return tuple(slot for slot in slots if slot not in ('__dict__', '__weakref__'))
+    raise TypeError("Can't work out the fields of {}, register it with encode/decode functions".format(cls))
+
+
+def _build_from_fields(cls, field_names, values):
+    # type: (Type, Tuple[str, ...], list) -> Any
+    if dataclasses.is_dataclass(cls) or issubclass(cls, tuple):
+        return cls(*values)
+    # __slots__ classes may not take their fields as constructor arguments.
+    obj = cls.__new__(cls)
+    for name, value in zip(field_names, values):
+        setattr(obj, name, value)
+    return obj
+
+
+def unwrap_frames(frames):
+    # type: (List[Any]) -> List[Any]
+    """
+    Turn the zmq.Frames of a copy=False receive into bytes, except frames of at least ZERO_COPY_THRESHOLD bytes, which
+    become read-only memoryviews over the received data instead of being copied.
+    """
+    return [frame.buffer if len(frame) >= ZERO_COPY_THRESHOLD else frame.bytes for frame in frames]
+
+
+#: '__type__' values of the maps XeroSerializer.encoder writes.
+LEGACY_MAP_TYPES = frozenset(('datetime', 'timedelta', 'exception'))
+
+
+def _decode_legacy_map(d):
+    # type: (Dict) -> Any
+    """
+    object_hook decoding the maps XeroSerializer.encoder writes, and leaving any other map alone.
+    """
+    if d.get('__type__') in LEGACY_MAP_TYPES:
+        return XeroSerializer.decoder(d)
+    return d
+
+
+#: Registry used by UniClient and UniWorker.  Register application classes on it before connecting.  It decodes the
+#: old '__type__' maps too, see XeroTypeRegistry.
+default_registry = XeroTypeRegistry()
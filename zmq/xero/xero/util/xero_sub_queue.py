@@ -0,0 +1,127 @@
+import logging
+from collections import deque
+from queue import Empty, Full
+from threading import Condition, Lock
+
+try:
+    from typing import Any, Dict, List, Optional
+except ImportError:
+    Any = None
+
+logger = logging.getLogger(__name__)
+
+#: What SubscriberQueue.put() does when the queue is full.
+OVERFLOW_BLOCK = 'block'
+OVERFLOW_DROP_OLDEST = 'drop-oldest'
+OVERFLOW_DROP_NEWEST = 'drop-newest'
+
+
+class SubscriberQueue(object):
+    """
+    Bounded ring buffer between the IOLoop receiving emits and the application taking them.  Unlike queue.Queue, which
+    takes its lock once per item, drain() hands over everything waiting under a single lock acquisition, and doesn't
+    wait any longer once it has something to return.  Thread safe.
+    """
+
+    def __init__(self, capacity=None, overflow=OVERFLOW_BLOCK):
+        # type: (Optional[int], str) -> None
+        """
+        :param capacity: Most items held, None for no limit.
+        :param overflow: What put() does when the queue is full: OVERFLOW_BLOCK waits for room, OVERFLOW_DROP_OLDEST
+            makes room by dropping the oldest item, OVERFLOW_DROP_NEWEST drops the item being put.
+        """
+        if overflow not in (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST):
+            raise ValueError("Unknown overflow policy '{}'".format(overflow))
+        if capacity is not None and capacity < 1:
+            raise ValueError("Capacity must be at least 1, got {}".format(capacity))
+        self._capacity = capacity
+        self._overflow = overflow
+        self._items = deque()  # type: deque[Any]
+        self._lock = Lock()
+        self._not_empty = Condition(self._lock)
+        self._not_full = Condition(self._lock)
+        self._dropped = 0
+        self._full_events = 0
+        self._high_water = 0
+
+    def put(self, item, timeout=None):
+        # type: (Any, Optional[float]) -> Optional[Any]
+        """
+        Add an item, dealing with a full queue as the overflow policy says.
+        :param timeout: Most seconds OVERFLOW_BLOCK waits for room, None to wait as long as it takes.
+        :return: The item dropped to stay within capacity, if any.
+        :raises queue.Full: OVERFLOW_BLOCK ran out of time.
+        """
+        dropped = None
+        with self._lock:
+            if self._capacity is not None and len(self._items) >= self._capacity:
+                self._full_events += 1
+                if self._overflow == OVERFLOW_DROP_NEWEST:
+                    self._dropped += 1
+                    return item
+                if self._overflow == OVERFLOW_DROP_OLDEST:
+                    self._dropped += 1
+                    dropped = self._items.popleft()
+                elif not self._not_full.wait_for(lambda: len(self._items) < self._capacity, timeout):
+                    raise Full()
+            self._items.append(item)
+            if len(self._items) > self._high_water:
+                self._high_water = len(self._items)
+            self._not_empty.notify()
+        return dropped
+
+    def get(self, timeout=None):
+        # type: (Optional[float]) -> Any
+        """
+        Take the oldest item, waiting up to timeout seconds for one.
+        :raises queue.Empty: Nothing came in time.
+        """
+        items = self.drain(1, timeout)
+        if not items:
+            raise Empty()
+        return items[0]
+
+    def drain(self, max_items=None, timeout=None):
+        # type: (Optional[int], Optional[float]) -> List[Any]
+        """
+        Take everything waiting, up to max_items, oldest first.  Waits up to timeout seconds for a first item when
+        the queue is empty, and returns as soon as there is one.
+        :param max_items: Most items to take, None for all of them.
+        :param timeout: Most seconds to wait, 0 not to wait, None to wait as long as it takes.
+        :return: The items taken, empty if none came in time.
+        """
+        with self._lock:
+            if not self._items and timeout != 0:
+                self._not_empty.wait_for(lambda: self._items, timeout)
+            if max_items is None or max_items >= len(self._items):
+                items = list(self._items)
+                self._items.clear()
+            else:
+                popleft = self._items.popleft
+                items = [popleft() for _ in range(max_items)]
+            if items:
+                self._not_full.notify_all()
+            return items
+
+    def qsize(self):
+        # type: () -> int
+        return len(self._items)
+
+    def empty(self):
+        # type: () -> bool
+        return not self._items
+
+    def stats(self):
+        # type: () -> Dict[str, Any]
+        """
+        :return: Capacity, items waiting now, the most ever waiting at once, how often put() found the queue full and
+            how many items were dropped because of it.
+        """
+        with self._lock:
+            return {
+                'capacity': self._capacity,
+                'size': len(self._items),
+                'high_water': self._high_water,
+                'full_events': self._full_events,
+                'dropped': self._dropped,
+            }
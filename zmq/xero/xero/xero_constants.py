@@ -6,7 +6,30 @@ HB_INTERVAL = 1000  #: in milliseconds
 INITIAL_CONNECTION_TIME_SECS = 3.2  # Want this to be longer than HB_INTERVAL
 
 HB_LIVENESS = 3    #: HBs to miss before connection counts as dead
+PHI_THRESHOLD = 8.0  #: Phi from which the phi accrual failure detector counts a peer as failed
+PHI_MAX_SAMPLES = 100  #: Heartbeat intervals the phi accrual failure detector learns from
+PHI_MIN_STD_DEV = 0.1  #: Least deviation of the heartbeat interval the phi accrual failure detector assumes, in seconds
+PHI_ACCEPTABLE_PAUSE = 0.5  #: Seconds of silence the phi accrual failure detector allows on top of the mean interval
 RPC_TIMEOUT = 5.0
+RPC_TIMEOUT_AUTO = 'auto'  #: rpc() timeout derived from the method's observed service times and the RTT to the workers
+AUTO_TIMEOUT_PERCENTILE = 0.99  #: Percentile of a method's service times an automatic timeout is based on
+AUTO_TIMEOUT_FACTOR = 2.0  #: Headroom an automatic timeout allows on top of that percentile
+AUTO_TIMEOUT_MIN = 0.05  #: Shortest automatic timeout, in seconds
+AUTO_TIMEOUT_MIN_SAMPLES = 20  #: Calls of a method observed before its timeout is derived from them, until then RPC_TIMEOUT
+LATENCY_WINDOW = 1000  #: Calls after which a method's service time histogram halves its counts, to follow changes
+LATENCY_RESOLUTION = 8  #: Service time histogram buckets per doubling of the duration, about 9% apart
+MAX_IN_FLIGHT = 4  #: Outstanding requests a client will pipeline to a single worker
+ZERO_COPY_THRESHOLD = 65536  #: Bytes from which payloads travel as their own zero-copy frames, same as zmq.COPY_THRESHOLD
+COMPRESSION_THRESHOLD = 16384  #: Bytes from which frames get compressed, on connections with compression enabled
+EMIT_BATCH_DELAY = 0.001  #: Seconds an emit may wait for others to be coalesced with, when emit batching is on
+EMIT_BUFFER_SIZE = 10000  #: Emits a worker holds back while it has no emit credit, when flow control is on
+EMIT_HWM = 1000  #: High water mark of the emit data plane's sockets, same as ZeroMQ's default
+RESULT_CACHE_BYTES = 16 * 1024 * 1024  #: Most bytes of memoized replies a worker holds
+RESPONSE_CACHE_BYTES = 16 * 1024 * 1024  #: Most bytes of cached replies a client holds
+DEDUP_TABLE_BYTES = 16 * 1024 * 1024  #: Default size of a worker's table of final replies kept for retried requests
+DEDUP_IN_PROGRESS_TTL = 60.0  #: Seconds after which a worker with a dedup table gives up on a request it didn't answer
+RETRY_BACKOFF = 0.1  #: Seconds a client backs off before its first retry of a request, doubling with each retry
+RETRY_BACKOFF_MAX = 2.0  #: Most seconds a client backs off before retrying a request
 
 # These values can by handy for development/troubleshooting:
 #HB_LIVENESS = 3000    #: HBs to miss before connection counts as dead
@@ -28,6 +51,14 @@ WORKER_DISCONNECT = b'\x07'  # Worker -> Broker
 WORKER_MULTICAST_ADD = b'\x08'  # Worker -> Broker
 WORKER_EXCEPTION = b'\x09'  # Worker -> Broker
 WORKER_ERROR = b'\x0a'  # Worker -> Broker
+WORKER_BATCH_REQUEST = b'\x0b'  # Broker -> Worker
+WORKER_BATCH_REPLY = b'\x0c'  # Worker -> Broker
+WORKER_EMIT_BATCH = b'\x0d'  # Worker -> Broker
+WORKER_CREDIT = b'\x0e'  # Broker -> Worker
+WORKER_SUBSCRIBE = b'\x0f'  # Broker -> Worker
+WORKER_REQUEST_ID = b'\x10'  # Broker -> Worker
+
+EMIT_INVALIDATE_CACHE = b'\x01'  #: Marks a WORKER_EMIT that invalidates cached replies rather than carrying an emit
 
 CLIENT_PARTIAL_REPLY = b'\x02'  # Broker -> Client
 CLIENT_FINAL_REPLY = b'\x03'  # Broker -> Client